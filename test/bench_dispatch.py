@@ -0,0 +1,45 @@
+#coding=utf8
+"""
+Request dispatch throughput benchmark, it'll run the same number of requests
+with different number of threads, and print requests per second
+
+    python bench_dispatch.py [requests] [max_threads]
+"""
+import os
+import sys
+import time
+import threading
+from uliweb.manage import make_simple_application
+
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_multidb'))
+
+def run(app, url, total, threads):
+    n = total // threads
+
+    def worker():
+        for i in range(n):
+            app.open(url)
+
+    ts = [threading.Thread(target=worker) for i in range(threads)]
+    b = time.time()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return n * threads / (time.time() - b)
+
+def main(total=10000, max_threads=16):
+    make_simple_application(project_dir='.')
+    from uliweb import application as app
+
+    url = '/test_web'
+    #warm up
+    run(app, url, 100, 1)
+    threads = 1
+    print '%8s %12s' % ('threads', 'requests/s')
+    while threads <= max_threads:
+        print '%8d %12.1f' % (threads, run(app, url, total, threads))
+        threads *= 2
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,48 @@
+#coding=utf8
+"""
+Model loading benchmark, it loads rows via the common `Model._load_values()`
+way and the compiled row loader of `Model.get_row_loader()`, and prints
+rows per second of each
+
+    python bench_orm_load.py [rows]
+"""
+import sys
+import time
+import datetime
+from uliweb.orm import get_connection, Model, Field, CHAR, do_
+
+def main(total=100000):
+    db = get_connection('sqlite://')
+    db.metadata.drop_all()
+
+    class User(Model):
+        username = Field(CHAR, max_length=20)
+        nickname = Field(unicode, max_length=40)
+        year = Field(int)
+        score = Field(float)
+        birth = Field(datetime.date)
+        active = Field(bool)
+
+    User.table.create()
+
+    do_(User.table.insert(), args=[[dict(username='user%d' % i,
+        nickname=u'nick%d' % i, year=i, score=i*1.5,
+        birth=datetime.date(2000, 1, 1), active=i%2==0) for i in range(total)]])
+
+    rows = do_(User.table.select()).fetchall()
+    keys = rows[0].keys()
+
+    print '%-10s %12s' % ('loader', 'rows/s')
+    b = time.time()
+    for row in rows:
+        User._load_values(zip(keys, row))
+    print '%-10s %12.1f' % ('common', total / (time.time() - b))
+
+    b = time.time()
+    loader = User.get_row_loader(keys)
+    for row in rows:
+        loader(row)
+    print '%-10s %12.1f' % ('compiled', total / (time.time() - b))
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,62 @@
+#coding=utf8
+"""
+Template render throughput benchmark, it renders a typical page which
+extends a layout and includes a sub template, and prints renders per second
+
+    python bench_template.py [renders]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+from uliweb.core.template import Loader
+
+layout = """<html>
+<head><title>{{block title}}{{end}}</title></head>
+<body>
+{{include "menu.html"}}
+{{block content}}{{end}}
+</body>
+</html>
+"""
+
+menu = """<ul>
+{{for name, url in menus:}}<li><a href="{{=url}}">{{=name}}</a></li>
+{{pass}}</ul>
+"""
+
+index = """{{extend "layout.html"}}
+{{block title}}{{=title}}{{end}}
+{{block content}}
+<table>
+{{for row in rows:}}<tr><td>{{=row['id']}}</td><td>{{=row['name']}}</td></tr>
+{{pass}}</table>
+{{end}}
+"""
+
+def main(total=20000):
+    path = tempfile.mkdtemp()
+    try:
+        for name, text in [('layout.html', layout), ('menu.html', menu),
+                           ('index.html', index)]:
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(text)
+        loader = Loader([path])
+        vars = {'title':'Benchmark',
+            'menus':[('Menu%d' % i, '/menu/%d' % i) for i in range(5)],
+            'rows':[{'id':i, 'name':'name%d' % i} for i in range(20)]}
+        env = {'request':None, 'response':None}
+
+        #warm up
+        loader.load('index.html').generate(vars, env)
+        b = time.time()
+        for i in range(total):
+            loader.load('index.html').generate(vars, env)
+        t = time.time() - b
+        print '%d renders, %.2fs, %.1f renders/s' % (total, t, total / t)
+    finally:
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
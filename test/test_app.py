@@ -21,3 +21,169 @@ def test_is_in_web():
     True
     """
     
+
+def test_dispatch_plan():
+    """
+    >>> app = make_simple_application(project_dir='.')
+    >>> plan = app.get_dispatch_plan('blog.views.test_web')
+    >>> print plan.appname, plan.function, plan.view_class, plan.template
+    blog test_web None test_web.html
+    >>> plan is app.get_dispatch_plan('blog.views.test_web')
+    True
+    >>> plan = app.get_dispatch_plan('blog.views.TestViewClass.index')
+    >>> print plan.view_class_name, plan.template, plan.hooks
+    TestViewClass TestViewClass/index.html (None, None, 'blog.views.TestViewClass.__begin__', None)
+    >>> from uliweb.utils.test import client
+    >>> c = client('.')
+    >>> r = c.get('/test_view_class/index')
+    >>> print r.data
+    begin
+    """
+
+def test_middleware_singleton():
+    """
+    >>> from uliweb import Middleware
+    >>> class A(Middleware):
+    ...     ORDER = 10
+    ...     def process_request(self, request):pass
+    ...     def process_response(self, request, response):return response
+    >>> class B(Middleware):
+    ...     ORDER = 20
+    ...     STATEFUL = True
+    ...     def process_request(self, request):pass
+    >>> app = make_simple_application(project_dir='.')
+    >>> req, res, ex = app._compile_middlewares([A, B], singleton=True)
+    >>> req[0][1].im_self is res[0][1].im_self
+    True
+    >>> print req[1], ex
+    (<class 'test_app.B'>, None) []
+    >>> req, res, ex = app._compile_middlewares([A, B])
+    >>> print [x[1] for x in req + res]
+    [None, None, None]
+    """
+
+def test_concurrent_requests():
+    """
+    >>> import threading
+    >>> app = make_simple_application(project_dir='.')
+    >>> errors = []
+    >>> def worker(n):
+    ...     for i in range(50):
+    ...         id = '%d_%d' % (n, i)
+    ...         r = app.open('/test_local?id=%s' % id)
+    ...         if r.data != ':'.join([id]*3):
+    ...             errors.append((id, r.data))
+    >>> threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+    >>> for t in threads:
+    ...     t.start()
+    >>> for t in threads:
+    ...     t.join()
+    >>> print errors
+    []
+    """
+
+def test_stream_template():
+    """
+    >>> app = make_simple_application(project_dir='.')
+    >>> r = app.open('/test_stream')
+    >>> r.is_streamed
+    True
+    >>> list(r.response)
+    ['<h1>stream</h1>', '<ul><li>0</li><li>1</li><li>2</li></ul>']
+    >>> r = app.open('/test_stream_orm')
+    >>> r.response.next()
+    '<h1>stream</h1>'
+    >>> session = engine_manager['default'].session(create=False)
+    >>> session._conn is None
+    True
+    >>> r.response.next()
+    '<p>0</p>'
+    >>> session._conn is None
+    False
+    >>> r.close()
+    >>> session._conn is None
+    True
+    >>> r = app.open('/test_stream_error')
+    Traceback (most recent call last):
+    ...
+    ZeroDivisionError: integer division or modulo by zero
+    """
+
+def test_view_env():
+    """
+    >>> import threading
+    >>> app = make_simple_application(project_dir='.')
+    >>> from uliweb import request
+    >>> from uliweb.core import dispatch
+    >>> from uliweb.core.SimpleFrame import local
+    >>> env = app.get_view_env()
+    >>> env is app.get_view_env()
+    False
+    >>> env['request'] = None; env.title = 'title'
+    >>> env['request'], env.title, app.view_env['request'] is request, 'title' in app.view_env
+    (None, 'title', True, False)
+    >>> del env['request']; del env.title
+    >>> 'request' in env, env.title, 'request' in app.view_env
+    (False, None, True)
+    >>> len(env) == len(app.view_env) - 1
+    True
+    >>> def prepare_view_env(sender, env):
+    ...     env['req_id'] = request.GET.get('id')
+    >>> r = dispatch.bind('prepare_view_env')(prepare_view_env)
+    >>> errors = []
+    >>> def worker(n):
+    ...     for i in range(50):
+    ...         id = '%d_%d' % (n, i)
+    ...         r = app.open('/test_env_value?id=%s' % id)
+    ...         if r.data != ':'.join([id]*3):
+    ...             errors.append((id, r.data))
+    >>> threads = [threading.Thread(target=worker, args=(n,)) for n in range(10)]
+    >>> for t in threads:
+    ...     t.start()
+    >>> for t in threads:
+    ...     t.join()
+    >>> print errors, local.view_env
+    [] None
+    >>> dispatch.unbind('prepare_view_env', prepare_view_env)
+    >>> errors = []
+    >>> def worker(n):
+    ...     for i in range(50):
+    ...         id = '%d_%d' % (n, i)
+    ...         r = app.open('/test_global_request?id=%s' % id)
+    ...         if r.data != ':'.join([id]*3):
+    ...             errors.append((id, r.data))
+    >>> threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+    >>> for t in threads:
+    ...     t.start()
+    >>> for t in threads:
+    ...     t.join()
+    >>> print errors
+    []
+    """
+
+def test_sql_monitor_param():
+    """
+    >>> import json
+    >>> from werkzeug.test import EnvironBuilder
+    >>> from uliweb.orm import get_sql_profiler
+    >>> from uliweb.contrib.orm.middle_sqlmonitor import SQLMonitorMiddle
+    >>> app = make_simple_application(project_dir='.')
+    >>> from uliweb import Request, Response, settings
+    >>> m = SQLMonitorMiddle(app, settings)
+    >>> settings.ORM.add('SQL_MONITOR_OUTPUT', ['header', 'json'], replace=True)
+    >>> request = Request(EnvironBuilder('/?sqlmonitor=json').get_environ())
+    >>> m.process_request(request)
+    >>> get_sql_profiler() is not None
+    True
+    >>> response = m.process_response(request, Response('ok'))
+    >>> sorted(json.loads(response.data))
+    [u'count', u'duplicates', u'n_plus_one', u'statements', u'time']
+    >>> r = settings.set_var('GLOBAL/DEBUG', False)
+    >>> m.process_request(request)
+    >>> get_sql_profiler() is None
+    True
+    >>> response = m.process_response(request, Response('ok'))
+    >>> response.data, 'X-SQL-Profile' in response.headers
+    ('ok', False)
+    >>> r = settings.set_var('GLOBAL/DEBUG', True)
+    """
@@ -0,0 +1,62 @@
+from uliweb.core import dispatch
+
+def test_order():
+    """
+    >>> dispatch.reset()
+    >>> def a(sender):print 'a'
+    >>> def b(sender):print 'b'
+    >>> def c(sender):print 'c'
+    >>> def d(sender):print 'd'
+    >>> f = dispatch.bind('test', kind=dispatch.LOW)(a)
+    >>> f = dispatch.bind('test')(b)
+    >>> f = dispatch.bind('test', kind=dispatch.HIGH)(c)
+    >>> f = dispatch.bind('test')(d)
+    >>> dispatch.call(None, 'test')
+    c
+    b
+    d
+    a
+    >>> dispatch.unbind('test', b)
+    >>> dispatch.call(None, 'test')
+    c
+    d
+    a
+    >>> dispatch.call(None, 'not_existed')
+    """
+
+def test_signal():
+    """
+    >>> dispatch.reset()
+    >>> def a(sender, signal):print 'a', signal
+    >>> def b(sender, **kwargs):print 'b', kwargs
+    >>> def c(sender):print 'c'
+    >>> f = dispatch.bind('test', signal='x')(a)
+    >>> f = dispatch.bind('test', signal=('x', 'y'))(b)
+    >>> f = dispatch.bind('test')(c)
+    >>> dispatch.call(None, 'test', signal='x')
+    a x
+    b {}
+    c
+    >>> dispatch.call(None, 'test', signal='y')
+    b {}
+    c
+    >>> dispatch.call(None, 'test')
+    c
+    """
+
+def test_get():
+    """
+    >>> dispatch.reset()
+    >>> def a(sender, name):return None
+    >>> def b(sender, name, signal):return name + signal
+    >>> def c(sender, name):return 'c'
+    >>> f = dispatch.bind('test')(a)
+    >>> f = dispatch.bind('test', signal='x')(b)
+    >>> f = dispatch.bind('test', kind=dispatch.LOW)(c)
+    >>> print dispatch.get(None, 'test', name='name', signal='x')
+    namex
+    >>> print dispatch.get(None, 'test', name='name')
+    c
+    >>> print dispatch.get(None, 'not_existed', name='name')
+    None
+    """
@@ -55,6 +55,72 @@ def test_1():
     1
     """
 
+def test_cursor():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Test(Model):
+    ...     username = Field(unicode)
+    ...     year = Field(int, default=30)
+    >>> Test.bulk_create([Test(username='u%d' % i, year=i%2) for i in range(5)])
+    5
+    >>> request = Request()
+    >>> request.values = {'rows':2}
+    >>> uliweb.request = request
+    >>> def page(cursor):
+    ...     request.values['cursor'] = cursor
+    ...     view = ListView(Test, cursor=True, order_by=['-year', 'id'])
+    ...     ids = [r['_obj_'].id for r in view.objects()]
+    ...     return ids, view.total, view.next_cursor
+    >>> ids, total, cursor = page('')
+    >>> ids, total
+    ([2, 4], 5)
+    >>> ids, total, cursor = page(cursor)
+    >>> ids, total
+    ([1, 3], 5)
+    >>> page(cursor)
+    ([5], 5, '')
+    >>> del request.values['cursor']
+    >>> view = ListView(Test, cursor=True, total_mode='estimate')
+    >>> [x.id for x in view.query()], view.total
+    ([1, 2], 5)
+    """
+
+def test_cursor_datetime():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Test(Model):
+    ...     username = Field(unicode)
+    ...     created = Field(datetime.datetime)
+    >>> d = datetime.datetime(2016, 1, 1, 10, 0, 0)
+    >>> Test.bulk_create([Test(username='u%d' % i, created=d + datetime.timedelta(microseconds=i//2*10))
+    ...     for i in range(7)])
+    7
+    >>> request = Request()
+    >>> request.values = {'rows':2}
+    >>> uliweb.request = request
+    >>> def page(cursor):
+    ...     request.values['cursor'] = cursor
+    ...     view = ListView(Test, cursor=True, order_by=['-created', 'id'])
+    ...     ids = [r['_obj_'].id for r in view.objects()]
+    ...     return ids, view.next_cursor
+    >>> ids, cursor = page('')
+    >>> ids
+    [7, 5]
+    >>> view = ListView(Test, cursor=True)
+    >>> view.decode_cursor(cursor)
+    [u'2016-01-01 10:00:00.000020', 5]
+    >>> ids, cursor = page(cursor)
+    >>> ids
+    [6, 3]
+    >>> ids, cursor = page(cursor)
+    >>> ids
+    [4, 1]
+    >>> page(cursor)
+    ([2], '')
+    """
+
 def test_multi_view_basic():
     """
     >>> db = get_connection('sqlite://')
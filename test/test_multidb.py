@@ -270,3 +270,61 @@ def test_set_session():
     True
     """
 
+def test_parallel_dump_load():
+    """
+    >>> import shutil, tempfile
+    >>> from sqlalchemy import MetaData, Table, Column, Integer
+    >>> from uliweb.contrib.orm import commands
+    >>> from uliweb.contrib.orm.commands import run_parallel, _dump_table_task, _load_table_task
+    >>> app = make_simple_application(project_dir='.')
+    >>> Blog = get_model('blog')
+    >>> r = Blog.all().remove()
+    >>> Blog.bulk_create([Blog(title=str(i), content=str(i)) for i in range(5)])
+    5
+    >>> path = tempfile.mkdtemp()
+    >>> manage.call('uliweb -y dump --parallel 2 -o %s' % path)
+    >>> os.listdir(os.path.join(path, 'default'))
+    ['blog.txt']
+    >>> r = Blog.all().remove()
+    >>> manage.call('uliweb -y load --parallel 2 -d %s' % path)
+    >>> [x.title for x in Blog.all()]
+    [u'0', u'1', u'2', u'3', u'4']
+
+    sqlite is loaded serially, so skip the check to test parallel loading
+    >>> use_parallel = commands.use_parallel
+    >>> commands.use_parallel = lambda options, engine, write=False: options.parallel > 1
+    >>> pool = engine_manager['default'].engine.pool
+    >>> r = Blog.all().remove()
+    >>> manage.call('uliweb -y load --parallel 2 -d %s' % path)
+    >>> [x.title for x in Blog.all()], engine_manager['default'].engine.pool is pool
+    ([u'0', u'1', u'2', u'3', u'4'], False)
+    >>> filename = os.path.join(path, 'default', 'blog.txt')
+    >>> shutil.copy(filename, os.path.join(path, 'blog.txt'))
+    >>> f = open(filename, 'w'); f.write('bad\\n1\\n'); f.close()
+    >>> manage.call('uliweb -y load --parallel 2 -d %s' % path)
+    Traceback (most recent call last):
+    ...
+    SystemExit: 1
+    >>> commands.use_parallel = use_parallel
+    >>> kwargs = {'engine_name':'default', 'delete':True}
+    >>> levels = [[(_load_table_task, ('blog', Blog.table), dict(kwargs, filename=filename))],
+    ...     [(_load_table_task, ('blog_copy', Blog.table), dict(kwargs, filename=os.path.join(path, 'blog.txt')))]]
+    >>> r = Blog.all().remove()
+    >>> run_parallel(levels, 2, 'default', 'Loading')
+    [default] Loading failed tables: blog, 1 tables are skipped
+    ['blog']
+    >>> Blog.count()
+    0
+    >>> os.remove(os.path.join(path, 'blog.txt'))
+    >>> missing = Table('missing', MetaData(), Column('id', Integer))
+    >>> levels = [[(_dump_table_task, ('missing', missing),
+    ...     {'filename':os.path.join(path, 'missing.txt'), 'engine_name':'default'})],
+    ...     [(_dump_table_task, ('blog', Blog.table),
+    ...     {'filename':os.path.join(path, 'blog.txt'), 'engine_name':'default'})]]
+    >>> run_parallel(levels, 2, 'default')
+    [default] Processing failed tables: missing, 1 tables are skipped
+    ['missing']
+    >>> os.path.exists(os.path.join(path, 'blog.txt'))
+    False
+    >>> shutil.rmtree(path)
+    """
@@ -40,3 +40,52 @@ def test_manual_rollback():
     b.save()
     Rollback()
     return 'ok'
+
+@expose('/test_view_class')
+class TestViewClass(object):
+    def __begin__(self):
+        self.message = 'begin'
+
+    def index(self):
+        return self.message
+
+@expose('/test_local')
+def test_local():
+    import time
+    from uliweb import request, response
+
+    id = request.GET.get('id')
+    response.id = id
+    time.sleep(0.001)
+    return '%s:%s:%s' % (id, request.GET.get('id'), response.id)
+
+@expose('/test_global_request')
+def test_global_request():
+    import time
+
+    id = request.GET.get('id')
+    time.sleep(0.001)
+    return '%s:%s:%s' % (id, request.GET.get('id'), env.request.GET.get('id'))
+
+@expose('/test_env_value')
+def test_env_value():
+    env['x'] = request.GET.get('id')
+    return '%s:%s:%s' % (req_id, env.req_id, env.x)
+
+@expose('/test_stream')
+def test_stream():
+    response.stream_template = True
+    response.template = 'test_stream.html'
+    return {'n':3, 'title':'stream'}
+
+@expose('/test_stream_orm')
+def test_stream_orm():
+    response.stream_template = True
+    response.template = 'test_stream_orm.html'
+    return {'Blog':functions.get_model('blog'), 'title':'stream'}
+
+@expose('/test_stream_error')
+def test_stream_error():
+    response.stream_template = True
+    response.template = 'test_stream_error.html'
+    return {}
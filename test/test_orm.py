@@ -2955,6 +2955,720 @@ def test_bulk():
     >>> print b.sqles['select_2']['fields']
     [u'nick_name']
     """
+
+def test_prefetch_and_join_load():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    >>> class Category(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class Article(Model):
+    ...     title = Field(CHAR, max_length=20)
+    ...     user = Reference(User)
+    ...     category = Reference(Category, nullable=True)
+    >>> u1 = User(username='u1'); u1.save()
+    True
+    >>> u2 = User(username='u2'); u2.save()
+    True
+    >>> c1 = Category(name='c1'); c1.save()
+    True
+    >>> for i in range(4):
+    ...     a = Article(title='a%d' % i, user=[u1, u2][i % 2], category=c1 if i < 2 else None)
+    ...     _ = a.save()
+    >>> queries = []
+    >>> def log(ec, query, conn, usetime):
+    ...     queries.append(query)
+    >>> uliweb.orm.__default_post_do__ = log
+    >>> [(a.title, a.user.username, a.category and a.category.name) for a in Article.all().prefetch('user', 'category')]
+    [(u'a0', u'u1', u'c1'), (u'a1', u'u2', u'c1'), (u'a2', u'u1', None), (u'a3', u'u2', None)]
+    >>> len(queries)
+    3
+    >>> queries = []
+    >>> [(a.title, a.user.username, a.category and a.category.name) for a in Article.filter(Article.c.title!='a0').join_load('user', 'category')]
+    [(u'a1', u'u2', u'c1'), (u'a2', u'u1', None), (u'a3', u'u2', None)]
+    >>> len(queries)
+    1
+    >>> Article.all().join_load('user').fields('title').one().user.username
+    u'u1'
+    >>> Article.all().prefetch('title')
+    Traceback (most recent call last):
+    ...
+    Error: Field title of Model Article is not a ReferenceProperty
+    >>> uliweb.orm.__default_post_do__ = None
+    """
+
+def test_prefetch_many():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Tag(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class Article(Model):
+    ...     title = Field(CHAR, max_length=20)
+    ...     tags = ManyToMany(Tag, collection_name='articles')
+    >>> t1 = Tag(name='t1'); t1.save()
+    True
+    >>> t2 = Tag(name='t2'); t2.save()
+    True
+    >>> a1 = Article(title='a1', tags=[t1, t2]); a1.save()
+    True
+    >>> a2 = Article(title='a2', tags=[t2]); a2.save()
+    True
+    >>> a3 = Article(title='a3'); a3.save()
+    True
+    >>> queries = []
+    >>> def log(ec, query, conn, usetime):
+    ...     queries.append(query)
+    >>> uliweb.orm.__default_post_do__ = log
+    >>> articles = list(Article.all().prefetch_many('tags'))
+    >>> len(queries)
+    2
+    >>> [(a.title, a.tags.ids(cache=True)) for a in articles]
+    [(u'a1', [1, 2]), (u'a2', [2]), (u'a3', [])]
+    >>> [a.to_dict(manytomany=True)['tags'] for a in articles]
+    [[1, 2], [2], []]
+    >>> len(queries)
+    2
+    >>> tags = list(Tag.all().prefetch_many('articles'))
+    >>> [t.articles.ids(cache=True) for t in tags]
+    [[1], [1, 2]]
+    >>> len(queries)
+    4
+    >>> articles = list(Article.all().prefetch_many('tags', objects=True))
+    >>> len(queries)
+    7
+    >>> [[t.name for t in a.tags.all(cache=True)] for a in articles]
+    [[u't1', u't2'], [u't2'], []]
+    >>> len(queries)
+    7
+    >>> Article.all().prefetch_many('title')
+    Traceback (most recent call last):
+    ...
+    Error: Field title of Model Article is not a ManyToMany or reversed ManyToMany collection
+    >>> uliweb.orm.__default_post_do__ = None
+    """
+
+def test_row_loader():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Tag(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     nickname = Field(unicode, max_length=20)
+    ...     birth = Field(datetime.date)
+    ...     score = Field(float)
+    ...     tags = ManyToMany(Tag)
+    >>> u = User(username='limodou', nickname=u'lim', birth='2012-01-01', score=1.5)
+    >>> u.save()
+    True
+    >>> row = do_(User.table.select()).fetchone()
+    >>> keys = row.keys()
+    >>> loader = User.get_row_loader(keys)
+    >>> loader is User.get_row_loader(keys)
+    True
+    >>> a = loader(row)
+    >>> b = User._load_values(zip(keys, row))
+    >>> a
+    <User {'username':u'limodou','nickname':u'lim','birth':datetime.date(2012, 1, 1),'score':1.5,'id':1}>
+    >>> repr(a) == repr(b), a._old_values == b._old_values, a._saved
+    (True, True, True)
+    >>> a._old_values['birth'], a._old_values['nickname']
+    ('2012-01-01', 'lim')
+    >>> a = User.filter(User.c.id==1).fields('username').one()
+    >>> a.username, a._old_values['username'], a._old_values['nickname'] is Lazy
+    (u'limodou', 'limodou', True)
+    >>> a.nickname
+    u'lim'
+    >>> User.add_property('age', Field(int))
+    >>> User._row_loaders
+    {}
+    """
+
+def test_iterator():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     groups = ManyToMany(Group)
+    >>> g = Group(name='g'); g.save()
+    True
+    >>> for i in range(5):
+    ...     User(username='user%d' % i, groups=[g]).save()
+    True
+    True
+    True
+    True
+    True
+    >>> query = User.filter(User.c.id > 1)
+    >>> [u.username for u in query.iterator(2)]
+    [u'user1', u'user2', u'user3', u'user4']
+    >>> [u.username for u in query.iterator(2, stream=True)]
+    [u'user1', u'user2', u'user3', u'user4']
+    >>> list(User.filter(User.c.id < 3).values('username').iterator(stream=True))
+    [(u'user0',), (u'user1',)]
+    >>> [u.username for u in g.user_set.iterator(3)]
+    [u'user0', u'user1', u'user2', u'user3', u'user4']
+    >>> from StringIO import StringIO
+    >>> buf = StringIO()
+    >>> User.filter(User.c.id < 3).fields('username').save_file(buf, chunk_size=1, stream=True)
+    >>> print buf.getvalue().replace('\\r', '')
+    username,id
+    user0,1
+    user1,2
+    <BLANKLINE>
+    """
+
+def test_bulk_create_and_update():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     year = Field(int, default=30)
+    ...     created = Field(datetime.datetime, auto_now_add=True)
+    ...     updated = Field(datetime.datetime, auto_now=True, auto_now_add=True)
+    ...     groups = ManyToMany(Group)
+    >>> g = Group(name='g'); g.save()
+    True
+    >>> signals = []
+    >>> def pre_bulk_save(sender, objs, created, data, signal=None):
+    ...     signals.append(('pre', len(objs), created))
+    >>> def post_bulk_save(sender, objs, created, data, signal=None):
+    ...     signals.append(('post', len(objs), created))
+    >>> from uliweb.core import dispatch
+    >>> dispatch.bind('pre_bulk_save')(pre_bulk_save)
+    <function pre_bulk_save at ...>
+    >>> dispatch.bind('post_bulk_save')(post_bulk_save)
+    <function post_bulk_save at ...>
+    >>> queries = []
+    >>> def log(ec, query, conn, usetime):
+    ...     queries.append(query)
+    >>> uliweb.orm.__default_post_do__ = log
+    >>> users = [User(username='user%d' % i) for i in range(5)]
+    >>> User.bulk_create(users, batch_size=2)
+    5
+    >>> len(queries), signals[:2], len(signals)
+    (3, [('pre', 2, True), ('post', 2, True)], 6)
+    >>> [(u.id, u.is_saved()) for u in users]
+    [(None, False), (None, False), (None, False), (None, False), (5, True)]
+    >>> users[0].save()
+    Traceback (most recent call last):
+    ...
+    Error: Object <User ...> is created by bulk_create without primary key, it can't be saved again
+    >>> [(u.id, u.username, u.year, u.created is not None) for u in User.all()]
+    [(1, u'user0', 30, True), (2, u'user1', 30, True), (3, u'user2', 30, True), (4, u'user3', 30, True), (5, u'user4', 30, True)]
+    >>> u = User(username='user5', groups=[g])
+    >>> User.bulk_create([u], send_dispatch=False)
+    1
+    >>> u.id, u.is_saved(), list(u.groups.ids())
+    (6, True, [1])
+    >>> users = list(User.filter(User.c.id < 4))
+    >>> for u in users:
+    ...     u.year = u.id * 10
+    >>> users[0].username = 'admin'
+    >>> del queries[:]; del signals[:]
+    >>> User.bulk_update(users)
+    3
+    >>> len(queries), signals
+    (2, [('pre', 3, False), ('post', 3, False)])
+    >>> [(u.username, u.year, u.is_saved(), u._get_data().keys()) for u in users]
+    [(u'admin', 10, True, ['id']), (u'user1', 20, True, ['id']), (u'user2', 30, True, ['id'])]
+    >>> [(u.username, u.year) for u in User.filter(User.c.id < 4)]
+    [(u'admin', 10), (u'user1', 20), (u'user2', 30)]
+    >>> users[1].username = 'changed'
+    >>> User.bulk_update(users, fields=['year'], send_dispatch=False)
+    3
+    >>> [(u.username, u.year) for u in User.filter(User.c.id < 4)]
+    [(u'admin', 10), (u'user1', 20), (u'user2', 30)]
+    >>> User.bulk_update([User(username='new')])
+    Traceback (most recent call last):
+    ...
+    Error: Object <User ...> should be saved before bulk_update
+    >>> uliweb.orm.__default_post_do__ = None
+    >>> dispatch.unbind('pre_bulk_save', pre_bulk_save)
+    >>> dispatch.unbind('post_bulk_save', post_bulk_save)
+    """
+
+def test_statement_cache():
+    """
+    >>> from uliweb.orm import statement_cache
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     group = Reference(Group)
+    >>> g = Group(name='g'); g.save()
+    True
+    >>> for i in range(3):
+    ...     User(username='user%d' % i, group=g).save()
+    True
+    True
+    True
+    >>> statement_cache.clear()
+    >>> s = statement_cache.stats()
+    >>> [User.get(i).username for i in range(1, 4)]
+    [u'user0', u'user1', u'user2']
+    >>> User.get(User.c.username=='user1').id
+    2
+    >>> User.get(4) is None
+    True
+    >>> [u.group.name for u in User.all()]
+    [u'g', u'g', u'g']
+    >>> d = statement_cache.stats()
+    >>> d['hits']-s['hits'], d['misses']-s['misses'], d['size']
+    (5, 3, 3)
+    >>> User.get(1, fields=['username'])
+    <User {'username':u'user0','group':<ReferenceProperty:1>,'id':1}>
+    >>> set_echo(True, caller=False)
+    >>> u = User.get(2) # doctest:+ELLIPSIS
+    <BLANKLINE>
+    ===>>>>> [default]
+    SELECT user.username, user."group", user.id FROM user WHERE user.id = 2 LIMIT 1 OFFSET 0;
+    ===<<<<< time used ...
+    <BLANKLINE>
+    >>> set_echo(False)
+    >>> from uliweb.orm import begin_sql_monitor, close_sql_monitor
+    >>> monitor = begin_sql_monitor(record_details=True)
+    >>> User.get(1).username, User.get(2).group.name
+    (u'user0', u'g')
+    >>> monitor.total
+    3
+    >>> print monitor.details[0]
+    SELECT user.username, user."group", user.id FROM user WHERE user.id = '' LIMIT 1 OFFSET 0
+    >>> close_sql_monitor(monitor)
+    >>> User.add_property('year', Field(int))
+    >>> statement_cache.stats()['size']
+    0
+    """
+
+def test_identity_map():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     group = Reference(Group)
+    >>> g = Group(name='g'); g.save()
+    True
+    >>> for i in range(3):
+    ...     User(username='user%d' % i, group=g).save()
+    True
+    True
+    True
+    >>> User.get(1) is User.get(1)
+    False
+    >>> session = get_session()
+    >>> session.identity_map = True
+    >>> queries = []
+    >>> def log(ec, query, conn, usetime):
+    ...     queries.append(query)
+    >>> uliweb.orm.__default_post_do__ = log
+    >>> u = User.get(1)
+    >>> u is User.get(1), u is User.get('1'), u is User.get(User.c.id==1)
+    (True, True, True)
+    >>> User.get(1, fields=['username']) is u
+    False
+    >>> len(queries)
+    2
+    >>> [x.group for x in User.all()][0] is Group.get(1)
+    True
+    >>> len(queries)
+    4
+    >>> users = list(User.all().prefetch('group'))
+    >>> users[0].group is users[1].group is Group.get(1)
+    True
+    >>> len(queries)
+    5
+    >>> u.username = 'admin'
+    >>> u.save()
+    True
+    >>> x = User.get(1)
+    >>> x is u, x.username
+    (False, u'admin')
+    >>> User.filter(User.c.id==1).update(username='user0')
+    <sqlalchemy.engine.result.ResultProxy object at ...>
+    >>> User.get(1).username
+    u'user0'
+    >>> x = User.get(2)
+    >>> x.delete()
+    >>> User.get(2) is None
+    True
+    >>> x = User.get(3)
+    >>> session.commit()
+    >>> User.get(3) is x
+    False
+    >>> session.identities.keys()
+    [('user', '3')]
+    >>> session.rollback()
+    >>> session.identities
+    {}
+    >>> uliweb.orm.__default_post_do__ = None
+    >>> session.identity_map = None
+    """
+
+def test_changed_fields():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     year = Field(int)
+    ...     data = Field(JSON)
+    ...     extra = Field(JSON, mutable=False)
+    >>> User(username='limodou', year=10, data={'a':1}, extra={'b':1}).save()
+    True
+    >>> u = User.get(1)
+    >>> u.__dict__.get('_changed_fields'), u._get_data()
+    (None, {'id': 1})
+    >>> sorted([k for k, v in User._get_compared_properties()])
+    ['data']
+    >>> u.year = 10
+    >>> u._changed_fields, u._get_data()
+    (set(['year']), {'id': 1})
+    >>> u.username = 'admin'
+    >>> u.data['a'] = 2
+    >>> u.extra['b'] = 2
+    >>> sorted(u._get_data().items())
+    [('data', '{"a":2}'), ('id', 1), ('username', u'admin')]
+    >>> u.save()
+    True
+    >>> u.__dict__.get('_changed_fields'), u._get_data()
+    (None, {'id': 1})
+    >>> u._old_values['username'], u._old_values['data']
+    ('admin', '{"a":2}')
+    >>> u.extra = {'b':3}
+    >>> sorted(u._get_data().items())
+    [('extra', '{"b":3}'), ('id', 1)]
+    >>> u.save()
+    True
+    >>> x = User.get(1)
+    >>> x.username, x.year, x.data, x.extra
+    (u'admin', 10, {u'a': 2}, {u'b': 3})
+    """
+
+def test_rows():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     birth = Field(datetime.date)
+    ...     data = Field(JSON)
+    ...     groups = ManyToMany(Group)
+    >>> g = Group(name='g'); g.save()
+    True
+    >>> User(username='limodou', birth='2012-01-01', data={'a':1}, groups=[g]).save()
+    True
+    >>> User(username='python').save()
+    True
+    >>> rows = list(User.all().rows())
+    >>> rows[0]
+    <Record {'username':u'limodou','birth':datetime.date(2012, 1, 1),'data':{u'a': 1},'id':1}>
+    >>> r = rows[1]
+    >>> r.username, r['birth'], r[2], r.get('groups', []), r.keys()
+    (u'python', None, u'', [], ['username', 'birth', 'data', 'id'])
+    >>> u = User.get(2)
+    >>> (u.username, u.birth, u.data) == r[:3]
+    True
+    >>> isinstance(r, Record), r._model is User, hasattr(r, '__dict__')
+    (True, True, False)
+    >>> User.filter(User.c.id==1).rows('username', User.c.birth).one()
+    <Record {'username':u'limodou','birth':datetime.date(2012, 1, 1)}>
+    >>> type(rows[0]) is type(User.all().rows().one())
+    True
+    >>> list(g.user_set.rows('username'))
+    [<Record {'username':u'limodou'}>]
+    >>> list(User.get(1).groups.all().rows())
+    [<Record {'name':u'g','id':1}>]
+    >>> list(User.filter(User.c.id==2).rows('username').iterator())
+    [<Record {'username':u'python'}>]
+    >>> rows[0].to_dict()['data']
+    {u'a': 1}
+    """
+
+def test_after():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     year = Field(int)
+    >>> User.bulk_create([User(username='u%d' % i, year=2000+i%3) for i in range(7)])
+    7
+    >>> [x.id for x in User.all().after(None).limit(3)]
+    [1, 2, 3]
+    >>> [x.id for x in User.all().after(3).limit(3)]
+    [4, 5, 6]
+    >>> query = User.all().after(None, order_by=['-year', User.c.id]).limit(3)
+    >>> result = [(x.year, x.id) for x in query]
+    >>> result
+    [(2002, 3), (2002, 6), (2001, 2)]
+    >>> key = query.get_keyset(User.get(2))
+    >>> key
+    (2001, 2)
+    >>> [(x.year, x.id) for x in User.all().after(key, order_by=[User.c.year.desc(), 'id']).limit(3)]
+    [(2001, 5), (2000, 1), (2000, 4)]
+    >>> query = User.filter(User.c.year==2000).rows('username').after([1], order_by='id')
+    >>> [r.username for r in query]
+    [u'u3', u'u6']
+    >>> query.get_keyset(query.one())
+    Traceback (most recent call last):
+    ...
+    KeyError: 'id'
+    >>> User.all().estimate_count(), User.filter(User.c.year==2000).estimate_count()
+    (7, 3)
+    """
+
+def test_lazy_transaction():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Test(Model):
+    ...     username = Field(CHAR, max_length=20)
+    >>> session = Session(lazy_transaction=True)
+    >>> trans = session.begin()
+    >>> trans
+    <uliweb.orm.LazyTransaction object at ...>
+    >>> session._conn, session.in_transaction(), trans.is_active
+    (None, False, True)
+    >>> session.commit()
+    >>> session.rollback()
+    >>> session._conn
+    >>> trans = session.begin()
+    >>> r = session.do_(Test.table.insert().values(username='limodou'))
+    >>> session.in_transaction(), trans.is_active
+    (True, True)
+    >>> trans.rollback()
+    >>> session.in_transaction(), trans.is_active
+    (False, False)
+    >>> session.rollback()
+    >>> session._conn
+    >>> Test.count()
+    0
+    >>> trans = session.begin()
+    >>> trans.commit()
+    >>> session._pending_trans, session._conn
+    (False, None)
+    >>> session.begin(lazy=False) is not None
+    True
+    >>> session.in_transaction()
+    True
+    >>> session.commit()
+    """
+
+def test_replicas():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Test(Model):
+    ...     username = Field(CHAR, max_length=20)
+    >>> Test(username='primary').save()
+    True
+    >>> for name in ('replica1', 'replica2'):
+    ...     r = engine_manager.add(name, {'connection_string':'sqlite://', 'duplication':'default'})
+    ...     Test.table.create(bind=r.engine)
+    ...     x = r.engine.execute(Test.table.insert().values(username=name))
+    >>> engine_manager['default'].options['replicas'] = ['replica1', 'replica2']
+    >>> [x.username for x in Test.all()]
+    [u'replica1']
+    >>> Test.get(1).username
+    u'replica2'
+    >>> Test.filter(Test.c.username=='replica1').count()
+    1
+    >>> Test.all().for_update().one().username
+    u'primary'
+    >>> Test.get(1).username
+    u'primary'
+    >>> uliweb.orm.reset_read_routing()
+    >>> Test.get(1).username
+    u'replica2'
+    >>> Test(username='test').save()
+    True
+    >>> Test.count()
+    2
+    >>> uliweb.orm.reset_read_routing()
+    >>> Begin()
+    <sqlalchemy.engine.base.RootTransaction object at ...>
+    >>> Test.count()
+    2
+    >>> Commit()
+    >>> uliweb.orm.set_lazy_transaction(True)
+    >>> Begin()
+    <uliweb.orm.LazyTransaction object at ...>
+    >>> Test.get(1).username
+    u'primary'
+    >>> Rollback()
+    >>> Begin(implicit=True)
+    <uliweb.orm.LazyTransaction object at ...>
+    >>> Test.get(1).username
+    u'replica1'
+    >>> Begin()
+    <uliweb.orm.LazyTransaction object at ...>
+    >>> Test.get(1).username
+    u'primary'
+    >>> Commit()
+    >>> uliweb.orm.set_lazy_transaction(False)
+    >>> Test(username='test1').save()
+    True
+    >>> Test.all().count()
+    3
+    >>> Commit()
+    >>> Test.all().count()
+    1
+    >>> engine_manager['default'].options['replica_policy'] = uliweb.orm.LagAwarePolicy(
+    ...     lag_func=lambda engine: {'replica1':20, 'replica2':1}[engine.name])
+    >>> engine_manager['default']._replica_policy = None
+    >>> Test.get(1).username, Test.get(1).username
+    (u'replica2', u'replica2')
+    >>> uliweb.orm.is_read_query('select * from test'), uliweb.orm.is_read_query(Test.table.update())
+    (True, False)
+    >>> engine_manager['default'].options['replicas'] = []
+    """
+
+def test_sql_profiler():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     group = Reference(Group)
+    >>> Group.bulk_create([Group(name='g%d' % i) for i in range(3)])
+    3
+    >>> User.bulk_create([User(username='u%d' % i, group=i%3+1) for i in range(7)])
+    7
+    >>> import threading
+    >>> profiler = begin_sql_profiler(n_plus_one=3)
+    >>> get_sql_profiler() is profiler
+    True
+    >>> names = [u.group.name for u in User.all()]
+    >>> t = threading.Thread(target=lambda:do_('select 1')); t.start(); t.join()
+    >>> x = do_('select * from user where id = 1').fetchall()
+    >>> x = do_('select * from user where id = 2').fetchall()
+    >>> end_sql_profiler() is profiler, get_sql_profiler()
+    (True, None)
+    >>> User.count()
+    7
+    >>> profiler.summary()
+    'count=10 time=...s duplicates=4 n+1=1'
+    >>> report = profiler.report()
+    >>> report['count'], report['n_plus_one'], len(report['statements'])
+    (10, 1, 3)
+    >>> for st in sorted(report['statements'], key=lambda x:x['sql']):
+    ...     print st['sql'], st['count'], st['rows'], st['n_plus_one'], st['callers'][0].startswith('<doctest')
+    SELECT "group".name, "group".id FROM "group" WHERE "group".id = ? LIMIT ? OFFSET ? 7 7 True True
+    SELECT user.username, user."group", user.id FROM user 1 7 False True
+    select * from user where id = ? 2 2 False True
+    """
+
+def test_pool_metrics():
+    """
+    >>> from sqlalchemy.pool import QueuePool
+    >>> e = engine_manager.add('metrics', {'connection_string':'sqlite://', 'pool_metrics':True,
+    ...     'connection_args':{'poolclass':QueuePool, 'pool_size':2}})
+    >>> session = Session('metrics')
+    >>> x = session.do_('select 1').fetchall()
+    >>> session.close()
+    >>> s1, s2 = Session('metrics'), Session('metrics')
+    >>> x = s1.do_('select 1'), s2.do_('select 1')
+    >>> m = uliweb.orm.get_pool_metrics()['metrics']
+    >>> [m[k] for k in ('pool_size', 'checked_out', 'idle', 'overflow', 'connections_created', 'checkouts')]
+    [2, 2, 0, 0, 2, 3]
+    >>> m['checkout_wait_seconds']['count'], m['checkout_held_seconds']['count']
+    (3, 1)
+    >>> s1.close(); s2.close()
+    >>> uliweb.orm.get_pool_metrics()['metrics']['idle']
+    2
+    >>> text = uliweb.orm.get_metrics_exporter('prometheus').export(uliweb.orm.get_pool_metrics())
+    >>> print '\\n'.join(x for x in text.splitlines() if 'checked_out' in x or 'held_seconds_count' in x)
+    # HELP uliweb_db_pool_checked_out Connections checked out from pool
+    # TYPE uliweb_db_pool_checked_out gauge
+    uliweb_db_pool_checked_out{engine="metrics"} 0
+    uliweb_db_pool_checkout_held_seconds_count{engine="metrics"} 3
+    >>> 'uliweb_db_pool_checkout_wait_seconds_bucket{engine="metrics",le="+Inf"} 3' in text
+    True
+    >>> uliweb.orm.get_metrics_exporter('json').export({'a':{'idle':1}})
+    '{"a": {"idle": 1}}'
+    >>> uliweb.orm.get_pool_metrics()['metrics']['connection_lifetime_seconds']['count']
+    0
+    >>> s1, s2, s3 = Session('metrics'), Session('metrics'), Session('metrics')
+    >>> x = s1.do_('select 1'), s2.do_('select 1'), s3.do_('select 1')
+    >>> s1.close(); s2.close(); s3.close()
+    >>> m = uliweb.orm.get_pool_metrics()['metrics']
+    >>> m['idle'], m['connections_created'], m['connection_lifetime_seconds']['count']
+    (2, 3, 1)
+    >>> engine_manager['metrics'].engine.dispose()
+    >>> x = Session('metrics').do_('select 1').fetchall()
+    >>> m = uliweb.orm.get_pool_metrics()['metrics']
+    >>> m['pool_size'], m['idle'], m['connections_created'], m['connection_lifetime_seconds']['count']
+    (2, 1, 4, 3)
+    >>> import threading
+    >>> class Record(object):
+    ...     def __init__(self):
+    ...         self.info = {}
+    >>> metrics = uliweb.orm.PoolMetrics()
+    >>> def f():
+    ...     for i in range(1000):
+    ...         r = Record()
+    ...         metrics.on_checkout(None, r, None)
+    ...         metrics.on_checkin(None, r)
+    >>> threads = [threading.Thread(target=f) for i in range(4)]
+    >>> for t in threads: t.start()
+    >>> for t in threads: t.join()
+    >>> m = metrics.snapshot()
+    >>> m['checkouts'], m['checked_out'], m['checkout_held_seconds']['count']
+    (4000, 0, 4000)
+    """
+
+def test_table_levels():
+    """
+    >>> db = get_connection('sqlite://')
+    >>> db.metadata.drop_all()
+    >>> class Group(Model):
+    ...     name = Field(CHAR, max_length=20)
+    >>> class User(Model):
+    ...     username = Field(CHAR, max_length=20)
+    ...     group = Reference(Group)
+    ...     groups = ManyToMany(Group)
+    ...     parent = SelfReference()
+    >>> from sqlalchemy import MetaData, Table, Column, Integer, ForeignKey
+    >>> m = MetaData()
+    >>> t = Table('log', m, Column('id', Integer, primary_key=True), Column('node_id', Integer, ForeignKey('node.id')))
+    >>> t = Table('node', m, Column('id', Integer, primary_key=True), Column('other_id', Integer, ForeignKey('other.id')))
+    >>> t = Table('other', m, Column('id', Integer, primary_key=True), Column('node_id', Integer, ForeignKey('node.id')))
+    >>> from uliweb.contrib.orm.commands import get_tables_dependencies, get_table_levels
+    >>> tables = [(x, db.metadata.tables[x]) for x in ['user_group_groups', 'user', 'group']]
+    >>> tables += [(x, m.tables[x]) for x in ['log', 'node', 'other']]
+    >>> deps = get_tables_dependencies([t for x, t in tables])
+    >>> for k in sorted(deps):
+    ...     print k, sorted(deps[k])
+    group []
+    log ['node']
+    node ['other']
+    other ['node']
+    user ['group']
+    user_group_groups ['group', 'user']
+    >>> [[x for x, t in level] for level in get_table_levels(tables)]
+    [['group', 'other'], ['user', 'node'], ['user_group_groups', 'log']]
+    >>> [[x for x, t in level] for level in get_table_levels(tables[:1])]
+    [['user_group_groups']]
+    """
 if __name__ == '__main__':
     from uliweb import orm
     # db = get_connection('sqlite://')
@@ -488,7 +488,15 @@ def test_lru():
     >>> u[f2] = 'f2'
     >>> u[f3] = 'f3'
     >>> print (u.keys()) # doctest:+ELLIPSIS
-    ['.../b/parent.html', '.../b/layout.html']
+    ['.../b/parent.html', '.../b/index.html']
+    >>> u.get(f2)
+    'f2'
+    >>> u.get(f1)
+    >>> u[f1] = 'f1'
+    >>> print (u.keys()) # doctest:+ELLIPSIS
+    ['.../b/layout.html', '.../b/index.html']
+    >>> sorted(u.stats().items())
+    [('evictions', 2), ('hits', 1), ('max_size', 2), ('misses', 1), ('size', 2)]
     """
 
 def test_depends():
@@ -597,6 +605,121 @@ def test_load_cache_without_expiration_check():
     <h1>Test1</h1>ccc
     """
 
+def test_load_disk_cache():
+    """
+    >>> import tempfile, shutil
+    >>> tmp_dir = tempfile.mkdtemp()
+    >>> dir = os.path.join(path, 'templates', 'a')
+    >>> f1 = open(os.path.join(dir, "a.html"), 'w')
+    >>> f1.write('<h1>{{block title}}a{{end}}</h1>{{include "c.html"}}')
+    >>> f1.close()
+    >>> f2 = open(os.path.join(dir, "b.html"), 'w')
+    >>> f2.write('{{extend "a.html"}}{{block title}}Test1{{end}}')
+    >>> f2.close()
+    >>> f3 = open(os.path.join(dir, "c.html"), 'w')
+    >>> f3.write('ccc')
+    >>> f3.close()
+    >>> loader = Loader([dir], use_tmp=True, tmp_dir=tmp_dir)
+    >>> print (loader.load('b.html').generate())
+    <h1>Test1</h1>ccc
+    >>> len([x for x in os.listdir(tmp_dir) if x.startswith('b.html.')])
+    1
+    >>> loader = Loader([dir], use_tmp=True, tmp_dir=tmp_dir)
+    >>> def _create_template(*args, **kwargs):
+    ...     raise Exception('should be loaded from disk cache')
+    >>> old_create_template, loader._create_template = loader._create_template, _create_template
+    >>> t = loader.load('b.html')
+    >>> print (t.generate())
+    <h1>Test1</h1>ccc
+    >>> sorted(t.depends.keys()) == sorted([os.path.join(dir, 'a.html'), os.path.join(dir, 'c.html')])
+    True
+    >>> time.sleep(1)
+    >>> f3 = open(os.path.join(dir, "c.html"), 'w')
+    >>> f3.write('ddd')
+    >>> f3.close()
+    >>> loader = Loader([dir], use_tmp=True, tmp_dir=tmp_dir)
+    >>> print (loader.load('b.html').generate())
+    <h1>Test1</h1>ddd
+    >>> shutil.rmtree(tmp_dir)
+    """
+
+def test_generate_reuse():
+    """
+    >>> import linecache
+    >>> t = Template("{{=a}}{{if defined('b'):}}{{=b}}{{pass}}")
+    >>> print (t.generate({'a':'1', 'b':'2'}))
+    12
+    >>> print (t.generate({'a':'3'}))
+    3
+    >>> print (t.generate({'a':'4'}, env={'a':'0', 'b':'5'}))
+    45
+    >>> linecache.cache['test_generate_reuse'] = (1, None, ['line'], 'test_generate_reuse')
+    >>> print (t.generate({'a':'1'}))
+    1
+    >>> 'test_generate_reuse' in linecache.cache
+    True
+    >>> del linecache.cache['test_generate_reuse']
+    """
+
+def test_index_mode():
+    """
+    >>> dirs = [os.path.join(path, 'templates', x) for x in ['b', 'a']]
+    >>> loader = Loader(dirs, index_mode='static')
+    >>> print (loader.resolve_path('layout.html')) # doctest:+ELLIPSIS
+    /.../b/layout.html
+    >>> f = loader.resolve_path('layout.html')
+    >>> print (loader.resolve_path('layout.html', skip=f, skip_original='layout.html')) # doctest:+ELLIPSIS
+    /.../a/layout.html
+    >>> print (loader.resolve_path('not_existed.html', default_template=['use.html']))  # doctest:+ELLIPSIS
+    /.../a/use.html
+    >>> print (loader.load('parent.html').depends.keys()) # doctest:+ELLIPSIS
+    ['.../a/new_tag.html', '.../a/layout.html', '.../b/layout.html']
+    >>> loader.check_modified_time
+    False
+    >>> import tempfile, shutil
+    >>> d = tempfile.mkdtemp()
+    >>> loader = Loader([d], index_mode='poll', poll_interval=0)
+    >>> print (loader.resolve_path('x.html'))
+    None
+    >>> time.sleep(1)
+    >>> f = open(os.path.join(d, 'x.html'), 'w')
+    >>> f.write('x')
+    >>> f.close()
+    >>> loader.resolve_path('x.html') == os.path.join(d, 'x.html')
+    True
+    >>> shutil.rmtree(d)
+    """
+
+def test_stream():
+    """
+    >>> dir = os.path.join(path, 'templates', 'a')
+    >>> loader = Loader([dir], multilines=True)
+    >>> f1 = open(os.path.join(dir, "a.html"), 'w')
+    >>> f1.write('<h1>{{block title}}a{{end}}</h1>{{if 1:}}{{include "c.html"}}{{pass}}{{include "c.html"}}')
+    >>> f1.close()
+    >>> f2 = open(os.path.join(dir, "b.html"), 'w')
+    >>> f2.write('{{extend "a.html"}}{{block title}}{{=title}}{{end}}')
+    >>> f2.close()
+    >>> f3 = open(os.path.join(dir, "c.html"), 'w')
+    >>> f3.write('ccc')
+    >>> f3.close()
+    >>> t = loader.load('b.html')
+    >>> list(t.stream({'title':'Test'}))
+    ['<h1>Test', '</h1>ccc', 'ccc']
+    >>> print (t.generate({'title':'Test'}))
+    <h1>Test</h1>cccccc
+    >>> t = Template('{{def f(n):}}{{for i in range(n):}}{{=i}}{{pass}}{{return ""}}{{pass}}'
+    ...     '<table>{{for i in range(120):}}<tr>{{=i}}</tr>{{pass}}</table>{{=f(3)}}', multilines=True)
+    >>> result = list(t.stream())
+    >>> [len(x) for x in result]
+    [360, 374, 375, 239]
+    >>> ''.join(result) == t.generate()
+    True
+    >>> t = loader.load('use.html')
+    >>> t.has_links, t._get_stream_execute()
+    (True, None)
+    """
+
 def test_print_blocks():
     """
     >>> dirs = [os.path.join(path, 'templates', x) for x in ['b', 'a']]
@@ -26,6 +26,10 @@ from .core.rules import get_endpoint
 
 class Middleware(object):
     ORDER = 500
+    #If the middleware saves per-request state in self, it should be set to
+    #True, so that it'll be created for each request even if
+    #GLOBAL/MIDDLEWARE_SINGLETON is enabled
+    STATEFUL = False
     
     def __init__(self, application, settings):
         self.application = application
@@ -15,6 +15,9 @@ def after_init_apps(sender):
     orm.set_nullable(settings.get_var('ORM/NULLABLE'))
     orm.set_server_default(settings.get_var('ORM/SERVER_DEFAULT'))
     orm.set_manytomany_index_reverse(settings.get_var('ORM/MANYTOMANY_INDEX_REVERSE'))
+    orm.set_identity_map(settings.get_var('ORM/IDENTITY_MAP'))
+    orm.set_lazy_transaction(settings.get_var('ORM/LAZY_TRANSACTION'))
+    orm.set_pool_metrics(settings.get_var('ORM/POOL_METRICS'))
     convert_path = settings.get_var('ORM/TABLENAME_CONVERTER')
     convert = import_attr(convert_path) if convert_path else None
     orm.set_tablename_converter(convert)
@@ -36,17 +39,17 @@ def after_init_apps(sender):
         'debug_log':settings.get_var('ORM/DEBUG_LOG'),
         'connection_args':settings.get_var('ORM/CONNECTION_ARGS'),
         'strategy':settings.get_var('ORM/STRATEGY'),
+        'replicas':_get_replicas('default', settings.get_var('ORM/REPLICAS')),
+        'replica_policy':settings.get_var('ORM/REPLICA_POLICY') or 'round_robin',
+        'replica_policy_args':settings.get_var('ORM/REPLICA_POLICY_ARGS') or {},
         }
     orm.engine_manager.add('default', d)
     
     for name, d in settings.get_var('ORM/CONNECTIONS').items():
-        x = {'connection_string':d.get('CONNECTION', ''),
-            'debug_log':d.get('DEBUG_LOG', None),
-            'connection_args':d.get('CONNECTION_ARGS', {}),
-            'strategy':d.get('STRATEGY', 'threadlocal'),
-            'connection_type':d.get('CONNECTION_TYPE', 'long'),
-            'duplication':d.get('DUPLICATION', False),
-        }
+        x = _get_connection_options(d)
+        x['replicas'] = _get_replicas(name, d.get('REPLICAS'))
+        x['replica_policy'] = d.get('REPLICA_POLICY', 'round_robin')
+        x['replica_policy_args'] = d.get('REPLICA_POLICY_ARGS', {})
         orm.engine_manager.add(name, x)
 
     if 'MODELS_CONFIG' in settings:
@@ -67,6 +70,59 @@ def after_init_apps(sender):
                     break
             orm.set_model(path, name)
 
+def startup_installed(sender):
+    from uliweb.core.SimpleFrame import expose
+    
+    url = settings.get_var('ORM/POOL_METRICS_URL')
+    if url:
+        expose(url)(pool_metrics)
+        
+def close_stream(sender):
+    """
+    Streamed templates are rendered after TransactionMiddle, so the sessions
+    used by them are closed when the stream is closed
+    """
+    from uliweb import orm
+    
+    orm.ResetAll()
+    
+def pool_metrics():
+    """
+    Export connection pool metrics of engines by ORM/POOL_METRICS_EXPORTER
+    """
+    from uliweb import orm, Response
+    
+    exporter = orm.get_metrics_exporter(settings.get_var('ORM/POOL_METRICS_EXPORTER'))
+    return Response(exporter.export(orm.get_pool_metrics()), content_type=exporter.content_type)
+
+def _get_connection_options(d):
+    return {'connection_string':d.get('CONNECTION', ''),
+        'debug_log':d.get('DEBUG_LOG', None),
+        'connection_args':d.get('CONNECTION_ARGS', {}),
+        'strategy':d.get('STRATEGY', 'threadlocal'),
+        'connection_type':d.get('CONNECTION_TYPE', 'long'),
+        'duplication':d.get('DUPLICATION', False),
+        'pool_metrics':d.get('POOL_METRICS', None),
+    }
+
+def _get_replicas(name, replicas):
+    """
+    Replica can be the name of a connection of ORM/CONNECTIONS, or a dict
+    just like connection of ORM/CONNECTIONS, then it'll be added as
+    engine named <name>_replica<n> which duplicates the models of the engine
+    """
+    from uliweb import orm
+    
+    names = []
+    for i, r in enumerate(replicas or []):
+        if isinstance(r, dict):
+            x = _get_connection_options(r)
+            x['duplication'] = name
+            r = '%s_replica%d' % (name, i+1)
+            orm.engine_manager.add(r, x)
+        names.append(r)
+    return names
+
 def patch(patch_none='empty'):
     from sqlalchemy import __version__
 
@@ -11,7 +11,7 @@ from sqlalchemy.types import *
 from sqlalchemy import MetaData, Table
 from sqlalchemy.engine.reflection import Inspector
 from sqlalchemy.exc import NoSuchTableError
-from uliweb.orm import get_connection, set_auto_set_model, do_
+from uliweb.orm import get_connection, set_auto_set_model, do_, iter_rows
 from time import time
 from .load_table_file import load_table_file
 
@@ -143,6 +143,69 @@ def get_sorted_tables(tables):
     
     return sorted(tables.items(), cmp=_cmp)
     
+def get_tables_dependencies(tables):
+    """
+    Return a dict of table name and the names of the tables which it references,
+    the references come from foreign keys and from Reference and ManyToMany
+    properties of models, because uliweb will not create foreign keys for them
+    """
+    from uliweb import orm
+    
+    #only use loaded models, so that no model will be imported or rebound here
+    models = {}
+    for name, engine in orm.engine_manager.items():
+        for item in engine.models.values():
+            m = item['model']
+            if isinstance(m, type) and issubclass(m, orm.Model):
+                models[m.tablename] = m
+                
+    deps = dict((t.name, set()) for t in tables)
+    for table in tables:
+        for fk in table.foreign_keys:
+            deps[table.name].add(fk.target_fullname.split('.')[-2])
+        model = models.get(table.name)
+        if model is None:
+            continue
+        for prop in model.properties.values() + model._manytomany.values():
+            if not isinstance(prop, orm.ReferenceProperty):
+                continue
+            name = prop.reference_class.tablename
+            if isinstance(prop, orm.ManyToMany):
+                deps.setdefault(prop.table.name, set()).update([table.name, name])
+            else:
+                deps[table.name].add(name)
+    for name, s in deps.items():
+        s.discard(name)
+    return deps
+
+def get_table_levels(tables):
+    """
+    Split tables into levels, tables of a level only reference the tables
+    of previous levels, so tables of the same level can be loaded at the
+    same time. The order of tables in each level is kept.
+    """
+    names = dict((t.name, t) for name, t in tables)
+    deps = get_tables_dependencies([t for name, t in tables])
+    levels = {}
+    
+    def level(tablename, path=()):
+        if tablename not in levels:
+            n = 0
+            for x in deps[tablename]:
+                #skip tables not processed and circular references
+                if x in names and x not in path:
+                    n = max(n, level(x, path+(tablename,)) + 1)
+            levels[tablename] = n
+        return levels[tablename]
+    
+    result = []
+    for name, t in tables:
+        n = level(t.name)
+        while len(result) <= n:
+            result.append([])
+        result[n].append((name, t))
+    return result
+    
 def dump_table(table, filename, con, std=None, delimiter=',', format=None, 
     encoding='utf-8', inspector=None, engine_name=None):
     from uliweb.utils.common import str_value
@@ -163,7 +226,8 @@ def dump_table(table, filename, con, std=None, delimiter=',', format=None,
         table = Table(table.name, meta)
         inspector.reflecttable(table, None)
         
-    result = do_(table.select(), engine_name)
+    #use server side cursor and fetch rows in chunks to save memory
+    result = do_(table.select().execution_options(stream_results=True), engine_name)
     fields = [x.name for x in table.c]
     if not format:
         print >>std, ' '.join(fields)
@@ -172,7 +236,7 @@ def dump_table(table, filename, con, std=None, delimiter=',', format=None,
     n = 0
     if format == 'txt':
         fw = csv.writer(std, delimiter=delimiter)
-    for r in result:
+    for r in iter_rows(result, 1000):
         n += 1
         if not format:
             print >>std, r
@@ -183,6 +247,161 @@ def dump_table(table, filename, con, std=None, delimiter=',', format=None,
   
     return 'OK (%d/%lfs)' % (n, time()-b)
 
+#tables of parallel tasks, they are inherited by worker processes
+_parallel_tables = {}
+
+def use_parallel(options, engine, write=False):
+    """
+    Whether tables should be processed in parallel. Worker processes are
+    forked, so it's not supported on win32. sqlite doesn't support
+    concurrent writers, and memory database can't be shared with workers,
+    so they will be processed serially
+    """
+    if options.parallel <= 1 or sys.platform == 'win32':
+        return False
+    if engine.dialect.name == 'sqlite':
+        return not write and engine.url.database not in (None, '', ':memory:')
+    return True
+
+def _init_parallel_worker(engine_name):
+    """
+    Each worker process uses its own engine and session, but not the ones
+    inherited from parent process. The pool of parent process is disposed
+    before forking, so there is no connection shared with it
+    """
+    from uliweb import orm
+    
+    engine = orm.engine_manager[engine_name]
+    engine._create(new=True)
+    engine.set_session(orm.Session(engine_name))
+    
+def _run_parallel_task(task):
+    func, name, kwargs = task
+    b = time()
+    ok = True
+    try:
+        result = func(_parallel_tables[name], **kwargs)
+    except Exception as e:
+        log.exception("There are something wrong when processing table [%s]" % name)
+        result = 'ERROR (%s)' % e
+        ok = False
+    return name, result, time()-b, ok
+
+def _dump_table_task(table, filename, engine_name, **kwargs):
+    engine = get_connection(engine_name)
+    return dump_table(table, filename, engine, inspector=Inspector.from_engine(engine),
+        engine_name=engine_name, **kwargs)
+
+def _load_table_task(table, filename, engine_name, **kwargs):
+    from uliweb import orm
+    
+    orm.Begin(engine_name)
+    try:
+        result = load_table(table, filename, get_connection(engine_name),
+            engine_name=engine_name, **kwargs)
+        orm.Commit(engine_name)
+        return result
+    except:
+        orm.Rollback(engine_name)
+        raise
+
+def run_parallel(levels, processes, engine_name, action='Processing', verbose=False):
+    """
+    Run table tasks in a process pool, levels is a list of tasks list, the
+    tasks of a level will be started after the previous level finished.
+    Task is (func, (name, table), kwargs), func will be invoked as
+    func(table, **kwargs) in worker process.
+    If any task of a level failed, the rest levels will be skipped, and the
+    names of failed tables will be returned.
+    """
+    from multiprocessing import Pool
+    from uliweb import orm
+    
+    tables = [x[1] for level in levels for x in level]
+    _parallel_tables.clear()
+    _parallel_tables.update(tables)
+    tables = dict(tables)
+    total = len(tables)
+    i = 0
+    b = time()
+    failed = []
+    
+    #connections checked out by parent process should not be inherited
+    #by workers, because closing them in workers will break the parent's
+    engine = orm.engine_manager[engine_name]
+    session = engine.session(create=False)
+    if session:
+        session.close()
+    engine.engine.dispose()
+    
+    pool = Pool(processes, _init_parallel_worker, (engine_name,))
+    try:
+        for level in levels:
+            tasks = [(func, name, kwargs) for func, (name, t), kwargs in level]
+            for name, result, t, ok in pool.imap_unordered(_run_parallel_task, tasks):
+                if verbose:
+                    print '[%s] %s %s...%s (%.3fs)' % (engine_name, action,
+                        show_table(name, tables[name], i, total), result, t)
+                if not ok:
+                    failed.append(name)
+                i += 1
+            if failed:
+                break
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    if failed:
+        print '[%s] %s failed tables: %s, %d tables are skipped' % (engine_name,
+            action, ', '.join(failed), total-i)
+    elif verbose:
+        print '[%s] %s %d tables (%.3fs)' % (engine_name, action, total, time()-b)
+    return failed
+
+def parallel_dump(tables, output_dir, options, engine_name, verbose=False, zipfile=None):
+    import shutil
+    
+    if zipfile:
+        path = get_temppath(prefix='dump', dir=output_dir)
+    else:
+        path = output_dir
+    kwargs = {'delimiter':options.delimiter, 'format':'txt' if options.text else None,
+        'encoding':options.encoding, 'engine_name':engine_name}
+    tasks = []
+    for name, t in tables:
+        d = kwargs.copy()
+        d['filename'] = os.path.join(path, name+'.txt')
+        tasks.append((_dump_table_task, (name, t), d))
+    try:
+        failed = run_parallel([tasks], options.parallel, engine_name, 'Dumpping', verbose)
+        if zipfile and not failed:
+            for name, t in tables:
+                zipfile.write(os.path.join(path, name+'.txt'), name+'.txt')
+    finally:
+        if zipfile:
+            shutil.rmtree(path)
+    return failed
+    
+def parallel_load(tables, path, options, engine_name, delete=True, verbose=False):
+    kwargs = {'delimiter':options.delimiter, 'format':'txt' if options.text else None,
+        'encoding':options.encoding, 'engine_name':engine_name, 'delete':delete,
+        'bulk':int(options.bulk)}
+    levels = []
+    for level in get_table_levels(tables):
+        tasks = []
+        for name, t in level:
+            if getattr(t, '__mapping_only__', False):
+                if verbose:
+                    print '[%s] Loading %s...SKIPPED(Mapping Table)' % (engine_name, name)
+                continue
+            d = kwargs.copy()
+            d['filename'] = os.path.join(path, name+'.txt')
+            tasks.append((_load_table_task, (name, t), d))
+        levels.append(tasks)
+    return run_parallel(levels, options.parallel, engine_name, 'Loading', verbose)
+
 # class ProcessManager(object):
 #     def __init__(self, size=None):
 #         from multiprocessing import cpu_count
@@ -517,6 +736,8 @@ class DumpCommand(SQLCommandMixin, Command):
             help='Compress table files into a zip file.'),
         make_option('-p', '--project', dest='all', default=True, action='store_false',
             help='Process all tables only defined in project. Default is False, it will include all the tables defined in database maybe outside of project.'),
+        make_option('--parallel', dest='parallel', type='int', default=1,
+            help='Processes number which to dump tables in parallel, each process uses its own connection. Default is 1.'),
     )
     check_apps = True
     
@@ -544,31 +765,38 @@ class DumpCommand(SQLCommandMixin, Command):
             settings_file=global_options.settings, 
             local_settings_file=global_options.local_settings, all=options.all))
         _len = len(tables)
-        for i, (name, t) in enumerate(tables):
-            if global_options.verbose:
-                print 'Dumpping %s...' % show_table(name, t, i, _len),
-            filename = os.path.join(output_dir, name+'.txt')
-            if options.text:
-                format = 'txt'
-            else:
-                format = None
-            #process zipfile
-            if options.zipfile:
-                fileobj = StringIO()
-                filename = os.path.basename(filename)
-            else:
-                fileobj = filename
-            t = dump_table(t, fileobj, engine, delimiter=options.delimiter, 
-                format=format, encoding=options.encoding, inspector=inspector,
-                engine_name=engine.engine_name)
-            #write zip content
-            if options.zipfile and zipfile:
-                zipfile.writestr(filename, fileobj.getvalue())
-            if global_options.verbose:
-                print t
+        failed = None
+        if use_parallel(options, engine):
+            failed = parallel_dump(tables, output_dir, options, engine.engine_name,
+                global_options.verbose, zipfile)
+        else:
+            for i, (name, t) in enumerate(tables):
+                if global_options.verbose:
+                    print 'Dumpping %s...' % show_table(name, t, i, _len),
+                filename = os.path.join(output_dir, name+'.txt')
+                if options.text:
+                    format = 'txt'
+                else:
+                    format = None
+                #process zipfile
+                if options.zipfile:
+                    fileobj = StringIO()
+                    filename = os.path.basename(filename)
+                else:
+                    fileobj = filename
+                t = dump_table(t, fileobj, engine, delimiter=options.delimiter, 
+                    format=format, encoding=options.encoding, inspector=inspector,
+                    engine_name=engine.engine_name)
+                #write zip content
+                if options.zipfile and zipfile:
+                    zipfile.writestr(filename, fileobj.getvalue())
+                if global_options.verbose:
+                    print t
             
         if zipfile:
             zipfile.close()
+        if failed:
+            sys.exit(1)
             
 class DumpTableCommand(SQLCommandMixin, Command):
     name = 'dumptable'
@@ -585,6 +813,8 @@ class DumpTableCommand(SQLCommandMixin, Command):
             help='Character encoding used in text file. Default is "utf-8".'),
         make_option('-z', dest='zipfile', 
             help='Compress table files into a zip file.'),
+        make_option('--parallel', dest='parallel', type='int', default=1,
+            help='Processes number which to dump tables in parallel, each process uses its own connection. Default is 1.'),
    )
 
     def handle(self, options, global_options, *args):
@@ -615,33 +845,40 @@ class DumpTableCommand(SQLCommandMixin, Command):
             local_settings_file=global_options.local_settings))
         _len = len(tables)
 
-        for i, (name, t) in enumerate(tables):
-            if global_options.verbose:
-                print '[%s] Dumpping %s...' % (options.engine, show_table(name, t, i, _len)),
-            filename = os.path.join(output_dir, name+'.txt')
-            if options.text:
-                format = 'txt'
-            else:
-                format = None
-            #process zipfile
-            if options.zipfile:
-                fileobj = StringIO()
-                filename = os.path.basename(filename)
-            else:
-                fileobj = filename
+        failed = None
+        if use_parallel(options, engine):
+            failed = parallel_dump(tables, output_dir, options, engine.engine_name,
+                global_options.verbose, zipfile)
+        else:
+            for i, (name, t) in enumerate(tables):
+                if global_options.verbose:
+                    print '[%s] Dumpping %s...' % (options.engine, show_table(name, t, i, _len)),
+                filename = os.path.join(output_dir, name+'.txt')
+                if options.text:
+                    format = 'txt'
+                else:
+                    format = None
+                #process zipfile
+                if options.zipfile:
+                    fileobj = StringIO()
+                    filename = os.path.basename(filename)
+                else:
+                    fileobj = filename
                 
-            t = dump_table(t, fileobj, engine, delimiter=options.delimiter, 
-                format=format, encoding=options.encoding, inspector=inspector,
-                engine_name=engine.engine_name)
+                t = dump_table(t, fileobj, engine, delimiter=options.delimiter, 
+                    format=format, encoding=options.encoding, inspector=inspector,
+                    engine_name=engine.engine_name)
 
-            #write zip content
-            if options.zipfile and zipfile:
-                zipfile.writestr(filename, fileobj.getvalue())
-            if global_options.verbose:
-                print t
+                #write zip content
+                if options.zipfile and zipfile:
+                    zipfile.writestr(filename, fileobj.getvalue())
+                if global_options.verbose:
+                    print t
             
         if zipfile:
             zipfile.close()
+        if failed:
+            sys.exit(1)
             
 class DumpTableFileCommand(SQLCommandMixin, Command):
     name = 'dumptablefile'
@@ -704,6 +941,8 @@ class LoadCommand(SQLCommandMixin, Command):
             help='Process all tables only defined in project. Default is False, it will include all the tables defined in database maybe outside of project.'),
         make_option('-z', dest='zipfile', 
             help='Extract zip file into directory which can be combined with -d option.'),
+        make_option('--parallel', dest='parallel', type='int', default=1,
+            help='Processes number which to load tables in parallel, tables referenced by foreign keys will be loaded first, each process uses its own connection. Default is 1.'),
     )
     check_apps = True
     
@@ -771,34 +1010,41 @@ are you sure to load data""" % options.engine
                 traceback.print_exc()
                 orm.Rollback()
 
-        for i, (name, t) in enumerate(tables):
-            if hasattr(t, '__mapping_only__') and t.__mapping_only__:
+        failed = None
+        if use_parallel(options, engine, write=True):
+            failed = parallel_load(tables, path, options, engine.engine_name, delete=ans=='Y',
+                verbose=global_options.verbose)
+        else:
+            for i, (name, t) in enumerate(tables):
+                if hasattr(t, '__mapping_only__') and t.__mapping_only__:
+                    if global_options.verbose:
+                        msg = 'SKIPPED(Mapping Table)'
+                        print '[%s] Loading %s...%s' % (options.engine, show_table(name, t, i, _len), msg)
+                    continue
+                msg = ''
                 if global_options.verbose:
-                    msg = 'SKIPPED(Mapping Table)'
-                    print '[%s] Loading %s...%s' % (options.engine, show_table(name, t, i, _len), msg)
-                continue
-            msg = ''
-            if global_options.verbose:
-                msg = '[%s] Loading %s...' % (options.engine, show_table(name, t, i, _len))
-            try:
-                orm.Begin()
-                filename = os.path.join(path, name+'.txt')
-                if options.text:
-                    format = 'txt'
-                else:
-                    format = None
-
-                    #fork process to run
-                    if sys.platform != 'win32' and options.multi>1:
-                        load_table_file(t, filename, options.multi, bulk=options.bulk)
+                    msg = '[%s] Loading %s...' % (options.engine, show_table(name, t, i, _len))
+                try:
+                    orm.Begin()
+                    filename = os.path.join(path, name+'.txt')
+                    if options.text:
+                        format = 'txt'
                     else:
-                        _f(t, filename, msg)
-            except:
-                log.exception("There are something wrong when loading table [%s]" % name)
-                orm.Rollback()
+                        format = None
+
+                        #fork process to run
+                        if sys.platform != 'win32' and options.multi>1:
+                            load_table_file(t, filename, options.multi, bulk=options.bulk)
+                        else:
+                            _f(t, filename, msg)
+                except:
+                    log.exception("There are something wrong when loading table [%s]" % name)
+                    orm.Rollback()
 
         if options.zipfile:
             shutil.rmtree(path)
+        if failed:
+            sys.exit(1)
 
 class LoadTableCommand(SQLCommandMixin, Command):
     name = 'loadtable'
@@ -819,6 +1065,8 @@ class LoadTableCommand(SQLCommandMixin, Command):
             help='Character encoding used in text file. Default is "utf-8".'),
         make_option('-z', dest='zipfile', 
             help='Extract zip file into directory which can be combined with -d option.'),
+        make_option('--parallel', dest='parallel', type='int', default=1,
+            help='Processes number which to load tables in parallel, tables referenced by foreign keys will be loaded first, each process uses its own connection. Default is 1.'),
     )
 
     def handle(self, options, global_options, *args):
@@ -881,32 +1129,39 @@ are you sure to load data""" % (options.engine, ','.join(args))
             except:
                 orm.Rollback()
 
-        for i, (name, t) in enumerate(tables):
-            if t.__mapping_only__:
+        failed = None
+        if use_parallel(options, engine, write=True):
+            failed = parallel_load(tables, path, options, engine.engine_name, delete=ans=='Y',
+                verbose=global_options.verbose)
+        else:
+            for i, (name, t) in enumerate(tables):
+                if t.__mapping_only__:
+                    if global_options.verbose:
+                        msg = 'SKIPPED(Mapping Table)'
+                        print '[%s] Loading %s...%s' % (options.engine, show_table(name, t, i, _len), msg)
+                    continue
                 if global_options.verbose:
-                    msg = 'SKIPPED(Mapping Table)'
-                    print '[%s] Loading %s...%s' % (options.engine, show_table(name, t, i, _len), msg)
-                continue
-            if global_options.verbose:
-                msg = '[%s] Loading %s...' % (options.engine, show_table(name, t, i, _len))
-            else:
-                msg = ''
-
-            filename = os.path.join(path, name+'.txt')
-            if options.text:
-                format = 'txt'
-            else:
-                format = None
+                    msg = '[%s] Loading %s...' % (options.engine, show_table(name, t, i, _len))
+                else:
+                    msg = ''
 
-                #fork process to run
-                if sys.platform != 'win32' and options.multi>1 and format != 'txt':
-                    load_table_file(t, filename, options.multi, bulk=options.bulk,
-                                    engine=engine, delete=ans=='Y')
+                filename = os.path.join(path, name+'.txt')
+                if options.text:
+                    format = 'txt'
                 else:
-                    _f(t, filename, msg)
+                    format = None
+
+                    #fork process to run
+                    if sys.platform != 'win32' and options.multi>1 and format != 'txt':
+                        load_table_file(t, filename, options.multi, bulk=options.bulk,
+                                        engine=engine, delete=ans=='Y')
+                    else:
+                        _f(t, filename, msg)
 
         if options.zipfile:
             shutil.rmtree(path)
+        if failed:
+            sys.exit(1)
 
 class LoadTableFileCommand(SQLCommandMixin, Command):
     name = 'loadtablefile'
@@ -1,9 +1,11 @@
 from uliweb import Middleware
-from uliweb.orm import set_dispatch_send, set_echo
+from uliweb.orm import set_dispatch_send, set_echo, clear_identity_map, reset_read_routing
 
 class ORMResetMiddle(Middleware):
     ORDER = 70
     
     def process_request(self, request):
         set_echo(False)
-        set_dispatch_send(True)
\ No newline at end of file
+        set_dispatch_send(True)
+        clear_identity_map()
+        reset_read_routing()
\ No newline at end of file
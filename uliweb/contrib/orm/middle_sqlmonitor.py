@@ -1,26 +1,61 @@
+import logging
 from uliweb import Middleware
-from uliweb.orm import begin_sql_monitor, close_sql_monitor
+from uliweb.orm import begin_sql_profiler, end_sql_profiler
+
+log = logging.getLogger(__name__)
 
 class SQLMonitorMiddle(Middleware):
+    """
+    Profile sql statements of each request, it's enabled by ORM/SQL_MONITOR
+    or sqlmonitor request parameter, and the result is output according
+    ORM/SQL_MONITOR_OUTPUT:
+        header  X-SQL-Profile response header
+        log     log a summary line, and warnings of N+1 queries
+        json    return the report as json if the request parameter is sqlmonitor=json
+        print   print statements to stdout
+    The sqlmonitor request parameter is only honoured when GLOBAL/DEBUG is on,
+    so clients can't enable profiling or replace the page in production.
+    """
     ORDER = 90
     
+    def allow_param(self, request):
+        from uliweb import settings
+        
+        return bool(settings.get_var('GLOBAL/DEBUG')) and 'sqlmonitor' in request.GET
+    
     def process_request(self, request):
         from uliweb import settings
 
-        if 'sqlmonitor' in request.GET or settings.ORM.SQL_MONITOR:
-            self.monitor = begin_sql_monitor(settings.ORM.get('SQL_MONITOR_LENGTH', 70), record_details=False)
+        if self.allow_param(request) or settings.ORM.SQL_MONITOR:
+            begin_sql_profiler(n_plus_one=settings.ORM.get('SQL_MONITOR_N_PLUS_ONE', 5))
 
     def process_response(self, request, response):
-        from uliweb import settings
+        from uliweb import settings, json
         
-        if 'sqlmonitor' in request.GET or settings.ORM.SQL_MONITOR:
-            self.monitor.print_(request.path)
-            close_sql_monitor(self.monitor)
+        profiler = end_sql_profiler()
+        if profiler:
+            output = settings.ORM.get('SQL_MONITOR_OUTPUT', ['print'])
+            self.output(request, profiler, output)
+            if 'header' in output:
+                response.headers['X-SQL-Profile'] = profiler.summary()
+            if 'json' in output and self.allow_param(request) and request.GET.get('sqlmonitor') == 'json':
+                return json(profiler.report())
         return response
             
     def process_exception(self, request, exception):
         from uliweb import settings
         
-        if 'sqlmonitor' in request.GET or settings.ORM.SQL_MONITOR:
-            self.monitor.print_(request.path)
-            close_sql_monitor(self.monitor)
\ No newline at end of file
+        profiler = end_sql_profiler()
+        if profiler:
+            self.output(request, profiler, settings.ORM.get('SQL_MONITOR_OUTPUT', ['print']))
+        
+    def output(self, request, profiler, output):
+        from uliweb import settings
+        
+        if 'log' in output:
+            log.info('[%s] %s', request.path, profiler.summary())
+            for st in profiler.get_n_plus_one():
+                log.warning('[%s] N+1 query executed %d times at %s: %s', request.path,
+                    st['count'], ', '.join(filter(None, st['callers'])), st['sql'])
+        if 'print' in output:
+            profiler.print_(request.path, settings.ORM.get('SQL_MONITOR_LENGTH', 70))
@@ -8,7 +8,7 @@ class TransactionMiddle(Middleware):
         self.settings = settings
         
     def process_request(self, request):
-        Begin()
+        Begin(implicit=True)
 
     def process_response(self, request, response):
         from uliweb import response as res
@@ -10,6 +10,7 @@ import inspect
 import re
 import types
 import threading
+from collections import namedtuple
 from werkzeug import Request as OriginalRequest, Response as OriginalResponse
 from werkzeug import ClosingIterator, Local, LocalManager, BaseResponse
 from werkzeug.exceptions import HTTPException, NotFound, BadRequest, InternalServerError
@@ -41,6 +42,7 @@ except:
 local = Local()
 local.request = None
 local.response = None
+local.view_env = None
 __global__ = Global()
 local_manager = LocalManager([local])
 url_map = Map(strict_slashes=False)
@@ -578,8 +580,124 @@ class ContextStorage(object):
     def __repr__(self):
         return '<ContextStorage ' + repr(self.__variables__) + ' ' + repr(self._vars) + ' >'
 
+#Resolved information of an url endpoint, it'll be created once for each
+#endpoint, so that the handler will not be resolved again for every request
+#hooks is (mod_begin, mod_end, cls_begin, cls_end) invoke names
+DispatchPlan = namedtuple('DispatchPlan', ['endpoint', 'mod', 'view_class',
+    'handler', 'func', 'appname', 'function', 'view_class_name', 'hooks',
+    'template', 'layout', 'static'])
+
+class ViewEnv(object):
+    """
+    View env of a request, it's a mutable overlay of the base env shared by
+    all requests, values set or deleted are only kept in the overlay, so
+    creating it doesn't copy the base env
+    """
+    _deleted = object()
+
+    def __init__(self, base, vars=None):
+        object.__setattr__(self, '_base', base)
+        object.__setattr__(self, '_vars', vars or {})
+
+    def __getitem__(self, key):
+        v = self._vars.get(key, self._base.get(key, self._deleted))
+        if v is self._deleted:
+            raise KeyError(key)
+        return v
+
+    def __setitem__(self, key, value):
+        self._vars[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        if key in self._base:
+            self._vars[key] = self._deleted
+        else:
+            del self._vars[key]
+
+    def __contains__(self, key):
+        return self._vars.get(key, self._base.get(key, self._deleted)) is not self._deleted
+    has_key = __contains__
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError as k:
+            raise AttributeError(k)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [k for k in self._base if k not in self._vars]
+        return keys + [k for k, v in self._vars.items() if v is not self._deleted]
+
+    def local_keys(self):
+        """
+        Keys set in this request
+        """
+        return [k for k, v in self._vars.items() if v is not self._deleted]
+
+    def __iter__(self):
+        return iter(self.keys())
+    iterkeys = __iter__
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __nonzero__(self):
+        return True
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def update(self, *args, **kwargs):
+        self._vars.update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        v = self[key]
+        del self[key]
+        return v
+
+    def copy(self):
+        return ViewEnv(self._base, self._vars.copy())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return '<ViewEnv ' + repr(self._vars) + '>'
+
+#values in view env may be any object, so their proxies support all special methods
+ViewEnvValue = type('ViewEnvValue', (object,), dict.fromkeys(LocalProxy._special_names))
+
 class Dispatcher(object):
     installed = False
+    dispatch_plans = {}
     def __init__(self, apps_dir='apps', project_dir=None, include_apps=None, 
         start=True, default_settings=None, settings_file='settings.ini', 
         local_settings_file='local_settings.ini', xhr_redirect_json=True,
@@ -654,6 +772,7 @@ class Dispatcher(object):
         Dispatcher.middlewares = self.install_middlewares()
 
         dispatch.call(self, 'prepare_default_env', Dispatcher.env)
+        Dispatcher.view_env = self._prepare_view_env()
         Dispatcher.default_template = pkg.resource_filename('uliweb.core', 'default.html')
         
         Dispatcher.installed = True
@@ -674,6 +793,15 @@ class Dispatcher(object):
 
         c = ContextStorage(env)
         return c
+
+    def _prepare_view_env(self):
+        env = self.env.to_dict()
+        #these are proxies, so they can be shared between requests
+        env['application'] = application
+        env['request'] = request
+        env['response'] = response
+        env['settings'] = settings
+        return env
     
     def set_log(self):
         import logging
@@ -800,17 +928,22 @@ class Dispatcher(object):
             args['check_modified_time'] = True
             args['log'] = log
             args['debug'] = settings.get_var('GLOBAL/DEBUG_TEMPLATE', False)
+            if args.get('index_mode') == 'static':
+                args['index_mode'] = 'poll'
         Dispatcher.template_loader = Loader(Dispatcher.template_dirs,
                                             taglibs_loader=Dispatcher.taglibs_loader,
                                             **args)
 
 
-    def template(self, filename, vars=None, env=None, default_template=None, layout=None):
+    def template(self, filename, vars=None, env=None, default_template=None,
+                 layout=None, stream=False):
         vars = vars or {}
         env = env or self.get_view_env()
         
         t = self.template_loader.load(filename, layout=layout,
                                       default_template=default_template)
+        if stream:
+            return t.stream(vars, env)
         return t.generate(vars, env)
 
     def render(self, templatefile, vars, env=None, default_template=None,
@@ -871,19 +1004,22 @@ class Dispatcher(object):
         log.exception(e)
         return response
 
-    def get_handler(self, endpoint):
+    def _resolve_handler(self, endpoint):
+        """
+        Resolve an endpoint to (mod, view_class, handler), view_class will
+        not be instantiated
+        """
         from uliweb.utils.common import safe_import
 
-        #get handler
-        _klass = None
+        view_class = None
         if isinstance(endpoint, string_types):
             mod, handler = safe_import(endpoint)
             if inspect.ismethod(handler):
                 if not handler.im_self:    #instance method
-                    _klass = handler.im_class()
+                    view_class = handler.im_class
                 else:                       #class method
-                    _klass = handler.im_self()
-                #if _klass is class method, then the mod should be Class
+                    view_class = handler.im_self
+                #if view_class is class method, then the mod should be Class
                 #so the real mod should be mod.__module__
                 mod = sys.modules[mod.__module__]
 
@@ -891,28 +1027,101 @@ class Dispatcher(object):
             handler = endpoint
             mod = sys.modules[handler.__module__]
 
+        return mod, view_class, handler
+
+    def get_handler(self, endpoint):
+        mod, view_class, handler = self._resolve_handler(endpoint)
+        if view_class:
+            _klass = view_class()
+        else:
+            _klass = None
         return _klass, mod, handler
 
+    def _get_view_hooks(self, mod, view_class):
+        """
+        Return the invoke names of __begin__ and __end__ of view module and
+        view class as (mod_begin, mod_end, cls_begin, cls_end), None means
+        the hook is not defined
+        """
+        hooks = []
+        for obj in (mod, view_class):
+            if obj is None:
+                hooks.extend([None, None])
+                continue
+            if isinstance(obj, types.ModuleType):
+                prefix = obj.__name__
+            else:
+                prefix = obj.__module__ + '.' + obj.__name__
+            for name in ('__begin__', '__end__'):
+                if hasattr(obj, name):
+                    hooks.append(prefix + '.' + name)
+                else:
+                    hooks.append(None)
+        return tuple(hooks)
+
+    def _get_view_template(self, handler, function, view_class, appname):
+        args = handler.func_dict.get('__template__')
+        if not args:
+            args = {'function':function, 'view_class':view_class, 'appname':appname}
+
+        if isinstance(args, dict):
+            #TEMPLATE_TEMPLATE should be two elements tuple or list, the first one will be used for view_class is not empty
+            #and the second one will be used for common functions
+            if view_class:
+                return settings.GLOBAL.TEMPLATE_TEMPLATE[0] % args + settings.GLOBAL.TEMPLATE_SUFFIX
+            else:
+                return settings.GLOBAL.TEMPLATE_TEMPLATE[1] % args + settings.GLOBAL.TEMPLATE_SUFFIX
+        return args
+
+    def _make_dispatch_plan(self, endpoint):
+        mod, view_class, handler = self._resolve_handler(endpoint)
+
+        appname = ''
+        for p in self.apps:
+            if handler.__module__.startswith(p + '.'):
+                appname = p
+                break
+        function = handler.__name__
+        if view_class:
+            view_class_name = view_class.__name__
+        else:
+            view_class_name = None
+        func = getattr(handler, 'im_func', handler)
+
+        return DispatchPlan(endpoint=endpoint, mod=mod, view_class=view_class,
+            handler=handler, func=func, appname=appname, function=function,
+            view_class_name=view_class_name,
+            hooks=self._get_view_hooks(mod, view_class),
+            template=self._get_view_template(func, function, view_class_name, appname),
+            layout=func.func_dict.get('__layout__'),
+            static=endpoint in static_views)
+
+    def get_dispatch_plan(self, endpoint):
+        """
+        Get the dispatch plan of an endpoint, plans of all url rules are
+        built in init_urls, others will be built and cached at first use
+        """
+        plan = self.dispatch_plans.get(endpoint)
+        if plan is None:
+            plan = self._make_dispatch_plan(endpoint)
+            self.dispatch_plans[endpoint] = plan
+        return plan
+
     def prepare_request(self, request, rule):
-        endpoint = rule.endpoint
         #bind endpoint to request
         request.rule = rule
-        #get handler
-        _klass, mod, handler = self.get_handler(endpoint)
-        
-        request.appname = ''
-        for p in self.apps:
-            t = p + '.'
-            if handler.__module__.startswith(t):
-                request.appname = p
-                break
-        request.function = handler.__name__
-        if _klass:
-            request.view_class = _klass.__class__.__name__
-            handler = getattr(_klass, handler.__name__)
+        plan = self.get_dispatch_plan(rule.endpoint)
+        request.dispatch_plan = plan
+        request.appname = plan.appname
+        request.function = plan.function
+        request.view_class = plan.view_class_name
+        if plan.view_class:
+            _klass = plan.view_class()
+            handler = getattr(_klass, plan.function)
         else:
-            request.view_class = None
-        return mod, _klass, handler
+            _klass = None
+            handler = plan.handler
+        return plan.mod, _klass, handler
     
     def call_view(self, mod, cls, handler, request, response=None, wrap_result=None, args=None, kwargs=None):
         #get env
@@ -927,58 +1136,52 @@ class Dispatcher(object):
         #twice, so I'll remember the function in cache, so that they'll not be invoke
         #twice
         
-        def _get_name(mod, name):
-            if isinstance(mod, types.ModuleType):
-                return mod.__name__ + '.' + name
-            else:
-                return cls.__module__ + '.' + cls.__class__.__name__ + '.' + name
-            
-        def _process_begin(mod):
-            name = '__begin__'
-            if hasattr(mod, name):
-                _name = _get_name(mod, name)
-                if _name not in request._invokes['begin']:
-                    request._invokes['begin'].append(_name)
-                    f = getattr(mod, name)
-                    return self._call_function(f, request, response, env)
-                    
-        def _prepare_end(mod):
-            name = '__end__'
-            if hasattr(mod, name):
-                _name = _get_name(mod, name)
-                if _name not in request._invokes['end']:
-                    request._invokes['end'].append(_name)
-                    return True
-            
-        def _process_end(mod):
-            f = getattr(mod, '__end__')
-            return self._call_function(f, request, response, env)
-            
-                
+        if cls is not None:
+            view_class = cls.__class__
+        else:
+            view_class = None
+        plan = getattr(request, 'dispatch_plan', None)
+        if plan is not None and plan.mod is mod and plan.view_class is view_class:
+            hooks = plan.hooks
+        else:
+            hooks = self._get_view_hooks(mod, view_class)
+        mod_begin, mod_end, cls_begin, cls_end = hooks
+
         if not hasattr(request, '_invokes'):
             request._invokes = {'begin':[], 'end':[]}
-            
-        result = _process_begin(mod)
-        if result is not None:
-            return wrap(handler, result, request, response, env)
+        invokes = request._invokes
+
+        if mod_begin and mod_begin not in invokes['begin']:
+            invokes['begin'].append(mod_begin)
+            result = self._call_function(mod.__begin__, request, response, env)
+            if result is not None:
+                return wrap(handler, result, request, response, env)
         
-        result = _process_begin(cls)
-        if result is not None:
-            return wrap(handler, result, request, response, env)
+        if cls_begin and cls_begin not in invokes['begin']:
+            invokes['begin'].append(cls_begin)
+            result = self._call_function(cls.__begin__, request, response, env)
+            if result is not None:
+                return wrap(handler, result, request, response, env)
         
         #preprocess __end__
-        mod_end = _prepare_end(mod)
-        cls_end = _prepare_end(cls)
+        if mod_end and mod_end not in invokes['end']:
+            invokes['end'].append(mod_end)
+        else:
+            mod_end = None
+        if cls_end and cls_end not in invokes['end']:
+            invokes['end'].append(cls_end)
+        else:
+            cls_end = None
         
         result = self.call_handler(handler, request, response, env, wrap, args, kwargs)
 
         if mod_end:
-            result1 = _process_end(mod)
+            result1 = self._call_function(mod.__end__, request, response, env)
             if result1 is not None:
                 return wrap(handler, result1, request, response, env)
         
         if cls_end:
-            result1 = _process_end(cls)
+            result1 = self._call_function(cls.__end__, request, response, env)
             if result1 is not None:
                 return wrap(handler, result1, request, response, env)
 
@@ -991,8 +1194,13 @@ class Dispatcher(object):
 
         if isinstance(result, dict):
             result = Storage(result)
+            plan = getattr(request, 'dispatch_plan', None)
+            if plan is not None and plan.func is not getattr(handler, 'im_func', handler):
+                plan = None
             if hasattr(response, 'layout'):
                 _layout = response.layout
+            elif plan is not None:
+                _layout = plan.layout
             else:
                 _layout = handler.func_dict.get('__layout__')
             if _layout:
@@ -1004,19 +1212,11 @@ class Dispatcher(object):
             if hasattr(response, 'template'):
                 tmpfile = response.template
             else:
-                args = handler.func_dict.get('__template__')
-                if not args:
-                    args = {'function':request.function, 'view_class':request.view_class, 'appname':request.appname}
-                    
-                if isinstance(args, dict):
-                    #TEMPLATE_TEMPLATE should be two elements tuple or list, the first one will be used for view_class is not empty
-                    #and the second one will be used for common functions
-                    if request.view_class:
-                        tmpfile = settings.GLOBAL.TEMPLATE_TEMPLATE[0] % args + settings.GLOBAL.TEMPLATE_SUFFIX
-                    else:
-                        tmpfile = settings.GLOBAL.TEMPLATE_TEMPLATE[1] % args + settings.GLOBAL.TEMPLATE_SUFFIX
+                if plan is not None:
+                    tmpfile = plan.template
                 else:
-                    tmpfile = args
+                    tmpfile = self._get_view_template(handler, request.function,
+                        request.view_class, request.appname)
                 response.template = tmpfile
 
             #if debug mode, then display a default_template
@@ -1024,6 +1224,10 @@ class Dispatcher(object):
                 d = ['default.html', self.default_template]
             else:
                 d = None
+            #streaming render, it should be enabled via response.stream_template = True
+            if getattr(response, 'stream_template', False):
+                return self.stream_response(self.template(tmpfile, result, env, default_template=d,
+                                                          layout=layout, stream=True), response)
             response.write(self.template(tmpfile, result, env, default_template=d, layout=layout))
         elif isinstance(result, string_types):
             response.write(result)
@@ -1048,29 +1252,73 @@ class Dispatcher(object):
             response = Response(str(result), content_type=response.content_type)
         return response
     
+    def stream_response(self, stream, response):
+        """
+        Wrap the stream of template to a passthrough response. The stream is
+        consumed after process_response of middlewares, e.g. TransactionMiddle
+        has committed and closed the session, so only the first chunk will be
+        rendered here, and exceptions of it can still be processed by
+        middlewares. The exceptions of the rest chunks can't change the status
+        any more, the response will be truncated. When the stream is closed,
+        'close_stream' signal will be sent, so apps can release the resources
+        used by the rest chunks, e.g. orm app closes the sessions.
+        """
+        stream = iter(stream)
+        try:
+            first = next(stream)
+        except StopIteration:
+            first = ''
+        
+        def f():
+            yield first
+            for x in stream:
+                yield x
+            
+        callbacks = [lambda: dispatch.call(self, 'close_stream')]
+        if hasattr(stream, 'close'):
+            callbacks.insert(0, stream.close)
+        return Response(ClosingIterator(f(), callbacks),
+                        status=response.status, direct_passthrough=True,
+                        headers=response.headers,
+                        content_type=response.content_type)
+    
     def get_view_env(self):
-        #prepare local env
-        local_env = {}
+        """
+        Return view env of current request, it's an overlay of the shared
+        view env, values added by prepare_view_env receivers or views are only
+        kept in it
+        """
+        env = ViewEnv(self.view_env)
 
         #process before view call
-        dispatch.call(self, 'prepare_view_env', local_env)
-        
-        local_env['application'] = __global__.application
-        local_env['request'] = local.request
-        local_env['response'] = local.response
-        local_env['settings'] = __global__.settings
-        
-        env = Storage(self.env.to_dict())
-        env.update(local_env)
+        dispatch.call(self, 'prepare_view_env', env)
         return env
 
+    def bind_view_env(self, func_globals, env=None):
+        """
+        Inject view env into function globals. The shared entries will be
+        injected only once for each module, request, response, etc. are
+        proxies, so they will always point to current request. env will be
+        saved in local.view_env, and global name env is a proxy of it.
+        Names set in env are injected as proxies of local.view_env too, so
+        module globals never hold the values of a request.
+        """
+        if func_globals.get('__view_env__') is not self.view_env:
+            func_globals.update(self.view_env)
+            func_globals['env'] = view_env
+            func_globals['__view_env__'] = self.view_env
+            func_globals['__view_env_keys__'] = set()
+        if env is not None:
+            local.view_env = env
+            keys = func_globals['__view_env_keys__']
+            for k in env.local_keys():
+                if k not in keys:
+                    func_globals[k] = LocalProxy(view_env, k, ViewEnvValue)
+                    keys.add(k)
+
     def _call_function(self, handler, request, response, env, args=None, kwargs=None):
         
-        handler.func_globals.update(env)
-        # for k, v in env.items():
-        #     handler.func_globals[k] = v
-        
-        handler.func_globals['env'] = env
+        self.bind_view_env(handler.func_globals, env)
         
         args = args or ()
         kwargs = kwargs or {}
@@ -1146,6 +1394,7 @@ class Dispatcher(object):
                 log.exception(e)
          
     def init_urls(self):
+        Dispatcher.dispatch_plans = {}
         #initialize urls
         for v in rules.merge_rules():
             appname, endpoint, url, kw = v
@@ -1166,6 +1415,17 @@ class Dispatcher(object):
             except:
                 log.error("Wrong url url=%s, endpoint=%s" % (_url, endpoint))
                 raise
+
+        #prepare dispatch plans, so that the handler of each endpoint will
+        #not be resolved again when processing request
+        for r in url_map.iter_rules():
+            if r.endpoint in self.dispatch_plans:
+                continue
+            try:
+                self.dispatch_plans[r.endpoint] = self._make_dispatch_plan(r.endpoint)
+            except Exception as e:
+                log.error("Can't prepare dispatch plan for endpoint=%r" % r.endpoint)
+                log.exception(e)
     
     def install_apps(self):
         for p in self.apps:
@@ -1263,8 +1523,41 @@ class Dispatcher(object):
         Dispatcher.process_request_classes = req_classes
         Dispatcher.process_response_classes = res_classes
         Dispatcher.process_exception_classes = ex_classes
+        singleton = settings.get_var('GLOBAL/MIDDLEWARE_SINGLETON', False)
+        req_chain, res_chain, ex_chain = self._compile_middlewares(m, singleton)
+        Dispatcher.process_request_chain = req_chain
+        Dispatcher.process_response_chain = res_chain
+        Dispatcher.process_exception_chain = ex_chain
         return m
 
+    def _compile_middlewares(self, middlewares, singleton=False):
+        """
+        Compile middlewares into request, response and exception call lists,
+        each item is (cls, func). If singleton is True, middleware instance
+        will be created only once and func is the bound method of it, but
+        if the middleware class defines STATEFUL = True, or singleton is
+        False, func will be None, and the instance will be created for each
+        request.
+        """
+        req_classes, res_classes, ex_classes = self._get_middlewares_classes(middlewares)
+        instances = {}
+
+        def _chain(classes, name):
+            chain = []
+            for cls in classes:
+                if singleton and not getattr(cls, 'STATEFUL', False):
+                    ins = instances.get(cls)
+                    if ins is None:
+                        ins = instances[cls] = cls(self, settings)
+                    chain.append((cls, getattr(ins, name)))
+                else:
+                    chain.append((cls, None))
+            return chain
+
+        return (_chain(req_classes, 'process_request'),
+            _chain(res_classes, 'process_response'),
+            _chain(ex_classes, 'process_exception'))
+
     def _get_middlewares_classes(self, middlewares):
         m = middlewares
 
@@ -1382,25 +1675,22 @@ class Dispatcher(object):
         
     def _open(self, environ, pre_call=None, post_call=None, middlewares=None):
         if middlewares is None:
-            middlewares = self.middlewares
-            process_request_classes = self.process_request_classes
-            process_response_classes = self.process_response_classes
-            process_exception_classes = self.process_exception_classes
+            process_request_chain = self.process_request_chain
+            process_response_chain = self.process_response_chain
+            process_exception_chain = self.process_exception_chain
         else:
             m = self._sort_middlewares(middlewares)
-            process_request_classes, process_response_classes, process_exception_classes = self._get_middlewares_classes(m)
+            process_request_chain, process_response_chain, process_exception_chain = self._compile_middlewares(m)
 
-        self.lock.acquire()
-        try:
-            local.request = req = Request(environ)
-            local.response = res = Response(content_type='text/html')
+        #local is keyed by current thread(or greenlet) ident, and each thread
+        #only touches its own slot, so there is no need to lock here
+        local.request = req = Request(environ)
+        local.response = res = Response(content_type='text/html')
 
-            #add local cached
-            local.local_cache = {}
-            #add in web flag
-            local.in_web = True
-        finally:
-            self.lock.release()
+        #add local cached
+        local.local_cache = {}
+        #add in web flag
+        local.in_web = True
 
         url_adapter = get_url_adapter('default')
         try:
@@ -1408,16 +1698,17 @@ class Dispatcher(object):
             mod, handler_cls, handler = self.prepare_request(req, rule)
             
             #process static
-            if rule.endpoint in static_views:
+            if req.dispatch_plan.static:
                 response = self.call_view(mod, handler_cls, handler, req, res, kwargs=values)
             else:
                 response = None
-                _clses = {}
                 _inss = {}
-                for cls in process_request_classes:
-                    ins = cls(self, settings)
-                    _inss[cls] = ins
-                    response = ins.process_request(req)
+                for cls, func in process_request_chain:
+                    if func is None:
+                        ins = cls(self, settings)
+                        _inss[cls] = ins
+                        func = ins.process_request
+                    response = func(req)
                     if response is not None:
                         break
                 
@@ -1433,23 +1724,27 @@ class Dispatcher(object):
                         if post_call:
                             response = post_call(req, response)
                     except Exception as e:
-                        for cls in process_exception_classes:
-                            ins = _inss.get(cls)
-                            if not ins:
-                                ins = cls(self, settings)
-                            response = ins.process_exception(req, e)
+                        for cls, func in process_exception_chain:
+                            if func is None:
+                                ins = _inss.get(cls)
+                                if not ins:
+                                    ins = cls(self, settings)
+                                func = ins.process_exception
+                            response = func(req, e)
                             if response:
                                 break
                         raise
                     
-                for cls in process_response_classes:
-                    ins = _inss.get(cls)
-                    if not ins:
-                        ins = cls(self, settings)
-                    response = ins.process_response(req, response)
+                for cls, func in process_response_chain:
+                    if func is None:
+                        ins = _inss.get(cls)
+                        if not ins:
+                            ins = cls(self, settings)
+                        func = ins.process_response
+                    response = func(req, response)
 
                     if not isinstance(response, (OriginalResponse, Response)):
-                        raise Exception("Middleware %s should return an Response object, but %r found" % (ins.__class__.__name__, response))
+                        raise Exception("Middleware %s should return an Response object, but %r found" % (cls.__name__, response))
                 
                 #process post_response call, you can set some async process in here
                 #but the sync may fail, so you should think about the checking mechanism
@@ -1476,6 +1771,7 @@ class Dispatcher(object):
         finally:
             local.local_cache = {}
             local.in_web = False
+            local.view_env = None
         return response
     
     def handler(self):
@@ -1489,3 +1785,4 @@ response = LocalProxy(local, 'response', Response)
 request = LocalProxy(local, 'request', Request)
 settings = LocalProxy(__global__, 'settings', pyini.Ini)
 application = LocalProxy(__global__, 'application', Dispatcher)
+view_env = LocalProxy(local, 'view_env', ViewEnv)
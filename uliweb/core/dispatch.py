@@ -1,5 +1,6 @@
 import logging
 import inspect
+from bisect import bisect_right
 from uliweb.utils.common import import_attr
 
 __all__ = ['HIGH', 'MIDDLE', 'LOW', 'bind', 'call', 'get', 'unbind', 'call_once', 'get_once']
@@ -10,12 +11,21 @@ LOW = 3
 
 _receivers = {}
 _called = {}
+#dispatch tables, key is (topic, signal), value is [(func, pass_signal)]
+#it'll be created at first calling and be removed when receivers changed
+_tables = {}
 
 def reset():
-    global _receivers, _called
+    global _receivers, _called, _tables
 
     _receivers.clear()
     _called.clear()
+    _tables.clear()
+
+def _clear_tables(topic):
+    for key in _tables.keys():
+        if key[0] == topic:
+            del _tables[key]
 
 def bind(topic, signal=None, kind=MIDDLE, nice=-1):
     """
@@ -47,7 +57,11 @@ def bind(topic, signal=None, kind=MIDDLE, nice=-1):
             func_name = func
             func = None
         _f = (n, {'func':func, 'signal':signal, 'func_name':func_name})
-        receivers.append(_f)
+        #keep receivers sorted by nice, and the same nice will be kept
+        #in binding order
+        i = bisect_right([x[0] for x in receivers], n)
+        receivers.insert(i, _f)
+        _clear_tables(topic)
         return func
     return f
 
@@ -61,24 +75,54 @@ def unbind(topic, func):
             nice, f = receivers[i]
             if (callable(func) and f['func'] == func) or (f['func_name'] == func):
                 del receivers[i]
+                _clear_tables(topic)
                 return
 
-def _test(kwargs, receiver):
-    signal = kwargs.get('signal', None)
-    f = receiver['func']
-    args = inspect.getargspec(f)[0]
-    if 'signal' not in args:
-        kwargs.pop('signal', None)
+def _match(receiver, signal):
     _signal = receiver.get('signal')
-    flag = True
     if _signal:
         if isinstance(_signal, (tuple, list)):
-            if signal not in _signal:
-                flag = False
-        elif _signal!=signal:
-            flag = False
-    return flag
-        
+            return signal in _signal
+        return _signal == signal
+    return True
+
+def _get_func(receiver):
+    _f = receiver['func']
+    if not _f:
+        try:
+            _f = import_attr(receiver['func_name'])
+        except (ImportError, AttributeError) as e:
+            logging.error("Can't import function %s" % receiver['func_name'])
+            raise
+        receiver['func'] = _f
+    if not callable(_f):
+        raise Exception("Dispatch point %r can't been invoked" % _f)
+    if 'pass_signal' not in receiver:
+        receiver['pass_signal'] = 'signal' in inspect.getargspec(_f)[0]
+    return _f
+
+def _get_table(topic, signal):
+    """
+    Get matched receivers of topic and signal, receivers are already sorted,
+    and functions are resolved and introspected only once
+    """
+    try:
+        key = (topic, signal)
+        table = _tables.get(key)
+    except TypeError:
+        #signal is not hashable, so it can't be cached
+        key = None
+        table = None
+    if table is None:
+        table = []
+        for nice, f in _receivers.get(topic, []):
+            if _match(f, signal):
+                _f = _get_func(f)
+                table.append((_f, f['pass_signal']))
+        if key is not None:
+            _tables[key] = table
+    return table
+
 def call(sender, topic, *args, **kwargs):
     """
     Invoke receiver functions according topic, it'll invoke receiver functions one by one,
@@ -87,35 +131,23 @@ def call(sender, topic, *args, **kwargs):
     """
     if not topic in _receivers:
         return
-    items = _receivers[topic]
-    def _cmp(x, y):
-        return cmp(x[0], y[0])
-    
-    items.sort(_cmp)
-    i = 0
-    while i<len(items):
-        nice, f = items[i]
-        i = i + 1
-        _f = f['func']
-        if not _f:
-            try:
-                _f = import_attr(f['func_name'])
-            except (ImportError, AttributeError) as e:
-                logging.error("Can't import function %s" % f['func_name'])
-                raise
-            f['func'] = _f
-        if callable(_f):
-            kw = kwargs.copy()
-            if not _test(kw, f):
-                continue
-            try:
-                _f(sender, *args, **kw)
-            except:
-                func = _f.__module__ + '.' + _f.__name__
-                logging.exception('Calling dispatch point [%s] %s(%r, %r) error!' % (topic, func, args, kw))
-                raise
-        else:
-            raise Exception, "Dispatch point [%s] %r can't been invoked" % (topic, _f)
+    signal = kwargs.get('signal', None)
+    table = _get_table(topic, signal)
+    if not table:
+        return
+    if 'signal' in kwargs:
+        kw_nosignal = kwargs.copy()
+        del kw_nosignal['signal']
+    else:
+        kw_nosignal = kwargs
+    for _f, pass_signal in table:
+        kw = kwargs if pass_signal else kw_nosignal
+        try:
+            _f(sender, *args, **kw)
+        except:
+            func = _f.__module__ + '.' + _f.__name__
+            logging.exception('Calling dispatch point [%s] %s(%r, %r) error!' % (topic, func, args, kw))
+            raise
         
 def call_once(sender, topic, *args, **kwargs):
     signal = kwargs.get('signal')
@@ -133,34 +165,25 @@ def get(sender, topic, *args, **kwargs):
     """
     if not topic in _receivers:
         return
-    items = _receivers[topic]
-    def _cmp(x, y):
-        return cmp(x[0], y[0])
-    
-    items.sort(_cmp)
-    for i in range(len(items)):
-        nice, f = items[i]
-        _f = f['func']
-        if not _f:
-            try:
-                _f = import_attr(f['func_name'])
-            except ImportError:
-                logging.error("Can't import function %s" % f['func_name'])
-                raise
-            f['func'] = _f
-        if callable(_f):
-            if not _test(kwargs, f):
-                continue
-            try:
-                v = _f(sender, *args, **kwargs)
-            except:
-                func = _f.__module__ + '.' + _f.__name__
-                logging.exception('Calling dispatch point [%s] %s(%r,%r) error!' % (topic, func, args, kwargs))
-                raise
-            if v is not None:
-                return v
-        else:
-            raise "Dispatch point [%s] %r can't been invoked" % (topic, _f)
+    signal = kwargs.get('signal', None)
+    table = _get_table(topic, signal)
+    if not table:
+        return
+    if 'signal' in kwargs:
+        kw_nosignal = kwargs.copy()
+        del kw_nosignal['signal']
+    else:
+        kw_nosignal = kwargs
+    for _f, pass_signal in table:
+        kw = kwargs if pass_signal else kw_nosignal
+        try:
+            v = _f(sender, *args, **kw)
+        except:
+            func = _f.__module__ + '.' + _f.__name__
+            logging.exception('Calling dispatch point [%s] %s(%r,%r) error!' % (topic, func, args, kw))
+            raise
+        if v is not None:
+            return v
 
 def get_once(sender, topic, *args, **kwargs):
     signal = kwargs.get('signal')
@@ -174,4 +197,4 @@ def get_once(sender, topic, *args, **kwargs):
 def print_topics():
     import pprint
     
-    pprint.pprint(_receivers)
\ No newline at end of file
+    pprint.pprint(_receivers)
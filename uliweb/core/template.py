@@ -28,6 +28,12 @@ import re
 import threading
 import shutil
 import warnings
+import marshal
+import tempfile
+import imp
+from hashlib import md5
+from types import FunctionType
+from collections import OrderedDict
 
 #################################
 # escape module
@@ -484,6 +490,57 @@ def register_node(name, node):
 
     __custom_nodes__[name] = node
 
+FLUSH_LINE = "_tt_flush()"
+FLUSH_CODE = "if _tt_buffer: yield _tt_utf8('').join(_tt_buffer); del _tt_buffer[:]"
+#flush point at the end of each loop, it only yields when enough pieces are
+#buffered, so a long table will not be yielded row by row
+FLUSH_LOOP_SIZE = 100
+FLUSH_LOOP_CODE = ("if len(_tt_buffer) >= %d: yield _tt_utf8('').join(_tt_buffer); "
+                   "del _tt_buffer[:]" % FLUSH_LOOP_SIZE)
+
+def _stream_code(text):
+    """
+    Flush points in `_tt_execute` (including the ones in nested statements)
+    will be changed to yield statements, and a flush point will be added at
+    the end of each loop body. Flush points in nested functions or classes
+    will be changed to `pass`, because `yield` will change a nested function
+    to generator
+    """
+    lines = []
+    #[indent, kind, has_body] of def, class and loop statements
+    blocks = []
+
+    def in_def():
+        return any(x[1] == 'def' for x in blocks)
+
+    def close_block():
+        indent, kind, has_body = blocks.pop()
+        if kind == 'loop' and has_body and not in_def():
+            lines.append(' ' * (indent + 4) + FLUSH_LOOP_CODE)
+
+    for line in text.splitlines():
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        if stripped and not stripped.startswith('#'):
+            while blocks and indent <= blocks[-1][0]:
+                close_block()
+            if blocks:
+                blocks[-1][2] = True
+            if indent > 0:
+                if stripped.startswith(('def ', 'class ')):
+                    blocks.append([indent, 'def', False])
+                elif stripped.startswith(('for ', 'while ')):
+                    blocks.append([indent, 'loop', False])
+        if stripped.startswith(FLUSH_LINE):
+            if in_def():
+                line = line[:indent] + 'pass'
+            else:
+                line = line[:indent] + FLUSH_CODE
+        lines.append(line)
+    while blocks:
+        close_block()
+    return '\n'.join(lines)
+
 def reindent(text, filename):
     new_lines=[]
     k=0
@@ -555,11 +612,14 @@ class Template(object):
         if compress_whitespace is None:
             compress_whitespace = name.endswith(".html") or \
                 name.endswith(".js")
+        self.compress_whitespace = compress_whitespace
         self.autoescape = None
         self.namespace = loader.namespace if loader else {}
         self.depends = {} #saving depends filenames such as extend, include, value is compile time
+        self.mtimes = {} #saving modified time of template file and depends files
+        self.source = None #(name, filename, layout) used to parse template loaded from disk cache
         reader = _TemplateReader(name, native_str(template_string))
-        self.file = _File(self, _parse(reader, self, begin_tag=self.begin_tag,
+        self._file = _File(self, _parse(reader, self, begin_tag=self.begin_tag,
                                        end_tag=self.end_tag, debug=self.debug,
                                        see=self.see))
         self.code = self._generate_python(loader, compress_whitespace)
@@ -581,39 +641,154 @@ class Template(object):
                 self.log.error("%s code:\n%s", self.name, formatted_code)
             raise
 
-    def generate(self, vars=None, env=None):
-        """Generate this template with the given arguments."""
-        def defined(v, default=None):
-            _v = default
-            if v in vars:
-                _v = vars[v]
-            elif v in env:
-                _v = env[v]
-            return _v
-
+    @classmethod
+    def from_cache(cls, data, loader):
+        """
+        Create template from the data saved in disk cache, the template
+        file will not be parsed until its syntax tree is used, for example
+        other template extends or includes it.
+        """
+        t = cls.__new__(cls)
+        (t.name, t.filename, t.has_links, t.depends, t.compiled_time,
+            t.code, t.compiled, t.mtimes, t.source) = data
+        t.begin_tag = loader.begin_tag
+        t.end_tag = loader.end_tag
+        t._compile = loader._compile
+        t.debug = loader.debug
+        t.see = loader.see
+        t.skip_extern = loader.skip_extern
+        t.log = loader.log
+        t.multilines = loader.multilines
+        t.comment = loader.comment
+        t.compress_whitespace = t.name.endswith(".html") or t.name.endswith(".js")
+        t.autoescape = None
+        t.namespace = loader.namespace
+        t.loader = loader
+        t._file = None
+        return t
+
+    @property
+    def file(self):
+        if self._file is None:
+            name, filename, layout = self.source
+            text, name, filename = self.loader._read_template(name, filename, layout)
+            reader = _TemplateReader(name, native_str(text))
+            self._file = _File(self, _parse(reader, self, begin_tag=self.begin_tag,
+                                            end_tag=self.end_tag, debug=self.debug,
+                                            see=self.see))
+        return self._file
+
+    def _get_execute(self, compiled=None, code=None):
+        """
+        Execute compiled code only once to get the code of `_tt_execute`,
+        and prepare the base namespace which will be copied for each render
+        """
+        code = code or self.code
         namespace = {
             # __name__ and __loader__ allow the traceback mechanism to find
             # the generated source code.
-            "defined": defined,
             #fix RuntimeWarning: Parent module 'a/b/c' not found while handling absolute import warning
             "__name__": self.name.replace('.', '_'),
             # "__name__": self.name,
-            "__loader__": ObjectDict(get_source=lambda name: self.code),
+            "__loader__": ObjectDict(get_source=lambda name: code),
         }
         namespace.update(default_namespace)
-        namespace.update(env or {})
-        namespace.update(self.namespace)
-        namespace.update(vars or {})
+        exec_in(compiled or self.compiled, namespace)
+        execute = namespace.pop("_tt_execute")
+        if not compiled:
+            self._execute = execute.__code__, namespace
+            return self._execute
+        return execute.__code__, namespace
+
+    def _get_stream_execute(self):
+        """
+        Generate and compile the streaming version of code, `_tt_execute` will
+        be a generator which yields the buffer after each block or include, and
+        in loops when enough pieces are buffered. If the template uses `{{use}}`,
+        `{{link}}` or `{{head}}`, the whole page should be merged at the end, so
+        it'll not be streamed, and the whole page will be yielded once.
+        """
+        execute = None
+        if not self.has_links:
+            depends = self.depends.copy()
+            try:
+                code = self._generate_python(self.loader, self.compress_whitespace,
+                                             stream=True)
+                compiled = self._compile(to_unicode(code), self.name, "exec",
+                                         dont_inherit=True)
+                execute = self._get_execute(compiled, code)
+            except Exception as e:
+                if self.log:
+                    self.log.exception(e)
+            finally:
+                self.depends = depends
+        #concurrent renders may check it, so it's only assigned once
+        self._stream_execute = execute
+        return execute
+
+    def _get_namespace(self, base, vars, env):
+        def defined(v, default=None):
+            _v = default
+            if vars and v in vars:
+                _v = vars[v]
+            elif env and v in env:
+                _v = env[v]
+            return _v
+
+        # function globals should be a real dict, so the layers are merged
+        # into a copy of the base namespace, the precedence is:
+        # vars > loader namespace > env > default namespace
+        namespace = base.copy()
+        namespace['defined'] = defined
+        if env:
+            namespace.update(env)
+        if self.namespace:
+            namespace.update(self.namespace)
+        if vars:
+            namespace.update(vars)
         namespace['_vars'] = vars
-        exec_in(self.compiled, namespace)
-        execute = namespace["_tt_execute"]
-        # Clear the traceback module's cache of source data now that
-        # we've generated a new template (mainly for this module's
-        # unittests, where different tests reuse the same name).
-        linecache.clearcache()
-        return execute()
-
-    def _generate_python(self, loader, compress_whitespace):
+        return namespace
+
+    def generate(self, vars=None, env=None):
+        """Generate this template with the given arguments."""
+        code, base = getattr(self, '_execute', None) or self._get_execute()
+        namespace = self._get_namespace(base, vars, env)
+        execute = FunctionType(code, namespace, '_tt_execute')
+        try:
+            return execute()
+        except Exception:
+            # The same template name may be reused by another generated code,
+            # so drop the stale source in linecache before traceback is formatted
+            linecache.cache.pop(self.name, None)
+            raise
+
+    def stream(self, vars=None, env=None):
+        """
+        Generate this template with the given arguments, and return an iterator
+        which yields chunks of the result after each top level block or include
+        """
+        if hasattr(self, '_stream_execute'):
+            _execute = self._stream_execute
+        else:
+            _execute = self._get_stream_execute()
+        if not _execute:
+            return iter([self.generate(vars, env)])
+
+        code, base = _execute
+        namespace = self._get_namespace(base, vars, env)
+        execute = FunctionType(code, namespace, '_tt_execute')
+        return self._stream(execute())
+
+    def _stream(self, result):
+        try:
+            for x in result:
+                if x:
+                    yield x
+        except Exception:
+            linecache.cache.pop(self.name, None)
+            raise
+
+    def _generate_python(self, loader, compress_whitespace, stream=False):
         buffer = StringIO()
         try:
             # named_blocks maps from names to _NamedBlock objects
@@ -623,13 +798,15 @@ class Template(object):
             for ancestor in ancestors:
                 ancestor.find_named_blocks(loader, named_blocks)
             writer = _CodeWriter(buffer, named_blocks, loader, ancestors[0].template,
-                                 compress_whitespace, comment=self.comment)
+                                 compress_whitespace, comment=self.comment,
+                                 stream=stream)
             ancestors[0].generate(writer, self.has_links)
             code =  buffer.getvalue()
             if self.multilines:
-                return reindent(code, self.filename)
-            else:
-                return code
+                code = reindent(code, self.filename)
+            if stream:
+                code = _stream_code(code)
+            return code
         finally:
             buffer.close()
 
@@ -656,18 +833,23 @@ class Template(object):
 
 class LRUTmplatesCacheDict(object):
     """ A dictionary-like object, supporting LRU caching semantics.
+    Keys are kept in an OrderedDict in access order, the least recently used
+    one is at the beginning, so each operation is O(1).
+    hits, misses and evictions are counted for monitoring, see `stats()`.
     """
 
     __slots__ = ['max_size', 'check_modified_time', '__values',
-                 '__access_keys', '__modified_times']
+                 '__modified_times', 'hits', 'misses', 'evictions']
 
     def __init__(self, max_size=None, check_modified_time=False):
         self.max_size = max_size
         self.check_modified_time = check_modified_time
 
-        self.__values = {}
-        self.__access_keys = []
+        self.__values = OrderedDict()
         self.__modified_times = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def __len__(self):
         return len(self.__values)
@@ -677,7 +859,6 @@ class LRUTmplatesCacheDict(object):
         Clears the dict.
         """
         self.__values.clear()
-        self.__access_keys = []
         self.__modified_times.clear()
 
     def has(self, key, mtime=None):
@@ -702,11 +883,6 @@ class LRUTmplatesCacheDict(object):
     def set(self, key, value, mtime=None):
         del self[key]
         self.__values[key] = value
-        try:
-            pos = self.__access_keys.remove(key)
-        except ValueError:
-            pass
-        self.__access_keys.insert(0, key)
         if self.check_modified_time:
             self.__modified_times[key] = mtime or os.path.getmtime(key)
         self.cleanup()
@@ -717,14 +893,18 @@ class LRUTmplatesCacheDict(object):
     def get(self, key, mtime=None):
         v = self.__values.get(key, None)
         if not v:
+            self.misses += 1
             return None
         if self.check_modified_time:
             mtime = mtime or os.path.getmtime(key)
             if mtime != self.__modified_times[key]:
                 del self[key]
+                self.misses += 1
                 return None
-        self.__access_keys.remove(key)
-        self.__access_keys.insert(0, key)
+        #move key to the end
+        del self.__values[key]
+        self.__values[key] = v
+        self.hits += 1
         return v
 
     def __getitem__(self, key):
@@ -733,21 +913,37 @@ class LRUTmplatesCacheDict(object):
     def __delitem__(self, key):
         if key in self.__values:
             del self.__values[key]
-            if self.check_modified_time:
-                del self.__modified_times[key]
-            self.__access_keys.remove(key)
+            self.__modified_times.pop(key, None)
 
     def cleanup(self):
         if not self.max_size: return
-        for i in range(len(self.__access_keys)-1, self.max_size, -1):
-            key = self.__access_keys.pop()
-            self.__delitem__(key)
+        while len(self.__values) > self.max_size:
+            key, v = self.__values.popitem(last=False)
+            self.__modified_times.pop(key, None)
+            self.evictions += 1
 
     def keys(self):
-        return self.__values.keys()
+        """
+        Return keys, the most recently used one is the first
+        """
+        return list(reversed(self.__values))
+
+    def stats(self):
+        return {'size':len(self.__values), 'max_size':self.max_size,
+                'hits':self.hits, 'misses':self.misses,
+                'evictions':self.evictions}
 
 r_extend = re.compile(r'(\s*#.*?)?\{\{extend[s]?\s\S+\s*\}\}', re.DOTALL)
 
+#used to check if the disk cache file is created by the same version
+CACHE_VERSION = 1
+
+def _getmtime(filename):
+    try:
+        return os.path.getmtime(filename)
+    except OSError:
+        return None
+
 class Loader(object):
     """A template loader that loads from a single root directory.
     """
@@ -755,12 +951,31 @@ class Loader(object):
                  tmp_dir='tmp/templates_temp', begin_tag=BEGIN_TAG,
                  end_tag=END_TAG, debug=False, see=None, max_size=None,
                  _compile=None, check_modified_time=False, skip_extern=False,
-                 log=None, multilines=False, comment=True, taglibs_loader=None):
+                 log=None, multilines=False, comment=True, taglibs_loader=None,
+                 index_mode=None, poll_interval=1):
+        """
+        :param index_mode: template path index mode, it can be:
+            None: template path is searched in dirs for each loading
+            'static': template files under dirs are indexed once, and resolved
+                paths are cached forever, modified time of template files will
+                not be checked either, so there is no syscall once a template
+                is cached, it's suitable for production
+            'poll': like 'static', but the index and resolved paths will be
+                refreshed when any directory in dirs is changed, directories
+                are checked at most once per `poll_interval` seconds, it's
+                suitable for development
+        """
         self.dirs = dirs
         self.namespace = namespace or {}
         self.cache = cache
         self.use_tmp = use_tmp
         self.tmp_dir = tmp_dir
+        if index_mode not in (None, 'static', 'poll'):
+            raise ValueError("index_mode should be None, 'static' or 'poll', but %r found" % index_mode)
+        self.index_mode = index_mode
+        self.poll_interval = poll_interval
+        if index_mode == 'static':
+            check_modified_time = False
         self.check_modified_time = check_modified_time
         self.templates = LRUTmplatesCacheDict(max_size=max_size,
                         check_modified_time=check_modified_time)
@@ -781,15 +996,60 @@ class Loader(object):
             if not os.path.exists(self.tmp_dir):
                 os.makedirs(self.tmp_dir)
 
+        #init template path index
+        self._index = None
+        self._resolved = {}
+        self._dirs_mtimes = {}
+        self._checked_time = 0
+        if self.index_mode:
+            self.refresh_index()
+
+    def refresh_index(self):
+        """
+        Walk through template dirs and build template path index, the key is
+        the relative filename and the value is the list of full filenames
+        in the order of dirs
+        """
+        index = {}
+        mtimes = {}
+        for d in self.dirs or []:
+            d = os.path.normpath(d)
+            for root, dirs, files in os.walk(d, followlinks=True):
+                mtimes[root] = _getmtime(root)
+                for name in files:
+                    _f = os.path.join(root, name)
+                    index.setdefault(os.path.relpath(_f, d), []).append(_f)
+        self._index = index
+        self._dirs_mtimes = mtimes
+        self._resolved = {}
+        self._checked_time = time()
+
+    def _check_index(self):
+        """
+        Refresh the index if any directory is changed in 'poll' mode
+        """
+        if self.index_mode != 'poll':
+            return
+        now = time()
+        if now - self._checked_time < self.poll_interval:
+            return
+        self._checked_time = now
+        for d, mtime in self._dirs_mtimes.items():
+            if _getmtime(d) != mtime:
+                self.refresh_index()
+                return
 
     def reset(self):
         """Resets the cache of compiled templates."""
         with self.lock:
             if self.cache:
+                self.templates.clear()
                 if self.use_tmp:
                     shutil.rmtree(self.tmp_dir, ignore_errors=True)
-                else:
-                    self.templates = {}
+                    if not os.path.exists(self.tmp_dir):
+                        os.makedirs(self.tmp_dir)
+            if self.index_mode:
+                self.refresh_index()
 
     def load(self, name, skip='', skip_original='', default_template=None, layout=None):
         """Loads a template."""
@@ -802,30 +1062,31 @@ class Loader(object):
         with self.lock:
             if layout:
                 _filename = filename + '.' + layout
-                mtime = os.path.getmtime(filename)
+                mtime = os.path.getmtime(filename) if self.check_modified_time else None
             else:
                 mtime = None
                 _filename = filename
 
             if self.cache:
-                if not self.use_tmp:
-                    #check current template file expiration
-                    t = self.templates.get(_filename, mtime=mtime)
-                    if t:
-                        #check depends tempaltes expiration
-                        check = self.check_expiration(t)
-                        if not check:
-                            return t
-                else:
+                #check current template file expiration
+                t = self.templates.get(_filename, mtime=mtime)
+                if t:
+                    #check depends tempaltes expiration
+                    check = self.check_expiration(t)
+                    if not check:
+                        return t
+                if self.use_tmp:
                     #get cached file from disk
-                    pass
+                    t = self._load_temp_template(_filename)
+                    if t:
+                        self.templates.set(_filename, t, mtime)
+                        return t
             t = self._create_template(name, filename, layout=layout)
             if self.cache:
-                if not self.use_tmp:
-                    self.templates.set(_filename, t, mtime)
-                else:
+                self.templates.set(_filename, t, mtime)
+                if self.use_tmp:
                     #save cached file to disk
-                    pass
+                    self._save_temp_template(_filename, t)
 
             return t
 
@@ -835,7 +1096,28 @@ class Loader(object):
         Fetch the template filename according dirs
         :para skip: if the searched filename equals skip, then using the one before.
         """
+        if not self.index_mode:
+            return self._resolve_path(filename, skip, skip_original, default_template)
+
+        self._check_index()
+        if isinstance(default_template, list):
+            default_template = tuple(default_template)
+        key = (filename, skip, skip_original, default_template)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            f = self._resolve_path(filename, skip, skip_original, default_template)
+            self._resolved[key] = f
+            return f
+
+    def _resolve_path(self, filename, skip='', skip_original='',
+                     default_template=None):
+        index = self._index
         def _file(filename, dirs):
+            if index is not None:
+                for _f in index.get(filename, []):
+                    yield _f
+                raise StopIteration
             for d in dirs:
                 _f = os.path.normpath(os.path.join(d, filename))
                 if os.path.exists(_f):
@@ -866,7 +1148,7 @@ class Loader(object):
             if not isinstance(default_template, (tuple, list)):
                 default_template = [default_template]
             for x in default_template:
-                filename = self.resolve_path(x)
+                filename = self._resolve_path(x)
                 if filename:
                     return filename
 
@@ -875,39 +1157,103 @@ class Loader(object):
 
         return parse(text, loader=self.taglibs_loader)
 
-    def _create_template(self, name, filename, _compile=None, see=None, layout=None):
+    def _read_template(self, name, filename, layout=None):
+        """
+        Read template text and process tags and layout,
+        return (text, name, filename)
+        """
         if not os.path.exists(filename):
             raise ParseError("The file %s is not existed." % filename)
 
         with open(filename, 'rb') as f:
             text = f.read()
 
-            #add tag convert support 2015/11/21 limodou
-            text = self._process_tags(text)
+        #add tag convert support 2015/11/21 limodou
+        text = self._process_tags(text)
 
-            #if layout is not empty and there is no {{extend}} exsited
-            if layout:
-                if not r_extend.match(text):
-                    text = ('{{extend "%s"}}\n' % layout) + text
-                    name = name + '.' + layout
-                    filename = filename + '.' + layout
-
-            template = Template(text, name=name, loader=self,
-                                begin_tag=self.begin_tag, end_tag=self.end_tag,
-                                debug=self.debug, see=self.see,
-                                filename=filename, _compile=self._compile,
-                                skip_extern=self.skip_extern, log=self.log,
-                                multilines=self.multilines,
-                                comment=self.comment)
+        #if layout is not empty and there is no {{extend}} exsited
+        if layout:
+            if not r_extend.match(text):
+                text = ('{{extend "%s"}}\n' % layout) + text
+                name = name + '.' + layout
+                filename = filename + '.' + layout
+        return text, name, filename
+
+    def _create_template(self, name, filename, _compile=None, see=None, layout=None):
+        source = (name, filename, layout)
+        text, name, _filename = self._read_template(name, filename, layout)
+        template = Template(text, name=name, loader=self,
+                            begin_tag=self.begin_tag, end_tag=self.end_tag,
+                            debug=self.debug, see=self.see,
+                            filename=_filename, _compile=self._compile,
+                            skip_extern=self.skip_extern, log=self.log,
+                            multilines=self.multilines,
+                            comment=self.comment)
+        template.source = source
+        for f in [filename] + list(template.depends.keys()):
+            template.mtimes[f] = _getmtime(f)
         return template
 
     def _get_temp_template(self, filename):
-        f, filename = os.path.splitdrive(filename)
-        filename = filename.replace('\\', '_')
-        filename = filename.replace('/', '_')
-        f, ext = os.path.splitext(filename)
-        filename = f + '.py'
-        return os.path.normpath(os.path.join(self.tmp_dir, filename))
+        """
+        Get disk cache filename of a template, the options which will
+        change the generated code are also used as the key
+        """
+        key = '|'.join([filename, self.begin_tag, self.end_tag,
+                        repr(self.debug), repr(self.multilines),
+                        repr(self.comment), repr(self.skip_extern)])
+        f = os.path.basename(filename)
+        return os.path.join(self.tmp_dir, '%s.%s.cache' % (f, md5(utf8(key)).hexdigest()))
+
+    def _load_temp_template(self, filename):
+        """
+        Load compiled template from disk cache, if the cache file is not
+        existed or the template file or any depends file are changed,
+        None will be returned
+        """
+        cache_file = self._get_temp_template(filename)
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                version, magic, data = marshal.loads(f.read())
+            if version != CACHE_VERSION or magic != imp.get_magic():
+                return None
+            mtimes = data[7]
+            for f, mtime in mtimes.items():
+                if mtime is None or _getmtime(f) != mtime:
+                    return None
+            return Template.from_cache(data, self)
+        except Exception as e:
+            if self.log:
+                self.log.exception(e)
+            return None
+
+    def _save_temp_template(self, filename, template):
+        """
+        Save compiled template to disk cache, it'll write a temp file first
+        and then rename it, so other processes will not read a partial file
+        """
+        if None in template.mtimes.values():
+            return
+        data = (template.name, template.filename, template.has_links,
+                template.depends, template.compiled_time, template.code,
+                template.compiled, template.mtimes, template.source)
+        cache_file = self._get_temp_template(filename)
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=self.tmp_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(marshal.dumps((CACHE_VERSION, imp.get_magic(), data)))
+            try:
+                os.rename(tmp_file, cache_file)
+            except OSError:
+                #windows can't rename to an existed file
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+                os.rename(tmp_file, cache_file)
+        except Exception as e:
+            if self.log:
+                self.log.exception(e)
 
     def find_templates(self, filename):
         files = []
@@ -925,8 +1271,20 @@ class Loader(object):
         for f, compiled_time in template.depends.items():
             t = self.templates.get(f)
             if not t:
-                return f
+                #depends template is not in memory, for example the template
+                #is loaded from disk cache, then check the file modified time
+                mtime = template.mtimes.get(f)
+                if mtime is None:
+                    return f
+                if self.check_modified_time and _getmtime(f) != mtime:
+                    return f
+                continue
             if compiled_time != t.compiled_time:
+                #templates from disk cache may be compiled in other process,
+                #so the modified time of the same file is compared
+                if self.use_tmp and t.mtimes.get(f) is not None and \
+                        t.mtimes.get(f) == template.mtimes.get(f):
+                    continue
                 return f
             # t = self.load(f)
             # x = self.check_expiration(t)
@@ -1092,6 +1450,8 @@ class _File(_Node):
             self.body.generate(writer)
             if has_links:
                 writer.write_line("return _tag_htmlmerge(_tt_utf8('').join(_tt_buffer), _tt_links)", self.line)
+            elif writer.stream:
+                writer.write_line("yield _tt_utf8('').join(_tt_buffer)", self.line)
             else:
                 writer.write_line("return _tt_utf8('').join(_tt_buffer)", self.line)
 
@@ -1129,6 +1489,7 @@ class _NamedBlock(_Node):
             block.body.generate(writer)
         if self.template.debug:
             writer.write_line('_tt_append("<!-- END %s -->")' % self.name, self.line)
+        writer.write_flush(self.line)
 
     def find_named_blocks(self, loader, named_blocks):
         named_blocks[self.name] = self
@@ -1173,6 +1534,7 @@ class _IncludeBlock(_Node):
         included = writer.loader.load(self.name, self.template_name)
         with writer.include(included, self.line):
             included.file.body.generate(writer)
+        writer.write_flush(self.line)
 
 
 class _ApplyBlock(_Node):
@@ -1351,8 +1713,9 @@ class ParseError(Exception):
 
 class _CodeWriter(object):
     def __init__(self, file, named_blocks, loader, current_template,
-                 compress_whitespace, comment=False):
+                 compress_whitespace, comment=False, stream=False):
         self.file = file
+        self.stream = stream
         self.named_blocks = named_blocks
         self.loader = loader
         self.current_template = current_template
@@ -1403,6 +1766,14 @@ class _CodeWriter(object):
             line_comment = ''
         print("    " * indent + line + line_comment, file=self.file)
 
+    def write_flush(self, line_number):
+        """
+        Write flush point for streaming, it'll be changed to yield statement
+        by `_stream_code()` if it's not in a nested function of `_tt_execute`
+        """
+        if self.stream:
+            self.write_line(FLUSH_LINE, line_number)
+
 
 class _TemplateReader(object):
     def __init__(self, name, text):
@@ -24,11 +24,12 @@ __all__ = ['Field', 'get_connection', 'Model', 'do_',
     'ModelInstanceError', 'KindError', 'ConfigurationError', 'SaveError',
     'BadPropertyTypeError', 'set_lazy_model_init',
     'begin_sql_monitor', 'close_sql_monitor', 'set_model_config', 'text',
+    'begin_sql_profiler', 'end_sql_profiler', 'get_sql_profiler',
     'get_object', 'get_cached_object',
     'set_server_default', 'set_nullable', 'set_manytomany_index_reverse',
     'NotFound', 'reflect_table', 'reflect_table_data', 'reflect_table_model',
     'get_field_type', 'create_model', 'get_metadata', 'migrate_tables',
-    'print_model', 'get_model_property', 'Bulk',
+    'print_model', 'get_model_property', 'Bulk', 'Record',
     ]
 
 __auto_create__ = False
@@ -49,6 +50,12 @@ __nullable__ = False    #not enabled null by default
 __server_default__ = False    #not enabled null by default
 __manytomany_index_reverse__ = False
 __lazy_model_init__ = False  
+__prefetch_batch_size__ = 1000 #rows and keys number of each prefetch IN query
+__iterator_chunk_size__ = 1000 #rows number of each fetchmany of Result.iterator
+__bulk_batch_size__ = 1000 #objects number of each bulk_create/bulk_update statement
+__identity_map__ = False #enable identity map of Session by default
+__lazy_transaction__ = False #begin transaction at the first query but not Session.begin
+__pool_metrics__ = False #collect connection pool metrics of engines by default
 
 import sys
 import decimal
@@ -56,12 +63,19 @@ import threading
 import datetime
 import copy
 import re
+import operator
+import itertools
+import bisect
+import time
 import cPickle as pickle
 from uliweb.utils import date as _date
 from uliweb.utils.common import (flat_list, classonlymethod, simple_value, 
     safe_str, import_attr)
 from sqlalchemy import *
 from sqlalchemy.sql import select, ColumnElement, text, true, and_, false
+from sqlalchemy.sql.expression import BinaryExpression, BindParameter, Select
+from sqlalchemy.sql import operators
+from sqlalchemy.engine.interfaces import Compiled
 from sqlalchemy.pool import NullPool
 import sqlalchemy.engine.base as EngineBase
 from uliweb.core import dispatch
@@ -77,6 +91,7 @@ Local.conn = {}
 Local.trans = {}
 Local.echo = False
 Local.echo_func = sys.stdout.write
+Local.profiler = None
 
 class Error(Exception):pass
 class NotFound(Error):
@@ -168,6 +183,18 @@ def set_lazy_model_init(flag):
     global __lazy_model_init__
     __lazy_model_init__ = flag
     
+def set_identity_map(flag):
+    global __identity_map__
+    __identity_map__ = flag
+    
+def set_lazy_transaction(flag):
+    global __lazy_transaction__
+    __lazy_transaction__ = flag
+    
+def set_pool_metrics(flag):
+    global __pool_metrics__
+    __pool_metrics__ = flag
+    
 def get_tablename(tablename):
     global __default_tablename_converter__
     
@@ -216,11 +243,17 @@ class NamedEngine(object):
             'debug_log':None,
             'connection_type':'long',
             'duplication':False,
+            'replicas':[],
+            'replica_policy':'round_robin',
+            'replica_policy_args':{},
+            'pool_metrics':None,
             })
         strategy = options.pop('strategy', None)
         d.update(options)
         if d.get('debug_log', None) is None:
             d['debug_log'] = __debug_query__
+        if d.get('pool_metrics', None) is None:
+            d['pool_metrics'] = __pool_metrics__
         if d.get('connection_type') == 'short':
             d['connection_args']['poolclass'] = NullPool
         if strategy:
@@ -231,6 +264,8 @@ class NamedEngine(object):
         self.metadata = MetaData()
         self._models = {}
         self.local = threading.local() #used to save thread vars
+        self._replica_policy = None
+        self.metrics = None
         
         self._create()
 
@@ -249,6 +284,9 @@ class NamedEngine(object):
         if not self.engine_instance or new:
             args = c.get('connection_args', {})
             self.engine_instance = create_engine(c.get('connection_string'), **args)
+            if c.pool_metrics:
+                self.metrics = PoolMetrics()
+                self.metrics.listen(self.engine_instance.pool)
         self.engine_instance.echo = c['debug_log']
         self.engine_instance.metadata = self.metadata
         self.metadata.bind = self.engine_instance
@@ -274,6 +312,23 @@ class NamedEngine(object):
     def engine(self):
         return self.engine_instance
     
+    @property
+    def replicas(self):
+        return self.options.replicas
+    
+    def get_replica(self):
+        """
+        Choose a replica engine by replica policy, None means there is no
+        available replica, and the primary engine should be used
+        """
+        if not self.options.replicas:
+            return None
+        if self._replica_policy is None:
+            self._replica_policy = get_replica_policy(self.options.replica_policy,
+                                                      self.options.replica_policy_args)
+        replicas = [engine_manager[x] for x in self.options.replicas]
+        return self._replica_policy.choose(self, replicas)
+    
     def print_pool_status(self):
         if self.engine.pool:
             print self.engine.pool.status()
@@ -308,17 +363,404 @@ class EngineManager(object):
     
 engine_manager = EngineManager()
 
+class Histogram(object):
+    """
+    Histogram of seconds, counts[i] is the number of values which are not
+    more than buckets[i] and more than buckets[i-1], the last one is +Inf
+    """
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+    
+    def __init__(self, buckets=None):
+        if buckets:
+            self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            
+    def to_dict(self):
+        with self.lock:
+            return {'buckets':list(self.buckets), 'counts':list(self.counts),
+                'sum':self.sum, 'count':self.count}
+    
+class PoolMetrics(object):
+    """
+    Connection pool metrics of an engine, they are collected by pool events,
+    and checkout wait time and timeouts are collected by Session.connection.
+    Call snapshot() to get the values. Events are fired from many threads,
+    so counters are changed by incr() with the lock held.
+    """
+    def __init__(self, buckets=None):
+        self.pool = None
+        self.lock = threading.Lock()
+        #created time of open connections, keyed by id of dbapi connection
+        self.connections = {}
+        self.created = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.wait = Histogram(buckets)
+        self.held = Histogram(buckets)
+        self.lifetime = Histogram(buckets)
+        
+    def listen(self, pool):
+        from sqlalchemy import event
+        
+        self.pool = pool
+        event.listen(pool, 'connect', self.on_connect)
+        event.listen(pool, 'checkout', self.on_checkout)
+        event.listen(pool, 'checkin', self.on_checkin)
+        event.listen(pool, 'invalidate', self.on_invalidate)
+        self.wrap(pool)
+        
+    def wrap(self, pool):
+        """
+        Connections closed normally (overflow, recycle, dispose, NullPool) have
+        no pool event before sqlalchemy 1.1, so _close_connection is wrapped to
+        record the lifetime. engine.dispose() replaces the pool by recreate(),
+        the events are kept by the new pool, but it should be wrapped again.
+        """
+        close_connection = pool._close_connection
+        recreate = pool.recreate
+        
+        def _close_connection(connection):
+            self.on_close(connection)
+            return close_connection(connection)
+        
+        def _recreate():
+            new_pool = recreate()
+            self.pool = new_pool
+            self.wrap(new_pool)
+            return new_pool
+        
+        pool._close_connection = _close_connection
+        pool.recreate = _recreate
+        
+    def incr(self, **kwargs):
+        with self.lock:
+            for k, v in kwargs.items():
+                setattr(self, k, getattr(self, k) + v)
+        
+    def on_connect(self, dbapi_connection, connection_record):
+        self.incr(created=1)
+        self.connections[id(dbapi_connection)] = time.time()
+        
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.incr(checkouts=1, checked_out=1)
+        connection_record.info['_checkout_at'] = time.time()
+        
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.incr(checked_out=-1)
+        if connection_record is not None:
+            t = connection_record.info.pop('_checkout_at', None)
+            if t is not None:
+                self.held.observe(time.time() - t)
+                
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        #the connection will be closed by pool, and the lifetime is recorded then
+        self.incr(invalidated=1)
+        
+    def on_close(self, dbapi_connection):
+        t = self.connections.pop(id(dbapi_connection), None)
+        if t is not None:
+            self.lifetime.observe(time.time() - t)
+            
+    def connect(self, engine):
+        """
+        Check out a connection from engine and record the wait time
+        """
+        from sqlalchemy.exc import TimeoutError
+        
+        b = time.time()
+        try:
+            return engine.connect()
+        except TimeoutError:
+            self.incr(timeouts=1)
+            raise
+        finally:
+            self.wait.observe(time.time() - b)
+            
+    def snapshot(self):
+        def _get(name):
+            f = getattr(self.pool, name, None)
+            if f:
+                return f()
+            
+        overflow = _get('overflow')
+        with self.lock:
+            counters = {
+                'checked_out':self.checked_out,
+                'connections_created':self.created,
+                'checkouts':self.checkouts,
+                'checkout_timeouts':self.timeouts,
+                'invalidated':self.invalidated,
+            }
+        return dict(counters, **{
+            'pool_size':_get('size'),
+            'idle':_get('checkedin'),
+            'overflow':max(overflow, 0) if overflow is not None else None,
+            'checkout_wait_seconds':self.wait.to_dict(),
+            'checkout_held_seconds':self.held.to_dict(),
+            'connection_lifetime_seconds':self.lifetime.to_dict(),
+        })
+    
+def get_pool_metrics():
+    """
+    Return {engine_name:metrics} of engines which enable pool_metrics
+    """
+    return dict((k, v.metrics.snapshot()) for k, v in engine_manager.items()
+        if v.metrics is not None)
+
+class MetricsExporter(object):
+    """
+    Export metrics of get_pool_metrics() to text of content_type
+    """
+    content_type = 'text/plain'
+    
+    def export(self, metrics):
+        raise NotImplementedError
+    
+class JsonExporter(MetricsExporter):
+    content_type = 'application/json'
+    
+    def export(self, metrics):
+        import json
+        return json.dumps(metrics)
+    
+class PrometheusExporter(MetricsExporter):
+    content_type = 'text/plain; version=0.0.4'
+    
+    metrics = [
+        ('pool_size', 'gauge', 'Size of connection pool'),
+        ('checked_out', 'gauge', 'Connections checked out from pool'),
+        ('idle', 'gauge', 'Idle connections in pool'),
+        ('overflow', 'gauge', 'Overflow connections of pool'),
+        ('connections_created', 'counter', 'Connections created by pool'),
+        ('checkouts', 'counter', 'Connection checkouts'),
+        ('checkout_timeouts', 'counter', 'Connection checkouts which are timeout'),
+        ('invalidated', 'counter', 'Invalidated connections'),
+        ('checkout_wait_seconds', 'histogram', 'Seconds waited to check out a connection'),
+        ('checkout_held_seconds', 'histogram', 'Seconds a connection is held until checked in'),
+        ('connection_lifetime_seconds', 'histogram', 'Seconds a connection lived until invalidated'),
+    ]
+    
+    def __init__(self, prefix='uliweb_db_pool_'):
+        self.prefix = prefix
+        
+    def export(self, metrics):
+        lines = []
+        for name, _type, _help in self.metrics:
+            key = self.prefix + name
+            lines.append('# HELP %s %s' % (key, _help))
+            lines.append('# TYPE %s %s' % (key, _type))
+            for engine_name, values in sorted(metrics.items()):
+                v = values.get(name)
+                if v is None:
+                    continue
+                label = 'engine="%s"' % engine_name
+                if _type == 'histogram':
+                    n = 0
+                    for le, c in zip(v['buckets'] + ['+Inf'], v['counts']):
+                        n += c
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (key, label, le, n))
+                    lines.append('%s_sum{%s} %r' % (key, label, v['sum']))
+                    lines.append('%s_count{%s} %d' % (key, label, v['count']))
+                else:
+                    lines.append('%s{%s} %d' % (key, label, v))
+        return '\n'.join(lines) + '\n'
+    
+metrics_exporters = {
+    'prometheus':PrometheusExporter,
+    'json':JsonExporter,
+}
+
+def get_metrics_exporter(exporter='prometheus'):
+    """
+    exporter can be a MetricsExporter instance, a name of metrics_exporters,
+    or an import path or a class of exporter
+    """
+    if isinstance(exporter, MetricsExporter):
+        return exporter
+    if isinstance(exporter, (str, unicode)):
+        if exporter in metrics_exporters:
+            exporter = metrics_exporters[exporter]
+        else:
+            exporter = import_attr(exporter)
+    return exporter()
+
+class ReplicaPolicy(object):
+    """
+    Choose a replica for read queries, choose() should return one of
+    replicas or None if there is no available replica
+    """
+    def __init__(self, **kwargs):
+        pass
+    
+    def choose(self, engine, replicas):
+        raise NotImplementedError
+    
+class RoundRobinPolicy(ReplicaPolicy):
+    def __init__(self, **kwargs):
+        self.counter = itertools.count()
+        
+    def choose(self, engine, replicas):
+        return replicas[next(self.counter) % len(replicas)]
+    
+class LeastConnectionsPolicy(ReplicaPolicy):
+    """
+    Choose the replica which has the least checked out connections
+    """
+    def choose(self, engine, replicas):
+        return min(replicas, key=self.checkedout)
+    
+    @staticmethod
+    def checkedout(engine):
+        f = getattr(engine.engine.pool, 'checkedout', None)
+        return f() if f else 0
+    
+def get_replica_lag(engine):
+    """
+    Return replication lag seconds of a replica engine, None means the
+    replica is not replicating. Only postgresql and mysql are supported,
+    the lag of other databases is treated as 0
+    """
+    name = engine.engine.dialect.name
+    conn = engine.engine.connect()
+    try:
+        if name == 'postgresql':
+            return conn.execute(text("SELECT CASE WHEN pg_last_xact_replay_timestamp() IS NULL THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")).scalar()
+        elif name == 'mysql':
+            row = conn.execute('SHOW SLAVE STATUS').fetchone()
+            return row['Seconds_Behind_Master'] if row else None
+        return 0
+    finally:
+        conn.close()
+        
+class LagAwarePolicy(RoundRobinPolicy):
+    """
+    Round robin in replicas whose lag is not more than max_lag seconds,
+    lag is checked by lag_func (default is get_replica_lag) every interval
+    seconds, if all replicas lag behind, the primary will be used
+    """
+    def __init__(self, max_lag=10, interval=5, lag_func=None, **kwargs):
+        super(LagAwarePolicy, self).__init__(**kwargs)
+        self.max_lag = max_lag
+        self.interval = interval
+        if isinstance(lag_func, (str, unicode)):
+            lag_func = import_attr(lag_func)
+        self.lag_func = lag_func or get_replica_lag
+        self.lags = {}
+        
+    def get_lag(self, engine):
+        import logging
+        
+        now = time.time()
+        t, lag = self.lags.get(engine.name, (0, None))
+        if now - t >= self.interval:
+            try:
+                lag = self.lag_func(engine)
+            except Exception:
+                logging.getLogger(__name__).exception("Get lag of replica %s error" % engine.name)
+                lag = None
+            self.lags[engine.name] = (now, lag)
+        return lag
+    
+    def choose(self, engine, replicas):
+        replicas = [x for x in replicas if self.get_lag(x) is not None 
+                    and self.get_lag(x) <= self.max_lag]
+        if replicas:
+            return super(LagAwarePolicy, self).choose(engine, replicas)
+    
+replica_policies = {
+    'round_robin':RoundRobinPolicy,
+    'least_connections':LeastConnectionsPolicy,
+    'lag_aware':LagAwarePolicy,
+}
+
+def get_replica_policy(policy, args=None):
+    """
+    policy can be a ReplicaPolicy instance, a name of replica_policies, or
+    an import path or a class of policy
+    """
+    if isinstance(policy, ReplicaPolicy):
+        return policy
+    if isinstance(policy, (str, unicode)):
+        if policy in replica_policies:
+            policy = replica_policies[policy]
+        else:
+            policy = import_attr(policy)
+    return policy(**(args or {}))
+
+class LazyTransaction(object):
+    """
+    Returned by Session.begin() of lazy transaction, it can be used just like
+    the transaction of connection. It'll delegate to the real transaction
+    after the first query, or only cancel the pending transaction if the
+    session never touched database
+    """
+    def __init__(self, session):
+        self.session = session
+        self._trans = None
+        self._done = False
+        
+    @property
+    def transaction(self):
+        if not self._trans and not self._done:
+            self._trans = self.session._trans
+        return self._trans
+    
+    @property
+    def is_active(self):
+        if self.transaction:
+            return self.transaction.is_active
+        return not self._done and self.session._pending_trans
+    
+    def commit(self):
+        self._end('commit')
+        
+    def rollback(self):
+        self._end('rollback')
+        
+    def close(self):
+        self._end('close')
+        
+    def _end(self, method):
+        if self.transaction:
+            getattr(self.transaction, method)()
+        elif not self._done:
+            self.session._pending_trans = False
+        self._done = True
+        
 class Session(object):
     """
     used to manage relationship between engine_name and connect
     can also manage transcation
     """
     def __init__(self, engine_name=None, auto_transaction=None,
-        auto_close=True, post_commit=None, post_commit_once=None):
+        auto_close=True, post_commit=None, post_commit_once=None,
+        identity_map=None, lazy_transaction=None):
         """
         If auto_transaction is True, it'll automatically start transacation
         in web environment, it'll be commit or rollback after the request finished
         and in no-web environment, you should invoke commit or rollback yourself.
+        
+        If identity_map is True, objects loaded by primary key will be kept
+        in session, and the same object will be returned until it's changed
+        or the transaction is finished, default is __identity_map__
+        
+        If lazy_transaction is True, begin() will not check out a connection,
+        the real BEGIN will be executed at the first query, and commit or
+        rollback of the session which doesn't touch database will do nothing,
+        default is __lazy_transaction__
         """
         self.engine_name = engine_name or __default_engine__
         self.auto_transaction = auto_transaction
@@ -326,7 +768,13 @@ class Session(object):
         self.engine = engine_manager[engine_name]
         self._conn = None
         self._trans = None
+        self._pending_trans = False
+        self._implicit_trans = False
+        self._written = False
         self.local_cache = {}
+        self.identity_map = identity_map
+        self.lazy_transaction = lazy_transaction
+        self.identities = {}
         self.post_commit = post_commit or []
         self.post_commit_once = post_commit_once or []
 
@@ -351,17 +799,25 @@ class Session(object):
             
     @property
     def connection(self):
-        if self._conn:
-            return self._conn
-        else:
-            self._conn = self.engine.engine.connect()
-            return self._conn
+        if not self._conn:
+            if self.engine.metrics is not None:
+                self._conn = self.engine.metrics.connect(self.engine.engine)
+            else:
+                self._conn = self.engine.engine.connect()
+        #begin the lazy transaction when connection is used at first
+        if self._pending_trans:
+            self._pending_trans = False
+            self._trans = self._conn.begin()
+        return self._conn
         
     def execute(self, query, *args):
         t = self.need_transaction
         try:
             if t:
-                self.begin()
+                self.begin(implicit=True)
+            #reads of the request will stick to primary after writing
+            if self.engine.replicas and not self._written and not is_read_query(query):
+                self._written = True
             return self.connection.execute(query, *args)
         except:
             if t:
@@ -378,16 +834,74 @@ class Session(object):
         
         return do_(query, self, args)
     
-    def begin(self):
+    def begin(self, lazy=None, implicit=False):
+        """
+        If lazy is True(default is use_lazy_transaction) and there is no
+        connection yet, it'll only mark the transaction, the real BEGIN will
+        be executed when the connection is used. In this case a LazyTransaction
+        will be returned instead of the transaction of connection
+        
+        If implicit is True, the transaction is not started by user code
+        (e.g. by TransactionMiddle), so reads can still be routed to replicas
+        until the first write. Calling begin() without implicit marks the
+        current transaction as explicit
+        """
+        if not self._trans and not self._pending_trans:
+            self._implicit_trans = implicit
+        elif not implicit:
+            self._implicit_trans = False
         if not self._trans:
-            self.connection
-            self._trans = self._conn.begin()
+            if lazy is None:
+                lazy = self.use_lazy_transaction
+            if lazy and not self._conn:
+                self._pending_trans = True
+                return LazyTransaction(self)
+            else:
+                self._pending_trans = False
+                self._trans = self.connection.begin()
         return self._trans
     
+    def get_read_session(self, query=None):
+        """
+        Return the session of a replica for read query if the engine has
+        replicas. The session itself will be returned if query is not a read,
+        or it's in an explicit transaction (including the pending lazy one),
+        or there were writes after reset_read_routing()
+        """
+        in_trans = (self._trans or self._pending_trans) and not self._implicit_trans
+        if (not self.engine.replicas or self._written or in_trans
+                or (query is not None and not is_read_query(query))):
+            return self
+        replica = self.engine.get_replica()
+        if replica is None:
+            return self
+        return replica.session()
+    
+    def _end_written(self):
+        """
+        In web environment reads stick to primary after a write until the
+        end of the request (reset_read_routing() of ORMResetMiddle), out of
+        web they stick until commit, rollback or close of the session
+        """
+        from uliweb import is_in_web
+        
+        if not is_in_web():
+            self._written = False
+            
+    @property
+    def use_lazy_transaction(self):
+        if self.lazy_transaction is not None:
+            return self.lazy_transaction
+        return __lazy_transaction__
+    
     def commit(self):
+        self._pending_trans = False
+        self._implicit_trans = False
+        self._end_written()
         if self._trans and self._conn.in_transaction():
             self._trans.commit()
         self._trans = None
+        self.identities = {}
         if self.auto_close:
             self._close()
 
@@ -414,9 +928,13 @@ class Session(object):
         return self._conn.in_transaction()
     
     def rollback(self):
+        self._pending_trans = False
+        self._implicit_trans = False
+        self._end_written()
         if self._trans and self._conn.in_transaction():
             self._trans.rollback()
         self._trans = None
+        self.identities = {}
         if self.auto_close:
             self._close()
             
@@ -426,8 +944,8 @@ class Session(object):
             self._conn = None
             self.local_cache = {}
             
-        if self.engine.options.connection_type == 'short':
-            self.engine.engine.dispose()
+            if self.engine.options.connection_type == 'short':
+                self.engine.engine.dispose()
         
     def close(self):
         self.rollback()
@@ -444,6 +962,40 @@ class Session(object):
         if value:
             self.local_cache[key] = value
         return value
+
+    @property
+    def use_identity_map(self):
+        if self.identity_map is not None:
+            return self.identity_map
+        return __identity_map__
+
+    def get_identity(self, model, key):
+        """
+        Get object of model from identity map by primary key
+        """
+        obj = self.identities.get((model.tablename, safe_str(key)))
+        #model may be redefined or used with other connection
+        if obj is not None and type(obj) is model:
+            return obj
+
+    def add_identity(self, obj):
+        if obj._key is not None:
+            self.identities[(obj.tablename, safe_str(obj._key))] = obj
+
+    def remove_identity(self, model, key=None):
+        """
+        Remove object of model from identity map, if key is None, all
+        objects of the model will be removed
+        """
+        if key is not None:
+            self.identities.pop((model.tablename, safe_str(key)), None)
+        else:
+            for k in self.identities.keys():
+                if k[0] == model.tablename:
+                    del self.identities[k]
+
+    def clear_identity_map(self):
+        self.identities = {}
         
 def get_connection(connection='', engine_name=None, connection_type='long', **args):
     """
@@ -497,6 +1049,25 @@ def get_session(ec=None, create=True):
         raise Error("Connection %r should be existed engine name or Session object" % ec)
     return session
 
+def reset_read_routing():
+    """
+    Route reads of current sessions to replicas again, it should be
+    invoked at the beginning of each request
+    """
+    for k, v in engine_manager.items():
+        session = v.session(create=False)
+        if session:
+            session._written = False
+
+def clear_identity_map():
+    """
+    Clear identity maps of current sessions of all engines
+    """
+    for k, v in engine_manager.items():
+        session = v.session(create=False)
+        if session:
+            session.clear_identity_map()
+
 def set_session(session=None, engine_name='default'):
     if not session:
         session = Session()
@@ -520,9 +1091,12 @@ def default_post_do(sender, query, conn, usetime):
         __default_post_do__(sender, query, conn, usetime)
       
 re_placeholder = re.compile(r'%\(\w+\)s')
-def rawsql(query, ec=None):
+def rawsql(query, ec=None, params=None):
     """
     ec could be engine name or engine instance
+    params will be used as the values of bound parameters, if query is a
+    Compiled statement (e.g. from statement_cache) and params are not given,
+    the bound parameters without values will be rendered as empty
     """
     if isinstance(query, Result):
         query = query.get_query()
@@ -536,17 +1110,22 @@ def rawsql(query, ec=None):
     if isinstance(query, (str, unicode)):
         return query
     #return str(query.compile(compile_kwargs={"literal_binds": True})).replace('\n', '') + ';'
-    comp = query.compile(dialect=dialect)
+    if isinstance(query, Compiled):
+        comp = query
+        values = comp.construct_params(params, _check=False)
+    else:
+        comp = query.compile(dialect=dialect)
+        values = comp.construct_params(params)
     b = re_placeholder.search(comp.string)
     if b:
-        return comp.string % comp.params
+        return comp.string % values
     else:
         if dialect.name == 'postgresql':
             return comp.string
         else:
             params = []
             for k in comp.positiontup:
-                v = comp.params[k]
+                v = values[k]
                 params.append(repr(simple_value(v)))
             line = comp.string.replace('?', '%s') % tuple(params)
             return line.replace('\n', '')
@@ -591,10 +1170,17 @@ def do_(query, ec=None, args=None):
     result = conn.execute(query, *(args or ()))
     t = time() - b
     dispatch.call(ec, 'post_do', query, conn, t)
+    profiler = getattr(Local, 'profiler', None)
+    if profiler is not None:
+        profiler.record(query, conn, t, result)
     
     flag = False
     sql = ''
     if hasattr(Local, 'echo') and Local.echo:
+        #compiled statement needs the values of the bound parameters
+        params = None
+        if isinstance(query, Compiled) and args and isinstance(args[0], dict):
+            params = args[0]
         if hasattr(Local, 'echo_args'):
             _ec = Local.echo_args.get('session')
         else:
@@ -605,11 +1191,11 @@ def do_(query, ec=None, args=None):
         if not _ec or _ec and _ec == _e:
             if hasattr(Local, 'echo_args') and Local.echo_args['time']:
                 if t >= Local.echo_args['time']:
-                    sql = rawsql(query)
+                    sql = rawsql(query, params=params)
                     
                     flag = True
             else:
-                sql = rawsql(query)
+                sql = rawsql(query, params=params)
                 flag = True
         
         if flag:
@@ -627,8 +1213,38 @@ def do_(query, ec=None, args=None):
                 
     return result
 
+def is_read_query(query):
+    """
+    Check if query is a select (but not select for update) statement
+    """
+    if isinstance(query, Compiled):
+        query = query.statement
+    if isinstance(query, Select):
+        return query._for_update_arg is None
+    if not isinstance(query, (str, unicode)):
+        query = getattr(query, 'text', None)
+        if not isinstance(query, (str, unicode)):
+            return False
+    return query.lstrip()[:6].upper() == 'SELECT'
+
+def iter_rows(result, chunk_size=None):
+    """
+    Iterate rows of a query result, if chunk_size is given, rows will be
+    fetched with fetchmany(chunk_size) but not fetchone() one by one
+    """
+    if not chunk_size:
+        for row in result:
+            yield row
+        return
+    while 1:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
 def save_file(result, filename, encoding='utf8', headers=None,
-              convertors=None, visitor=None, **kwargs):
+              convertors=None, visitor=None, chunk_size=None, **kwargs):
     """
     save query result to a csv file
     visitor can used to convert values, all value should be convert to string
@@ -647,6 +1263,8 @@ def save_file(result, filename, encoding='utf8', headers=None,
     if visitor and convertors all provided, only visitor is available.
     
     headers used to convert column to a provided value
+    
+    chunk_size is used to fetch rows in batches, see iter_rows
     """
     import csv
     from uliweb.utils.common import simple_value
@@ -679,7 +1297,7 @@ def save_file(result, filename, encoding='utf8', headers=None,
     try:
         w = csv.writer(f, **kwargs)
         w.writerow([simple_value(convert_header(x), encoding=encoding) for x in result.keys()])
-        for row in result:
+        for row in iter_rows(result, chunk_size):
             if visitor and callable(visitor):
                 _row = visitor(result.keys, row.values(), encoding)
             else:
@@ -691,9 +1309,9 @@ def save_file(result, filename, encoding='utf8', headers=None,
             f.close()
 
     
-def Begin(ec=None):
+def Begin(ec=None, implicit=False):
     session = get_session(ec)
-    return session.begin()
+    return session.begin(implicit=implicit)
 
 def Commit(ec=None, close=None):
     if close:
@@ -1084,6 +1702,37 @@ def get_object(table, id=None, condition=None, cache=False, fields=None, use_loc
 def get_cached_object(table, id, condition=None, cache=True, fields=None, use_local=True, session=None):
     return get_object(table, id, condition, cache, fields, use_local, session)
 
+class StatementCache(object):
+    """
+    Cache of compiled statements, the key is the shape of the query, and the
+    values of the query should be bound parameters, so the same statement
+    can be executed again without building and compiling
+    """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, creator):
+        compiled = self.cache.get(key)
+        if compiled is None:
+            self.misses += 1
+            if len(self.cache) >= self.max_size:
+                self.cache.clear()
+            compiled = self.cache[key] = creator()
+        else:
+            self.hits += 1
+        return compiled
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses, 'size':len(self.cache)}
+
+statement_cache = StatementCache()
+
 class SQLMointor(object):
     def __init__(self, key_length=65, record_details=False):
         self.count = SortedDict()
@@ -1137,6 +1786,127 @@ def close_sql_monitor(monitor):
     dispatch.unbind('post_do', monitor.post_do)
     monitor.close()
 
+class SQLProfiler(object):
+    """
+    Record statements executed in current thread(request) via do_, the
+    statements are grouped by shape (sql with placeholders and literals
+    replaced by ?). The shape executed more than n_plus_one times is flagged
+    as N+1 query, and the statement executed again with the same parameters
+    is counted as duplicate.
+    """
+    re_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    
+    def __init__(self, n_plus_one=5, caller=True, max_callers=5):
+        self.n_plus_one = n_plus_one
+        self.caller = caller
+        self.max_callers = max_callers
+        self.statements = {}
+        self.executed = set()
+        self.count = 0
+        self.time = 0
+        self.duplicates = 0
+        
+    def get_statement(self, query, result):
+        sql = getattr(getattr(result, 'context', None), 'statement', None)
+        if sql is None:
+            sql = str(query)
+        return sql
+    
+    def get_shape(self, sql):
+        return self.re_literal.sub('?', ' '.join(sql.split()))
+    
+    def get_caller(self):
+        """
+        Return filename:lineno of the first frame out of orm and sqlalchemy
+        """
+        f = sys._getframe(2)
+        while f is not None:
+            module = f.f_globals.get('__name__', '')
+            if not module.startswith(('uliweb.orm', 'sqlalchemy')):
+                return '%s:%d' % (f.f_code.co_filename, f.f_lineno)
+            f = f.f_back
+        
+    def record(self, query, conn, usetime, result):
+        sql = self.get_statement(query, result)
+        shape = self.get_shape(sql)
+        st = self.statements.get(shape)
+        if st is None:
+            st = self.statements[shape] = {'sql':shape, 'count':0, 'time':0,
+                'max_time':0, 'rows':0, 'duplicates':0, 'callers':[]}
+        st['count'] += 1
+        st['time'] += usetime
+        st['max_time'] = max(st['max_time'], usetime)
+        self.count += 1
+        self.time += usetime
+        
+        key = (sql, repr(getattr(getattr(result, 'context', None), 'parameters', None)))
+        if key in self.executed:
+            st['duplicates'] += 1
+            self.duplicates += 1
+        else:
+            self.executed.add(key)
+            
+        if self.caller and len(st['callers']) < self.max_callers:
+            caller = self.get_caller()
+            if caller not in st['callers']:
+                st['callers'].append(caller)
+                
+        if getattr(result, 'returns_rows', False):
+            #rows are counted when they are fetched
+            process_rows = result.process_rows
+            def _process_rows(rows):
+                st['rows'] += len(rows)
+                return process_rows(rows)
+            result.process_rows = _process_rows
+        elif getattr(result, 'rowcount', -1) > 0:
+            st['rows'] += result.rowcount
+            
+    def get_n_plus_one(self):
+        return [x for x in self.statements.values() if x['count'] > self.n_plus_one]
+    
+    def report(self):
+        statements = []
+        for st in sorted(self.statements.values(), key=lambda x:x['time'], reverse=True):
+            d = st.copy()
+            d['n_plus_one'] = st['count'] > self.n_plus_one
+            statements.append(d)
+        return {'count':self.count, 'time':self.time, 'duplicates':self.duplicates,
+            'n_plus_one':len(self.get_n_plus_one()), 'statements':statements}
+    
+    def summary(self):
+        return 'count=%d time=%.3fs duplicates=%d n+1=%d' % (self.count,
+            self.time, self.duplicates, len(self.get_n_plus_one()))
+    
+    def print_(self, message='', key_length=70):
+        print
+        print '====== sql execution %s <%s> =======' % (self.summary(), message)
+        for st in self.report()['statements']:
+            k = st['sql']
+            if key_length and len(k) > key_length:
+                k = k[:key_length-3]+'...'
+            print '%s  %3d  %.3f%s' % (k.ljust(key_length), st['count'], st['time'],
+                '  N+1' if st['n_plus_one'] else '')
+        print
+        
+def begin_sql_profiler(n_plus_one=5, caller=True):
+    """
+    Begin the profiler of current thread, only queries of current thread
+    will be recorded
+    """
+    Local.profiler = SQLProfiler(n_plus_one=n_plus_one, caller=caller)
+    return Local.profiler
+
+def get_sql_profiler():
+    return getattr(Local, 'profiler', None)
+
+def end_sql_profiler():
+    """
+    Stop the profiler of current thread and return it
+    """
+    profiler = getattr(Local, 'profiler', None)
+    Local.profiler = None
+    return profiler
+
 def reflect_table(tablename, engine_name='default'):
     from sqlalchemy.engine.reflection import Inspector
     from sqlalchemy import MetaData, Table
@@ -1370,6 +2140,8 @@ class ModelMetaclass(type):
         cls.properties = {}
         cls._fields_list = []
         cls._collection_names = {}
+        cls._row_loaders = {}
+        cls._compared_properties = None
 
         defined = set()
         _primary_keys = []
@@ -1459,6 +2231,7 @@ class LazyValue(object):
             return
         
         setattr(model_instance, self.name, value)
+        model_instance._set_changed(self.property.name)
         
 class Property(object):
     data_type = str
@@ -1467,12 +2240,13 @@ class Property(object):
     creation_counter = 0
     property_type = 'column'   #Property type: 'column', 'compound', 'relation'
     server_default = None
+    mutable = False #mutable value will be compared when saving even if not set
     
     def __init__(self, label=None, verbose_name=None, fieldname=None, default=None,
         required=False, validators=None, choices=None, max_length=None, 
         hint='', auto=None, auto_add=None, type_class=None, type_attrs=None, 
         placeholder='', extra=None,
-        sequence=False, **kwargs):
+        sequence=False, mutable=None, **kwargs):
         self.label = label or verbose_name
         self.verbose_name = label or verbose_name
         self.property_name = None
@@ -1496,6 +2270,8 @@ class Property(object):
         self.extra = extra or {}
         self.type_attrs = type_attrs or {}
         self.type_class = type_class or self.field_class
+        if mutable is not None:
+            self.mutable = mutable
         Property.creation_counter += 1
         
     def get_parameters(self):
@@ -1594,6 +2370,7 @@ class Property(object):
         #add value to model_instance._changed_value, so that you can test if
         #a object really need to save
         setattr(model_instance, self._attr_name(), value)
+        model_instance._set_changed(self.name)
 
     def default_value(self):
         if callable(self.default):
@@ -1869,6 +2646,7 @@ class PickleProperty(BlobProperty):
     field_class = PickleType
     data_type = None
     type_name = 'PICKLE'
+    mutable = True
     
     def to_str(self, v):
         return pickle.dumps(v, pickle.HIGHEST_PROTOCOL)
@@ -1883,6 +2661,7 @@ class JsonProperty(TextProperty):
     field_class = TEXT
     data_type = None
     type_name = 'JSON'
+    mutable = True
 
     def get_value_for_datastore(self, model_instance):
         from uliweb import json_dumps
@@ -2255,6 +3034,7 @@ class ReferenceProperty(Property):
         else:
             setattr(model_instance, self._attr_name(), None)
             setattr(model_instance, self._resolved_attr_name(), None)
+        model_instance._set_changed(self.name)
         
     def validate(self, value):
         """Validate reference.
@@ -2402,6 +3182,167 @@ def get_objs_columns(objs, field=None, model=None):
             keys.append(key)
     return keys
 
+JOIN_LOAD_PREFIX = '_jl_'
+
+def get_reference_property(model, name):
+    """
+    Get ReferenceProperty(include OneToOne) of model by name
+    """
+    prop = model.properties.get(name)
+    if not isinstance(prop, ReferenceProperty) or isinstance(prop, ManyToMany):
+        raise Error("Field %s of Model %s is not a ReferenceProperty" % (name, model.__name__))
+    return prop
+
+def prefetch_references(objs, prop):
+    """
+    Load referenced objects of prop for objs with `IN (...)` queries, and
+    save them to resolved attributes of objs
+    """
+    attr_name = prop._attr_name()
+    resolved_name = prop._resolved_attr_name()
+    keys = []
+    _keys = set()
+    for obj in objs:
+        if getattr(obj, resolved_name, None) is not None:
+            continue
+        v = prop.get_attr(obj, attr_name, None)
+        if v and v is not Lazy and v not in _keys:
+            _keys.add(v)
+            keys.append(v)
+    if not keys:
+        return
+
+    model = prop.reference_class
+    field = model.c[prop.reference_fieldname]
+    objects = {}
+    session = model.get_session()
+    use_map = prop.reference_fieldname == model._primary_field and session.use_identity_map
+    if use_map:
+        _keys = []
+        for k in keys:
+            o = session.get_identity(model, k)
+            if o is not None:
+                objects[k] = o
+            else:
+                _keys.append(k)
+        keys = _keys
+    for i in range(0, len(keys), __prefetch_batch_size__):
+        for o in model.filter(field.in_(keys[i:i+__prefetch_batch_size__])):
+            objects[getattr(o, prop.reference_fieldname)] = o
+            if use_map:
+                session.add_identity(o)
+    for obj in objs:
+        o = objects.get(prop.get_attr(obj, attr_name, None))
+        if o is not None:
+            setattr(obj, resolved_name, o)
+
+def get_manytomany_relation(model, name):
+    """
+    Get relation info of ManyToMany field or reversed ManyToMany collection
+    of model by name, return (table, fielda, fieldb, value_field, store_key,
+    prop, target_model, target_field), prop will be None for reversed collection
+    """
+    prop = model.properties.get(name)
+    if isinstance(prop, ManyToMany):
+        prop.init_through()
+        return (prop.table, prop.fielda, prop.fieldb, prop.reversed_fieldname,
+            prop._attr_name(), prop, prop.reference_class, prop.reference_fieldname)
+    prop = getattr(model, name, None)
+    if isinstance(prop, _ManyToManyReverseReferenceProperty):
+        p = prop.reference_property
+        p.init_through()
+        return (p.table, p.fieldb, p.fielda, p.reference_fieldname,
+            '_CACHED_' + name, None, p.model_class, p.reversed_fieldname)
+    raise Error("Field %s of Model %s is not a ManyToMany or reversed ManyToMany collection" % (name, model.__name__))
+
+def prefetch_manytomany(objs, relation, objects=False):
+    """
+    Load keys of ManyToMany relation for objs with `IN (...)` queries of
+    relation table, and save them to the cache attribute of objs
+    """
+    table, fielda, fieldb, value_field, store_key, prop, model, fieldname = relation
+    if not objs:
+        return
+    values = []
+    _values = set()
+    for obj in objs:
+        v = getattr(obj, value_field, None)
+        if v is not None and v not in _values:
+            _values.add(v)
+            values.append(v)
+
+    session = objs[0].get_session()
+    keys = {}
+    for i in range(0, len(values), __prefetch_batch_size__):
+        query = select([table.c[fielda], table.c[fieldb]],
+                       table.c[fielda].in_(values[i:i+__prefetch_batch_size__]))
+        for a, b in do_(query, session):
+            keys.setdefault(a, []).append(b)
+    for obj in objs:
+        v = keys.get(getattr(obj, value_field, None), [])
+        setattr(obj, store_key, v)
+        if prop:
+            #the same as ManyToMany.get_lazy
+            obj._old_values[prop.name] = v
+
+    if objects:
+        ids = list(set(b for x in keys.values() for b in x))
+        s = get_session()
+        for i in range(0, len(ids), __prefetch_batch_size__):
+            for o in model.filter(model.c[fieldname].in_(ids[i:i+__prefetch_batch_size__])):
+                s.get_local_cache(get_object_id(s.engine_name, model.tablename,
+                                                getattr(o, fieldname)), o)
+
+class Record(tuple):
+    """
+    Read-only record of Result.rows(), values can be got via attribute, name
+    or index, the record classes are created by make_record_class()
+    """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+    _model = None
+
+    def __getitem__(self, key):
+        if isinstance(key, (str, unicode)):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        if i is None:
+            return default
+        return tuple.__getitem__(self, i)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return '<Record {%s}>' % ','.join(["'%s':%r" % (k, v) for k, v in zip(self._fields, self)])
+
+re_identifier = re.compile(r'^[a-zA-Z_]\w*$')
+def make_record_class(fields, model=None):
+    """
+    Create Record class of fields, field values can be got via attributes
+    if the field name is a valid identifier and is not used by Record
+    """
+    fields = tuple([str(x) for x in fields])
+    attrs = {'__slots__':(), '_fields':fields, '_model':model,
+        '_index':dict([(k, i) for i, k in enumerate(fields)])}
+    for i, k in enumerate(fields):
+        if re_identifier.match(k) and not hasattr(Record, k):
+            attrs[k] = property(operator.itemgetter(i))
+    return type('Record', (Record,), attrs)
+
 class Result(object):
     def __init__(self, model=None, condition=None, *args, **kwargs):
         self.model = model
@@ -2416,14 +3357,17 @@ class Result(object):
         self._having = None
         self.distinct_field = None
         self._values_flag = False
+        self._rows_flag = False
         self._join = []
         self._limit = None
         self._offset = None
+        self._prefetch = []
+        self._join_load = []
         self.connection = model.get_session()
         
     def do_(self, query):
         global do_
-        return do_(query, self.connection)
+        return do_(query, get_session(self.connection).get_read_session(query))
     
     def get_column(self, model, fieldname):
         if isinstance(fieldname, (str, unicode)):
@@ -2513,6 +3457,48 @@ class Result(object):
             raise BadValueError("Only Model support in this function.")
         return self
 
+    def prefetch(self, *fields):
+        """
+        Batch load referenced objects of ReferenceProperty fields, each field
+        will use one `IN (...)` query for every `__prefetch_batch_size__` rows,
+        so accessing `obj.field` will not query database for each row
+        """
+        model = getattr(self, 'modelb', None) or self.model
+        for name in flat_list(fields):
+            x = (prefetch_references, (get_reference_property(model, name),))
+            if x not in self._prefetch:
+                self._prefetch.append(x)
+        return self
+
+    def prefetch_many(self, *fields, **kwargs):
+        """
+        Batch load keys of ManyToMany fields or reversed ManyToMany collections
+        with one `IN (...)` query of relation table for every
+        `__prefetch_batch_size__` rows, and save them to the cache attribute
+        of each object, so `ids(cache=True)`, `keys(cache=True)` and
+        `to_dict(manytomany=True)` will not query database again.
+        If objects is True, referenced objects will be also loaded into
+        session local cache, so `all(cache=True)` can use them directly.
+        """
+        model = getattr(self, 'modelb', None) or self.model
+        objects = kwargs.get('objects', False)
+        for name in flat_list(fields):
+            x = (prefetch_manytomany, (get_manytomany_relation(model, name), objects))
+            if x not in self._prefetch:
+                self._prefetch.append(x)
+        return self
+
+    def join_load(self, *fields):
+        """
+        Load referenced objects of ReferenceProperty fields via LEFT OUTER JOIN
+        in the same query
+        """
+        for name in flat_list(fields):
+            prop = get_reference_property(self.model, name)
+            if prop not in self._join_load:
+                self._join_load.append(prop)
+        return self
+
     def get(self, condition=None):
         if isinstance(condition, ColumnElement):
             self.filter(condition).one()
@@ -2577,6 +3563,21 @@ class Result(object):
         self._values_flag = True
         return self
     
+    def rows(self, *fields):
+        """
+        Read-only mode, the result will be Record objects of fields (or all
+        columns if no fields given) but not model instances. The values are
+        converted the same as properties, but there are no descriptors and
+        change tracking, so it's cheaper for the data which is only read
+        """
+        fields = flat_list(fields)
+        if fields:
+            self.values(*fields)
+        else:
+            self._values_flag = True
+        self._rows_flag = True
+        return self
+
     def values_one(self, *args, **kwargs):
         self.funcs.append(('with_only_columns', ([self.get_column(self.model, x) for x in args],), kwargs))
         self.run(1)
@@ -2609,6 +3610,117 @@ class Result(object):
         self.funcs.append(('offset', args, kwargs))
         return self
     
+    def _get_keyset_columns(self, order_by):
+        """
+        Return [(column, desc)] of order_by, order_by item can be a field name,
+        '-name' for descending order, a column or a column.desc()
+        """
+        if order_by is None:
+            order_by = [self.model._primary_field]
+        elif not isinstance(order_by, (tuple, list)):
+            order_by = [order_by]
+        columns = []
+        for x in order_by:
+            desc = False
+            if isinstance(x, (str, unicode)):
+                if x.startswith('-'):
+                    x, desc = x[1:], True
+                elif x.startswith('+'):
+                    x = x[1:]
+            elif getattr(x, 'modifier', None) in (operators.desc_op, operators.asc_op):
+                desc = x.modifier is operators.desc_op
+                x = x.element
+            columns.append((self.get_column(self.model, x), desc))
+        return columns
+    
+    def after(self, last_key, order_by=None):
+        """
+        Keyset(seek) pagination, the result will be ordered by order_by
+        and only the records after last_key will be returned, so deep pages
+        will not scan and skip all the records before them like offset.
+        
+        order_by should be unique, default is primary key, and it can be
+        a list of fields, e.g. ['-created_date', 'id'].
+        last_key is the values of order_by fields of the last record of
+        previous page, it can be a tuple, a single value, a model instance
+        or a Record, and if it's None, the first page will be returned.
+        NULL values can't be compared, so order_by fields should be not null.
+        
+            User.filter(...).after(last_key, order_by=['-created_date', 'id']).limit(20)
+        """
+        columns = self._get_keyset_columns(order_by)
+        self._keyset = columns
+        if last_key is not None:
+            values = self._get_keyset_values(last_key)
+            if len(values) != len(columns):
+                raise Error("last_key %r doesn't match order_by %r" % (last_key, order_by))
+            #values from cursor may be strings, all of them should be converted,
+            #or the equality conditions of previous columns will compare strings
+            for i, (col, desc) in enumerate(columns):
+                v = values[i]
+                prop = self.model.properties.get(col.name)
+                if (isinstance(v, (str, unicode)) and prop is not None and
+                        not isinstance(prop, ReferenceProperty)):
+                    values[i] = prop.convert(v)
+            conds = []
+            for i, (col, desc) in enumerate(columns):
+                v = values[i]
+                if desc:
+                    cond = col < v
+                else:
+                    cond = col > v
+                conds.append(and_(*([c == values[j] for j, (c, d) in enumerate(columns[:i])] + [cond])))
+            self.filter(or_(*conds))
+        self.order_by(*[col.desc() if desc else col for col, desc in columns])
+        return self
+    
+    def _get_keyset_values(self, obj):
+        columns = getattr(self, '_keyset', None)
+        if isinstance(obj, (tuple, list)) and not isinstance(obj, Record):
+            return list(obj)
+        if columns and (isinstance(obj, (Model, Record, dict)) or hasattr(obj, 'keys')):
+            values = []
+            for col, desc in columns:
+                if isinstance(obj, Model):
+                    values.append(getattr(obj, col.name) if col.name not in obj.properties
+                                  else obj.get_datastore_value(col.name))
+                else:
+                    values.append(obj[col.name])
+            return values
+        return [obj]
+    
+    def get_keyset(self, obj):
+        """
+        Return the key of obj which can be passed to next after() call,
+        it should be invoked after after()
+        """
+        values = self._get_keyset_values(obj)
+        if len(values) == 1:
+            return values[0]
+        return tuple(values)
+    
+    def estimate_count(self):
+        """
+        Return estimated rows number from table statistics if there are
+        no conditions, it only supports postgresql and mysql now, otherwise
+        it'll return count()
+        """
+        if (self.condition is None and not self._group_by and not self._join
+                and not (self.default_query_flag and getattr(self.model, 'default_query', None))):
+            engine = self.model.get_engine().engine
+            tablename = self.model.table.name
+            sql = None
+            if engine.dialect.name == 'postgresql':
+                sql = text("SELECT reltuples FROM pg_class WHERE relname = :t")
+            elif engine.dialect.name == 'mysql':
+                sql = text("SELECT table_rows FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() AND table_name = :t")
+            if sql is not None:
+                n = self.do_(sql.bindparams(t=tablename)).scalar()
+                if n is not None and n >= 0:
+                    return int(n)
+        return self.count()
+    
     def update(self, **kwargs):
         """
         Execute update table set field = field+1 like statement
@@ -2617,6 +3729,7 @@ class Result(object):
             self.result = self.do_(self.model.table.update().where(self.condition).values(**kwargs))
         else:
             self.result = self.do_(self.model.table.update().values(**kwargs))
+        get_session(self.connection).remove_identity(self.model)
         return self.result
     
     def without(self, flag='default_query'):
@@ -2624,19 +3737,25 @@ class Result(object):
             self.default_query_flag = False
         return self
     
-    def run(self, limit=0):
+    def run(self, limit=0, stream=False):
         query = self.get_query()
         #add limit support
         if limit > 0:
             query = getattr(query, 'limit')(limit)
+        #use server side cursor if the dialect supports it
+        if stream:
+            query = query.execution_options(stream_results=True)
         self.result = self.do_(query)
         return self.result
     
     def save_file(self, filename, encoding='utf8', headers=None,
-                  convertors=None, display=True, **kwargs):
+                  convertors=None, display=True, chunk_size=None, stream=False,
+                  **kwargs):
         """
         save result to a csv file.
         display = True will convert value according choices value
+        rows are fetched in chunks of chunk_size, and stream = True will use
+        server side cursor, see iterator()
         """
         global save_file
         
@@ -2650,8 +3769,9 @@ class Result(object):
                         return column.get_display_value(value)
                     convertors[column.name] = f
 
-        return save_file(self.run(), filename, encoding=encoding,
-                         headers=headers, convertors=convertors, **kwargs)
+        return save_file(self.run(stream=stream), filename, encoding=encoding,
+                         headers=headers, convertors=convertors,
+                         chunk_size=chunk_size or __iterator_chunk_size__, **kwargs)
     
     def get_query(self, columns=None):
         #user can define default_query, and default_query 
@@ -2664,6 +3784,17 @@ class Result(object):
                 _f(self)
         from_ = self._join
         from_.append(self.model.table)
+        join_columns = []
+        if self._join_load and not self._values_flag:
+            from_ = list(from_)
+            _join = from_[0]
+            for prop in self._join_load:
+                table = prop.reference_class.table.alias('%s%s' % (JOIN_LOAD_PREFIX, prop.name))
+                _join = _join.outerjoin(table,
+                    self.model.table.c[prop.fieldname]==table.c[prop.reference_fieldname])
+                for c in table.c:
+                    join_columns.append(c.label('%s%s__%s' % (JOIN_LOAD_PREFIX, prop.name, c.name)))
+            from_[0] = _join
         if self.condition is not None:
             query = select(columns, self.condition, from_obj=from_, **self.kwargs)
         else:
@@ -2671,6 +3802,9 @@ class Result(object):
 
         for func, args, kwargs in self.funcs:
             query = getattr(query, func)(*args, **kwargs)
+        #join load columns should be added after with_only_columns
+        for c in join_columns:
+            query = query.column(c)
         if self._group_by:
             query = query.group_by(*self._group_by)
             if self._having:
@@ -2683,8 +3817,47 @@ class Result(object):
     def load(self, values):
         if self._values_flag:
             return values
+        elif self._join_load:
+            return self._load_joined(values.items())
         else:
             return self.model.load(values.items())
+
+    def _get_loader(self):
+        """
+        Get load function of current result, if it's a normal model result,
+        the compiled row loader of the model will be used
+        """
+        if self._rows_flag:
+            return self.model.get_record_loader(self.result.keys())
+        if self._values_flag or self._join_load:
+            return self.load
+        return self.model.get_row_loader(self.result.keys())
+
+    def _load_joined(self, items):
+        """
+        Split the row into the model's values and join loaded values, and
+        save join loaded objects to resolved attributes
+        """
+        data = []
+        joined = {}
+        for k, v in items:
+            if k.startswith(JOIN_LOAD_PREFIX):
+                name, field = k[len(JOIN_LOAD_PREFIX):].rsplit('__', 1)
+                joined.setdefault(name, []).append((field, v))
+            else:
+                data.append((k, v))
+        obj = self.model.load(data)
+        for prop in self._join_load:
+            values = joined.get(prop.name)
+            if not values or dict(values).get(prop.reference_fieldname) is None:
+                continue
+            setattr(obj, prop._resolved_attr_name(), prop.reference_class.load(values))
+        return obj
+
+    def _do_prefetch(self, objs):
+        for func, args in self._prefetch:
+            func(objs, *args)
+        return objs
         
     def for_update(self, flag=True):
         """
@@ -2700,11 +3873,15 @@ class Result(object):
         
         result = self.result.fetchone()
         if result:
-            return self.load(result)
+            obj = self._get_loader()(result)
+            if self._prefetch and not self._values_flag:
+                self._do_prefetch([obj])
+            return obj
         
     first = one
     
     def clear(self):
+        get_session(self.connection).remove_identity(self.model)
         return do_(self.model.table.delete(self.condition), self.connection)
     
     remove = clear
@@ -2714,13 +3891,48 @@ class Result(object):
             self.result.close()
             self.result = None
 
+    def _fetch(self, load, chunk_size=None):
+        """
+        Load and yield the rows of self.result, rows will be fetched with
+        fetchmany if chunk_size is given or prefetch is used
+        """
+        prefetch = self._prefetch and not self._values_flag
+        if prefetch and not chunk_size:
+            chunk_size = __prefetch_batch_size__
+        if not chunk_size:
+            while 1:
+                result = self.result.fetchone()
+                if not result:
+                    break
+                yield load(result)
+            return
+
+        while 1:
+            rows = self.result.fetchmany(chunk_size)
+            if not rows:
+                break
+            objs = [load(x) for x in rows]
+            if prefetch:
+                self._do_prefetch(objs)
+            for obj in objs:
+                yield obj
+
     def __iter__(self):
         self.result = self.run()
-        while 1:
-            result = self.result.fetchone()
-            if not result:
-                raise StopIteration
-            yield self.load(result)
+        for obj in self._fetch(self._get_loader()):
+            yield obj
+
+    def iterator(self, chunk_size=None, stream=False):
+        """
+        Iterate the result with fetchmany(chunk_size) batches, default chunk_size
+        is __iterator_chunk_size__. If stream is True, the query will be executed
+        with server side cursor (stream_results) if the dialect supports it, so
+        the rows will not be buffered in client side, and a large table can be
+        walked through in bounded memory
+        """
+        self.result = self.run(stream=stream)
+        for obj in self._fetch(self._get_loader(), chunk_size or __iterator_chunk_size__):
+            yield obj
   
 class ReverseResult(Result):
     def __init__(self, model, condition, a_field, b_table, instance, b_field, *args, **kwargs):
@@ -2743,6 +3955,9 @@ class ReverseResult(Result):
         self._join = []
         self.distinct_field = None
         self._values_flag = False
+        self._rows_flag = False
+        self._prefetch = []
+        self._join_load = []
         self.connection = model.get_session()
         
     def has(self, *objs):
@@ -2772,6 +3987,7 @@ class ReverseResult(Result):
             self.do_(self.model.table.delete(self.condition & self.model.table.c[self.model._primary_field].in_(keys)))
         else:
             self.do_(self.model.table.delete(self.condition))
+        get_session(self.connection).remove_identity(self.model)
     
     remove = clear
     
@@ -2806,6 +4022,9 @@ class ManyResult(Result):
         self._offset = None
         self.distinct_field = None
         self._values_flag = False
+        self._rows_flag = False
+        self._prefetch = []
+        self._join_load = []
         self.connection = self.modela.get_session()
         self.kwargs = {}
         
@@ -2992,10 +4211,12 @@ class ManyResult(Result):
         self.with_relation_name = relation_name
         return self
         
-    def run(self, limit=0):
+    def run(self, limit=0, stream=False):
         query = self.get_query()
         if limit > 0:
             query = getattr(query, 'limit')(limit)
+        if stream:
+            query = query.execution_options(stream_results=True)
         self.result = self.do_(query)
         return self.result
         
@@ -3031,52 +4252,58 @@ class ManyResult(Result):
         result = self.result.fetchone()
         if result:
             if self._values_flag:
-                return result
+                return self._get_loader()(result)
 
             offset = 0
             if self.with_relation_name:
                 offset = len(self.table.columns)
                 
-            o = self.modelb.load(zip(result.keys()[offset:], result.values()[offset:]))
+            keys = result.keys()
+            o = self.modelb.get_row_loader(keys[offset:])(result[offset:])
             
             if self.with_relation_name:
-                r = self.through_model.load(zip(result.keys()[:offset], result.values()[:offset]))
+                r = self.through_model.get_row_loader(keys[:offset])(result[:offset])
                 setattr(o, self.with_relation_name, r)
+            if self._prefetch and not self._values_flag:
+                self._do_prefetch([o])
                 
             return o
 
+    def join_load(self, *fields):
+        raise Error("ManyResult doesn't support join_load, please use prefetch instead")
+
     def __del__(self):
         if self.result:
             self.result.close()
             self.result = None
     
-    def __iter__(self):
-        self.run()
-        if not self.result:
-            raise StopIteration
+    def _get_loader(self):
+        if self._rows_flag:
+            return self.modelb.get_record_loader(self.result.keys())
+        if self._values_flag:
+            return self.load
 
         offset = 0
         if self.with_relation_name:
             offset = len(self.table.columns)
         
-        while 1:
-            result = self.result.fetchone()
-            if not result:
-                raise StopIteration
-            if self._values_flag:
-                yield result
-                continue
-           
-            o = self.modelb.load(zip(result.keys()[offset:], result.values()[offset:]))
+        keys = self.result.keys()
+        load_b = self.modelb.get_row_loader(keys[offset:])
+        if self.with_relation_name:
+            load_relation = self.through_model.get_row_loader(keys[:offset])
+
+        def _load(result):
+            o = load_b(result[offset:])
             
             if self.with_relation_name:
-                r = self.through_model.load(zip(result.keys()[:offset], result.values()[:offset]))
+                r = load_relation(result[:offset])
                 setattr(o, self.with_relation_name, r)
-                
-            yield o
+            return o
+        return _load
         
 class ManyToMany(ReferenceProperty):
     type_name = 'ManyToMany'
+    mutable = True
 
     def __init__(self, reference_class=None, label=None, collection_name=None,
         reference_fieldname=None, reversed_fieldname=None, required=False, through=None, 
@@ -3287,6 +4514,7 @@ class ManyToMany(ReferenceProperty):
         if value and value is not Lazy:
             value = get_objs_columns(value, self.reference_fieldname, model=self.reference_class)
         setattr(model_instance, self._attr_name(), value)
+        model_instance._set_changed(self.name)
     
     def get_value_for_datastore(self, model_instance, cached=False):
         """Get key of reference rather than reference itself."""
@@ -3649,6 +4877,52 @@ class Model(object):
                 if not t is Lazy:
                     self._old_values[k] = t
         self._saved = True
+        self.__dict__.pop('_changed_fields', None)
+
+    def _set_changed(self, name):
+        """
+        Record the property which is set, only changed properties and the
+        properties returned by _get_compared_properties() will be compared
+        with old values when saving
+        """
+        changed = self.__dict__.get('_changed_fields')
+        if changed is None:
+            changed = self.__dict__['_changed_fields'] = set()
+        changed.add(name)
+
+    @classmethod
+    def _get_compared_properties(cls):
+        """
+        Mutable properties, and the properties which don't record changes
+        in __set__, should be always compared when saving
+        """
+        if cls._compared_properties is None:
+            tracked = (Property.__set__.im_func, ReferenceProperty.__set__.im_func,
+                ManyToMany.__set__.im_func)
+            cls._compared_properties = [(k, v) for k, v in cls.properties.items()
+                if v.mutable or type(v).__set__.im_func not in tracked]
+        return cls._compared_properties
+
+    def _set_saved_fields(self, names):
+        """
+        The same as set_saved(), but only old values of names, changed and
+        always compared properties will be updated
+        """
+        names = set(names)
+        names.update(self.__dict__.get('_changed_fields', ()))
+        names.update([k for k, v in self._get_compared_properties()])
+        for k in names:
+            v = self.properties.get(k)
+            if v is None:
+                continue
+            if isinstance(v, ManyToMany):
+                t = v.get_value_for_datastore(self, cached=True)
+                if not t is Lazy:
+                    self._old_values[k] = t
+            else:
+                self._old_values[k] = self.field_str(v.get_value_for_datastore(self))
+        self._saved = True
+        self.__dict__.pop('_changed_fields', None)
         
     def to_dict(self, fields=None, convert=True, manytomany=False):
         d = {}
@@ -3719,7 +4993,16 @@ class Model(object):
         else:
             d = {}
             d[self._primary_field] = self._key
-            for k, v in self.properties.items():
+            if compare:
+                #only changed and always compared properties need to be checked
+                props = dict(self._get_compared_properties())
+                for k in self.__dict__.get('_changed_fields', ()):
+                    if k in self.properties:
+                        props[k] = self.properties[k]
+                props = props.items()
+            else:
+                props = self.properties.items()
+            for k, v in props:
                 if fields and k not in fields:
                     continue
                 if v.property_type == 'compound':
@@ -3772,7 +5055,11 @@ class Model(object):
         _saved = False
         created = False
         version_fieldname = version_fieldname or 'version'
+        if self._key is None and getattr(self, '_bulk_created', False) and not insert:
+            raise Error("Object %r is created by bulk_create without primary key, it can't be saved again" % self)
         d = self._get_data()
+        if self._key is not None:
+            self.get_session().remove_identity(self.__class__, self._key)
         #fix when d is empty, orm will not insert record bug 2013/04/07
         if d or not self._saved or insert:
             _id = d.get(self._primary_field, None)
@@ -3877,7 +5164,10 @@ class Model(object):
                         setattr(self, k, v)
                 if send_dispatch and get_dispatch_send() and self.__dispatch_enabled__:
                     dispatch.call(self.__class__, 'post_save', instance=self, created=created, data=old, old_data=self._old_values, signal=self.tablename)
-                self.set_saved()
+                if created or self.__class__.set_saved.im_func is not Model.set_saved.im_func:
+                    self.set_saved()
+                else:
+                    self._set_saved_fields(d)
                 
                 if callable(saved):
                     saved(self, created, self._old_values, old)
@@ -3889,6 +5179,182 @@ class Model(object):
         warnings.warn("put method will be deprecated in next version.", DeprecationWarning)
         return self.save(*args, **kwargs)
 
+    @classmethod
+    def _bulk_saved(cls, objs, rows):
+        """
+        Set generated values back to objects and mark them as saved
+        """
+        for obj, d in zip(objs, rows):
+            for k, v in d.items():
+                x = cls.properties[k].get_value_for_datastore(obj)
+                if obj.field_str(x) != obj.field_str(v):
+                    setattr(obj, k, v)
+            #the objects without generated keys can't be treated as saved
+            if not cls._primary_field or obj._key is not None:
+                obj.set_saved()
+            else:
+                obj._bulk_created = True
+
+    @classmethod
+    def bulk_create(cls, objs, batch_size=None, send_dispatch=True):
+        """
+        Insert objs with one executemany statement for every batch_size objects,
+        default values and auto_now_add fields are processed the same as save().
+        If send_dispatch is True, pre_bulk_save and post_bulk_save will be
+        called once for each batch with created=True.
+
+        Generated primary keys will be set back to objects only if the dialect
+        supports multi rows INSERT with RETURNING (e.g. postgresql), or the
+        object is inserted alone. Otherwise the primary keys of objects will be
+        left None and save() of them will raise Error instead of inserting them
+        again, and the objects which have ManyToMany values will be saved one
+        by one.
+
+        Return the number of inserted objects
+        """
+        objs = list(objs)
+        batch_size = batch_size or __bulk_batch_size__
+        dialect = cls.get_engine().engine.dialect
+        pk = cls._primary_field
+        returning = bool(pk and dialect.implicit_returning and
+            dialect.supports_multivalues_insert)
+        session = cls.get_session()
+        dispatch_flag = send_dispatch and get_dispatch_send() and cls.__dispatch_enabled__
+
+        n = 0
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i:i+batch_size]
+            rows = []
+            manytomany = []
+            for obj in batch:
+                d = obj._get_data()
+                _manytomany = {}
+                for k, v in cls.properties.items():
+                    if v.property_type == 'compound':
+                        continue
+                    if not isinstance(v, ManyToMany):
+                        if isinstance(v, DateTimeProperty) and v.auto_now_add and k not in d:
+                            d[k] = v.now()
+                        elif (not k in d) and v.auto_add:
+                            d[k] = v.default_value()
+                    elif d.get(k):
+                        _manytomany[k] = d.pop(k)
+                rows.append(d)
+                manytomany.append(_manytomany)
+
+            if dispatch_flag:
+                dispatch.call(cls, 'pre_bulk_save', objs=batch, created=True, data=rows, signal=cls.tablename)
+
+            #objects with ManyToMany values need primary keys
+            single = []
+            groups = {}
+            for obj, d, m in zip(batch, rows, manytomany):
+                if m and not returning and not d.get(pk):
+                    single.append((obj, d, m))
+                else:
+                    #executemany needs the same columns of every row
+                    groups.setdefault(tuple(sorted(d)), []).append((obj, d, m))
+
+            for keys, items in groups.items():
+                if returning and not all(d.get(pk) for obj, d, m in items):
+                    query = cls.table.insert().values([d for obj, d, m in items])
+                    result = do_(query.returning(cls.table.c[pk]), session)
+                    for (obj, d, m), row in zip(items, result.fetchall()):
+                        d[pk] = row[0]
+                elif pk and len(items) == 1 and not items[0][1].get(pk):
+                    single.append(items[0])
+                else:
+                    do_(cls.table.insert(), session, args=[[d for obj, d, m in items]])
+
+            for obj, d, m in single:
+                obj_result = do_(cls.table.insert().values(**d), session)
+                if obj_result.inserted_primary_key:
+                    d[pk] = obj_result.inserted_primary_key[0]
+
+            cls._bulk_saved(batch, rows)
+            for obj, m in zip(batch, manytomany):
+                for k, v in m.items():
+                    getattr(obj, k).update(v)
+
+            if dispatch_flag:
+                dispatch.call(cls, 'post_bulk_save', objs=batch, created=True, data=rows, signal=cls.tablename)
+            n += len(batch)
+        return n
+
+    @classmethod
+    def bulk_update(cls, objs, fields=None, batch_size=None, send_dispatch=True):
+        """
+        Update saved objs with one executemany statement for every batch_size
+        objects. If fields is given, only these fields will be updated, otherwise
+        the changed fields of each object will be updated. auto_now fields are
+        processed the same as save(). If send_dispatch is True, pre_bulk_save and
+        post_bulk_save will be called once for each batch with created=False.
+
+        Return the number of updated objects
+        """
+        objs = list(objs)
+        batch_size = batch_size or __bulk_batch_size__
+        pk = cls._primary_field
+        if not pk:
+            raise Error("Model %s has no primary key, bulk_update can't be used" % cls.__name__)
+        session = cls.get_session()
+        dispatch_flag = send_dispatch and get_dispatch_send() and cls.__dispatch_enabled__
+
+        n = 0
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i:i+batch_size]
+            rows = []
+            manytomany = []
+            for obj in batch:
+                if obj._key is None or obj._key == '':
+                    raise Error("Object %r should be saved before bulk_update" % obj)
+                d = obj._get_data(fields=fields, compare=not fields)
+                d.pop(pk, None)
+                _manytomany = {}
+                if d:
+                    for k, v in cls.properties.items():
+                        if v.property_type == 'compound' or k == pk:
+                            continue
+                        if not isinstance(v, ManyToMany):
+                            if isinstance(v, DateTimeProperty) and v.auto_now and k not in d:
+                                d[k] = v.now()
+                            elif (not k in d) and v.auto:
+                                d[k] = v.default_value()
+                        elif k in d:
+                            _manytomany[k] = d.pop(k)
+                rows.append(d)
+                manytomany.append(_manytomany)
+
+            if dispatch_flag:
+                dispatch.call(cls, 'pre_bulk_save', objs=batch, created=False, data=rows, signal=cls.tablename)
+
+            groups = {}
+            for obj, d in zip(batch, rows):
+                if d:
+                    groups.setdefault(tuple(sorted(d)), []).append((obj, d))
+            for keys, items in groups.items():
+                #bind names can't be the same as column names in UPDATE
+                query = cls.table.update(cls.table.c[pk]==bindparam('_b_'+pk)).values(
+                    dict([(k, bindparam('_b_'+k)) for k in keys]))
+                args = []
+                for obj, d in items:
+                    x = dict([('_b_'+k, v) for k, v in d.items()])
+                    x['_b_'+pk] = obj._key
+                    args.append(x)
+                do_(query, session, args=[args])
+
+            cls._bulk_saved(batch, rows)
+            session.remove_identity(cls)
+            for obj, m in zip(batch, manytomany):
+                for k, v in m.items():
+                    if v is not None:
+                        getattr(obj, k).update(v)
+
+            if dispatch_flag:
+                dispatch.call(cls, 'post_bulk_save', objs=batch, created=False, data=rows, signal=cls.tablename)
+            n += len(batch)
+        return n
+
     def delete(self, manytomany=True, delete_fieldname=None, send_dispatch=True,
                onetoone=True):
         """
@@ -3916,6 +5382,7 @@ class Model(object):
             self.save()
         else:
             do_(self.table.delete(self.table.c[self._primary_field]==self._key), self.get_session())
+            self.get_session().remove_identity(self.__class__, self._key)
             self._key = None
             self._old_values = {}
         if send_dispatch and get_dispatch_send() and self.__dispatch_enabled__:
@@ -3990,6 +5457,9 @@ class Model(object):
             if old_prop:
                 prop.creation_counter = old_prop.creation_counter
             cls.properties[name] = prop
+            cls._row_loaders = {}
+            cls._compared_properties = None
+            statement_cache.clear()
             if config:
                 prop.__property_config__(cls, name)
             if set_property:
@@ -4015,6 +5485,9 @@ class Model(object):
             old_prop = cls.properties[name]
             prop.creation_counter = old_prop.creation_counter
             cls.properties[name] = prop
+            cls._row_loaders = {}
+            cls._compared_properties = None
+            statement_cache.clear()
             if config:
                 prop.__property_config__(cls, name)
             if set_property:
@@ -4267,6 +5740,29 @@ class Model(object):
             if obj:
                 return obj
 
+        #simple lookups use cached compiled statement
+        if not kwargs and not getattr(cls, 'default_query', None):
+            if condition is None and not isinstance(id, ColumnElement):
+                lookup = cls._primary_field, id
+            else:
+                lookup = cls._get_lookup(condition if condition is not None else id)
+            if lookup and lookup[0]:
+                fieldname, value = lookup
+                session = cls.get_session()
+                #only fully loaded objects are kept in identity map
+                use_map = (fieldname == cls._primary_field and not fields and
+                    session.use_identity_map)
+                if use_map:
+                    obj = session.get_identity(cls, value)
+                    if obj is not None:
+                        return obj
+                obj = cls._get_by_field(fieldname, value, fields)
+                if obj and use_map:
+                    session.add_identity(obj)
+                if obj and cache or getattr(cls, '__cacheable__', None):
+                    dispatch.call(cls, 'set_object', instance=obj)
+                return obj
+
         if condition is not None:
             _cond = condition
         else:
@@ -4290,6 +5786,39 @@ class Model(object):
 
         return obj
     
+    @classmethod
+    def _get_lookup(cls, condition):
+        """
+        If condition is like `Model.c.field == value`, then return (field, value)
+        """
+        if (isinstance(condition, BinaryExpression) and
+            condition.operator is operators.eq and
+            isinstance(condition.right, BindParameter) and
+            condition.right.callable is None):
+            column = condition.left
+            if getattr(column, 'table', None) is cls.table and column.key in cls.table.c \
+                and cls.table.c[column.key] is column:
+                return column.key, condition.right.value
+
+    @classmethod
+    def _get_by_field(cls, fieldname, value, fields=None):
+        """
+        Get object of field == value, the compiled statement is cached in
+        statement_cache according model, engine, field and loaded fields
+        """
+        session = cls.get_session()
+        engine = session.engine.engine
+        fields = tuple(fields or ())
+        def creator():
+            query = Result(cls).filter(cls.c[fieldname]==bindparam('_value')).fields(*fields)
+            return query.get_query().limit(1).compile(dialect=engine.dialect)
+        compiled = statement_cache.get((cls, engine, fieldname, fields), creator)
+        result = do_(compiled, session.get_read_session(compiled), args=[{'_value':value}])
+        row = result.fetchone()
+        result.close()
+        if row:
+            return cls.get_row_loader(row.keys())(row)
+
     def put_cached(self):
         dispatch.call(self.__class__, 'set_object', instance=self)
     
@@ -4331,6 +5860,7 @@ class Model(object):
             condition = cls.c[cls._primary_field]==condition
         #todo
         do_(cls.table.delete(condition, **kwargs), cls.get_session())
+        cls.get_session().remove_identity(cls)
             
     @classmethod
     def count(cls, condition=None, **kwargs):
@@ -4343,6 +5873,12 @@ class Model(object):
     
     @classmethod
     def load(cls, values, from_='db'):
+        if from_ == 'db' and isinstance(values, (list, tuple)):
+            return cls.get_row_loader([k for k, v in values])([v for k, v in values])
+        return cls._load_values(values, from_)
+
+    @classmethod
+    def _load_values(cls, values, from_='db'):
         if isinstance(values, (list, tuple)):
             d = cls._data_prepare(values)
         elif isinstance(values, dict):
@@ -4356,6 +5892,158 @@ class Model(object):
             
         return o
     
+    @classmethod
+    def get_row_loader(cls, keys):
+        """
+        Get the loader function of result columns, the loader will be created
+        once for each columns and cached in the model class. The loader accepts
+        a row of values, and returns a saved instance, it does the same thing
+        as `load()`, but the properties lookup and conversions are prepared
+        """
+        keys = tuple(keys)
+        loader = cls._row_loaders.get(keys)
+        if loader is None:
+            loader = cls._row_loaders[keys] = cls._make_row_loader(keys)
+        return loader
+
+    @classmethod
+    def get_record_loader(cls, keys):
+        """
+        Get the loader function which converts a row to Record object, the
+        values are converted the same as properties, it's cached in the
+        model class too
+        """
+        keys = tuple(keys)
+        key = ('record', keys)
+        loader = cls._row_loaders.get(key)
+        if loader is None:
+            record_class = make_record_class(keys, cls)
+            converters = []
+            for i, k in enumerate(keys):
+                p = cls.properties.get(k)
+                if p and not isinstance(p, ManyToMany) and p.property_type != 'compound':
+                    converters.append((i, p.make_value_from_datastore, p.convert))
+
+            def loader(row):
+                values = list(row)
+                for i, make_value, convert in converters:
+                    v = make_value(values[i])
+                    try:
+                        values[i] = convert(v)
+                    except TypeError:
+                        values[i] = v
+                return tuple.__new__(record_class, values)
+
+            loader = cls._row_loaders[key] = loader
+        return loader
+
+    @classmethod
+    def _make_row_loader(cls, keys):
+        #if the model class overrides the loading or saving methods, then
+        #just use the common way
+        for name in ('__init__', '_load', '_data_prepare', 'set_saved', 'to_dict', 'field_str'):
+            if getattr(cls, name).im_func is not getattr(Model, name).im_func:
+                def loader(row):
+                    return cls._load_values(zip(keys, row))
+                return loader
+
+        #the same as _data_prepare, later duplicated keys overwrite former ones
+        columns = {}
+        for i, k in enumerate(keys):
+            p = cls.properties.get(k)
+            if p and not isinstance(p, ManyToMany):
+                columns[str(k)] = (i, p.make_value_from_datastore)
+            else:
+                columns[str(k)] = (i, None)
+
+        #the same as _load, compounds fields will be processed in the end
+        setters = []
+        compounds = []
+        for prop in cls.properties.values():
+            column = columns.get(prop.fieldname)
+            if prop.property_type == 'compound':
+                if column:
+                    compounds.append((column[0], column[1], prop.__set__, None, None))
+                continue
+            t = type(prop)
+            fast = (t.__set__.im_func is Property.__set__.im_func and
+                t.validate.im_func is Property.validate.im_func and
+                t._validate.im_func is Property._validate.im_func and
+                not hasattr(prop, 'custom_validate') and
+                not prop.validators and not prop.required)
+            if column:
+                index, make_value = column
+            else:
+                index = make_value = None
+            if fast:
+                setters.append((index, make_value, prop.__set__, prop._attr_name(), prop.convert))
+            else:
+                setters.append((index, make_value, prop.__set__, None, None))
+        setters.extend(compounds)
+
+        #the same as set_saved
+        olds = []
+        manytomany = []
+        field_str = Model.field_str.im_func
+        #immutable values are kept as is, others are converted like field_str
+        strs = {type(None):None, int:None, long:None, float:None, bool:None, str:None,
+            unicode:lambda v: v.encode(__default_encoding__),
+            datetime.datetime:lambda v: v.strftime('%Y-%m-%d %H:%M:%S'),
+            datetime.date:lambda v: v.strftime('%Y-%m-%d'),
+            datetime.time:lambda v: v.strftime('%H:%M:%S'),
+            decimal.Decimal:str}
+        for k, prop in cls.properties.items():
+            if isinstance(prop, ManyToMany):
+                manytomany.append((k, prop._attr_name()))
+            elif type(prop).get_value_for_datastore.im_func is Property.get_value_for_datastore.im_func:
+                olds.append((k, prop._attr_name(), None))
+            else:
+                olds.append((k, None, prop.get_value_for_datastore))
+
+        def loader(row):
+            o = cls.__new__(cls)
+            d = o.__dict__
+            for index, make_value, setter, attr_name, convert in setters:
+                if index is None:
+                    value = Lazy
+                else:
+                    value = row[index]
+                    if make_value:
+                        value = make_value(value)
+                if not convert:
+                    setter(o, value)
+                elif value is Lazy:
+                    d[attr_name] = value
+                else:
+                    try:
+                        d[attr_name] = convert(value)
+                    except TypeError:
+                        #raise the same BadValueError as Property.validate()
+                        setter(o, value)
+
+            old_values = {}
+            for k, attr_name, getter in olds:
+                if getter:
+                    v = getter(o)
+                else:
+                    v = d.get(attr_name)
+                t = type(v)
+                if t in strs:
+                    c = strs[t]
+                    old_values[k] = c(v) if c else v
+                else:
+                    old_values[k] = field_str(o, v)
+            for k, attr_name in manytomany:
+                t = d.get(attr_name)
+                if t is not Lazy:
+                    old_values[k] = t
+            o._old_values = old_values
+            o._saved = True
+            d.pop('_changed_fields', None)
+            return o
+
+        return loader
+
     def refresh(self, fields=None, **kwargs):
         """
         Re get the instance of current id
@@ -272,10 +272,7 @@ def wraps(src):
             from uliweb import application
             if application:
                 env = application.get_view_env()
-                for k, v in env.iteritems():
-                    src.func_globals[k] = v
-                
-                src.func_globals['env'] = env
+                application.bind_view_env(src.func_globals, env)
             return des(*args, **kwargs)
         
         f.__name__ = src.__name__
@@ -27,6 +27,7 @@ DEFAULT_DATETIME_INPUT_FORMATS = (
     '%m/%d/%y %H:%M',        # '10/25/06 14:30'
     '%m/%d/%y',              # '10/25/06'
     '%H:%M:%S',              # '14:30:59'
+    '%H:%M:%S.%f',           # '14:30:59.5200'
     '%H:%M',                 # '14:30'
 )
 
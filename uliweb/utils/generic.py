@@ -1642,7 +1642,9 @@ class SimpleListView(object):
     def _cal_sum(self, record):
         if self.total_fields:
             for f in self.total_fields:
-                if isinstance(record, (tuple, list)):
+                if isinstance(record, orm.Record):
+                    v = record.get(f)
+                elif isinstance(record, (tuple, list)):
                     i = self.table_info['fields'].index(f)
                     v = record[i]
                 elif isinstance(record, dict):
@@ -1840,7 +1842,7 @@ class SimpleListView(object):
     
     def _get_record(self, record):
         r = record
-        if isinstance(record, RowProxy):
+        if isinstance(record, (RowProxy, orm.Record)):
             r = {}
             labels = self.table_info['fields_label']
             keys = self.table_info['fields']
@@ -1878,11 +1880,11 @@ class SimpleListView(object):
         for record in query:
             self._cal_sum(record)
             row = []
+            #records of Result.rows() keep the model to find properties
+            model = getattr(record, '_model', None) if isinstance(record, orm.Record) else None
             record = self._get_record(record)
             if isinstance(record, orm.Model):
                 model = record.__class__
-            else:
-                model = None
                 
             for i, x in enumerate(self.table_info['fields_list']):
                 field = self.get_field(x['name'], model)
@@ -2289,11 +2291,32 @@ class ListView(SimpleListView):
         fields_convert_map=None, id='listview_table', table_class_attr='table', table_width=True,
         total_fields=None, template_data=None, default_column_width=100, 
         meta='Table', render=None, total=0, manual=False,
-        record_render=None, post_record_render=None):
+        record_render=None, post_record_render=None, cursor=False,
+        total_mode='count', total_cache_timeout=300):
         """
         If pageno is None, then the ListView will not paginate 
+        
+        If cursor is True, then the ListView will use keyset pagination, the
+        next page is fetched by the ``cursor`` request parameter, which is the
+        ``next_cursor`` value of the previous page, so deep pages cost the
+        same as the first page. order_by should be unique, default is the
+        primary key.
+        
+        total_mode can be:
+            'count'     exact count of every query (default)
+            'estimate'  estimated rows number from table statistics if
+                        there is no condition, see Result.estimate_count
+            'cache'     exact count, but cached total_cache_timeout seconds
+            'none'      don't calculate total
         """
         
+        self.cursor = cursor
+        self.cursor_value = None
+        self.next_cursor = ''
+        self.total_mode = total_mode
+        self.total_cache_timeout = total_cache_timeout
+        self._cursor_query = None
+        self._last_record = None
         self.model = model and get_model(model)
         self.meta = meta
         self.condition = condition
@@ -2329,10 +2352,16 @@ class ListView(SimpleListView):
         if not self.id:
             self.id = self.model.tablename
 
+        if self.cursor:
+            from uliweb import request
+            self.cursor_value = request.values.get('cursor') or None
+
         #create table header
         self.table_info = self.get_table_info()
         
     def query(self):
+        if self.cursor and (self._query is None or isinstance(self._query, orm.Result)):
+            return self.query_cursor()
         if self._query is None or isinstance(self._query, (orm.Result, Select)): #query result
             offset = self.pageno*self.rows_per_page
             limit = self.rows_per_page
@@ -2351,7 +2380,96 @@ class ListView(SimpleListView):
             query = self.query_range(self.pageno, self.pagination)
         return query
     
+    def query_cursor(self):
+        """
+        Keyset pagination query, records after the key of cursor will be
+        returned, and the total is calculated without the cursor condition
+        """
+        limit = self.rows_per_page if self.pagination else None
+        query = self.query_model(self.model, self.condition, group_by=self.group_by,
+                                 having=self.having, limit=limit)
+        if not self.manual:
+            self.total = self.count(query)
+        query.after(self.decode_cursor(self.cursor_value), order_by=self.order_by)
+        self._cursor_query = query
+        return query
+    
+    def encode_cursor(self, key):
+        """
+        Values are kept in full precision, datetime and time with microseconds
+        and Decimal as string, so after() can compare them exactly
+        """
+        import base64
+        import datetime
+        import decimal
+        import json as _json
+        
+        def _default(v):
+            if isinstance(v, datetime.datetime):
+                return v.strftime('%Y-%m-%d %H:%M:%S.%f')
+            elif isinstance(v, datetime.date):
+                return v.strftime('%Y-%m-%d')
+            elif isinstance(v, datetime.time):
+                return v.strftime('%H:%M:%S.%f')
+            elif isinstance(v, decimal.Decimal):
+                return str(v)
+            return safe_unicode(v)
+        
+        if not isinstance(key, tuple):
+            key = [key]
+        return base64.urlsafe_b64encode(_json.dumps(list(key), default=_default))
+    
+    def decode_cursor(self, cursor):
+        import base64
+        import json as _json
+        
+        if not cursor:
+            return None
+        try:
+            return _json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError):
+            raise UliwebError("Invalid cursor %r" % cursor)
+    
+    def count(self, query):
+        if self.manual:
+            return self.total
+        if self.total_mode == 'none':
+            return 0
+        if isinstance(query, orm.Result):
+            if self.total_mode == 'estimate':
+                return query.estimate_count()
+            if self.total_mode == 'cache':
+                import hashlib
+                from uliweb.orm import rawsql
+                
+                cache = functions.get_cache()
+                key = '_lv_total_:' + hashlib.md5(rawsql(query.get_query())).hexdigest()
+                total = cache.get(key, None)
+                if total is None:
+                    total = query.count()
+                    cache.set(key, total, expire=self.total_cache_timeout)
+                return total
+        return super(ListView, self).count(query)
+    
+    def objects(self, json_result=False):
+        self._last_record = None
+        for r in super(ListView, self).objects(json_result):
+            yield r
+        if self._cursor_query is not None:
+            if self._last_record is not None and self.rows_num == self.rows_per_page:
+                key = self._cursor_query.get_keyset(self._last_record)
+                self.next_cursor = self.encode_cursor(key)
+            else:
+                self.next_cursor = ''
+    
+    def render(self, json_result=False):
+        result = super(ListView, self).render(json_result)
+        if self.cursor:
+            result['next_cursor'] = self.next_cursor
+        return result
+    
     def object(self, record, json_result=False):
+        self._last_record = record
         if self.record_render:
             r = self.record_render(record)
         else:
@@ -2859,4 +2977,4 @@ class QueryView(object):
                     condition = and_(_cond, condition)
 
         log.debug("condition=%s", condition)
-        return condition
\ No newline at end of file
+        return condition
\ No newline at end of file